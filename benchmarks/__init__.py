@@ -0,0 +1,8 @@
+"""Benchmarks for Travis Encrypt.
+
+Each benchmark is a module that can be run from the repository root,
+for example: python -m benchmarks.bench_encrypt, and python -m benchmarks
+runs all of them with small inputs. The API and CLI benchmarks run against
+benchmarks.stub_server, a local stand-in for the Travis CI API, and never
+touch the network.
+"""
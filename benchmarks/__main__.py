@@ -0,0 +1,16 @@
+"""Run every benchmark with small inputs as a quick offline regression check.
+
+Example: python -m benchmarks
+"""
+from benchmarks import bench_api, bench_cli, bench_encrypt, bench_yaml
+
+SUITE = [
+    (bench_api, ["--batch-sizes", "1", "10", "100"]),
+    (bench_encrypt, ["--count", "200", "--key-size", "2048", "--repeat", "1"]),
+    (bench_yaml, ["--jobs", "500", "--repeat", "1"]),
+    (bench_cli, ["--invocations", "5", "--batch-sizes", "10", "100", "1000"]),
+]
+
+for module, argv in SUITE:
+    print("\n== {} {}".format(module.__name__, " ".join(argv)))
+    module.main(argv)
@@ -0,0 +1,133 @@
+"""Benchmark public key retrieval and encryption against a local stub API.
+
+retrieve_public_key is measured against benchmarks.stub_server with an
+empty cache, a fresh cache and a stale cache revalidated with 304 Not
+Modified, for the legacy and the v3 endpoints, followed by encrypt_key.
+Every measurement is repeated at each batch size.
+
+Example: python -m benchmarks.bench_api --batch-sizes 1 10 100 --latency 0.02
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import generate_public_key, print_header, print_row
+from benchmarks.stub_server import StubTravisAPI
+from travis.cache import KeyCache
+from travis.encrypt import encrypt_key, endpoint_url, retrieve_public_key
+from travis.scheduler import configure_scheduler
+from travis.session import configure_session
+
+
+def retrieve_batch(user_repos, token, cache, concurrency, refresh=False):
+    """Retrieve every key from a thread pool and return per request latencies."""
+
+    def retrieve(user_repo):
+        start = time.perf_counter()
+        retrieve_public_key(
+            user_repo,
+            endpoint_url(user_repo, token=token),
+            token=token,
+            cache=cache,
+            refresh=refresh,
+        )
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(retrieve, user_repos))
+
+
+def measure(label, function, count):
+    """Run the function, which returns latencies, and print its row."""
+    start = time.perf_counter()
+    latencies = function()
+    print_row(label, count, latencies, time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[1, 10, 100], help="keys per run"
+    )
+    parser.add_argument("--concurrency", type=int, default=10, help="parallel requests")
+    parser.add_argument("--latency", type=float, default=0.01, help="stub API delay")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra delay")
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="fraction of 500s"
+    )
+    parser.add_argument(
+        "--rate-limit-rate", type=float, default=0.0, help="fraction of 429s"
+    )
+    arguments = parser.parse_args(argv)
+
+    configure_session(pool_size=arguments.concurrency, retries=5, backoff_factor=0)
+    configure_scheduler(rate=0, concurrency=arguments.concurrency)
+
+    stub = StubTravisAPI(
+        latency=arguments.latency,
+        jitter=arguments.jitter,
+        error_rate=arguments.error_rate,
+        rate_limit_rate=arguments.rate_limit_rate,
+    )
+    directory = tempfile.mkdtemp(prefix="travis-encrypt-bench-")
+    previous_url = os.environ.get("TRAVIS_ENCRYPT_API_URL")
+    os.environ["TRAVIS_ENCRYPT_API_URL"] = stub.url
+    try:
+        with stub:
+            print(
+                "stub API at {}, {:.0f} ms latency".format(
+                    stub.url, arguments.latency * 1000
+                )
+            )
+            # generate the shared key up front so it is not part of any latency
+            stub.key(None)
+            print_header()
+            for size in arguments.batch_sizes:
+                user_repos = ["bench/repo-{}".format(i) for i in range(size)]
+                for api, token in (("legacy", None), ("v3", "token")):
+                    cache = KeyCache(os.path.join(directory, "{}-{}".format(api, size)))
+                    for label in ("cold", "fresh"):
+                        measure(
+                            "retrieve {} {}".format(api, label),
+                            lambda: retrieve_batch(
+                                user_repos, token, cache, arguments.concurrency
+                            ),
+                            size,
+                        )
+                    measure(
+                        "retrieve {} revalidate".format(api),
+                        lambda: retrieve_batch(
+                            user_repos, token, cache, arguments.concurrency, True
+                        ),
+                        size,
+                    )
+
+                key = generate_public_key()
+                measure(
+                    "encrypt_key",
+                    lambda: [
+                        encrypt_latency(key, "value-{}".format(i)) for i in range(size)
+                    ],
+                    size,
+                )
+            print("{} requests served".format(stub.requests))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+        if previous_url is None:
+            os.environ.pop("TRAVIS_ENCRYPT_API_URL", None)
+        else:
+            os.environ["TRAVIS_ENCRYPT_API_URL"] = previous_url
+
+
+def encrypt_latency(key, value):
+    """Return the seconds taken to encrypt the value with encrypt_key."""
+    start = time.perf_counter()
+    encrypt_key(key, value.encode())
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Benchmark the travis-encrypt command line end to end against a local stub API.
+
+Every measurement runs the CLI in a new interpreter, as a build would, with
+TRAVIS_ENCRYPT_API_URL pointing at benchmarks.stub_server. Single password
+invocations are timed with a cold and with a warm key cache, and the
+--ndjson mode is timed at each batch size, reporting its throughput only.
+
+Example: python -m benchmarks.bench_cli --invocations 20 --batch-sizes 100 1000
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import print_header, print_row
+from benchmarks.stub_server import StubTravisAPI
+
+
+def run_cli(arguments, environment, stdin=None):
+    """Run the CLI in a new interpreter and return the seconds it took."""
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "travis"] + arguments,
+        input=stdin,
+        env=environment,
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--invocations", type=int, default=10, help="single password runs"
+    )
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[10, 100, 1000], help="records"
+    )
+    parser.add_argument("--repositories", type=int, default=10, help="repos per batch")
+    parser.add_argument("--concurrency", type=int, default=10, help="--concurrency")
+    parser.add_argument("--latency", type=float, default=0.01, help="stub API delay")
+    arguments = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix="travis-encrypt-bench-")
+    try:
+        with StubTravisAPI(latency=arguments.latency) as stub:
+            stub.key(None)
+            environment = dict(
+                os.environ,
+                TRAVIS_ENCRYPT_API_URL=stub.url,
+                TRAVIS_ENCRYPT_CACHE_DIR=os.path.join(directory, "cache"),
+            )
+            print("stub API at {}".format(stub.url))
+            print_header()
+
+            for label in ("cold cache", "warm cache"):
+                latencies = []
+                for i in range(arguments.invocations):
+                    if label == "cold cache":
+                        shutil.rmtree(environment["TRAVIS_ENCRYPT_CACHE_DIR"], True)
+                    latencies.append(
+                        run_cli(
+                            ["bench", "repo", "--password", "value-{}".format(i)],
+                            environment,
+                        )
+                    )
+                print_row(
+                    "cli password {}".format(label),
+                    arguments.invocations,
+                    latencies,
+                    sum(latencies),
+                )
+
+            for size in arguments.batch_sizes:
+                records = "".join(
+                    json.dumps(
+                        {
+                            "repo": "bench/repo-{}".format(i % arguments.repositories),
+                            "name": "VARIABLE_{}".format(i),
+                            "value": "value-{}".format(i),
+                        }
+                    )
+                    + "\n"
+                    for i in range(size)
+                ).encode("utf-8")
+                elapsed = run_cli(
+                    ["--ndjson", "--concurrency", str(arguments.concurrency)],
+                    environment,
+                    records,
+                )
+                print_row("cli --ndjson", size, None, elapsed)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
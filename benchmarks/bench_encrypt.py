@@ -0,0 +1,61 @@
+"""Benchmark the encryption of a batch of variables with encrypt_many.
+
+The batch is encrypted with an increasing number of worker processes,
+from a single job up to one job per core, to show how encrypt_many scales.
+
+Example: python -m benchmarks.bench_encrypt --count 2000 --key-size 4096
+"""
+import argparse
+import multiprocessing
+
+from benchmarks.common import generate_public_key, timed
+from travis.encrypt import encrypt_many
+
+
+def job_counts(maximum):
+    """Return 1, 2, 4, ... up to and including maximum."""
+    counts = []
+    jobs = 1
+    while jobs < maximum:
+        counts.append(jobs)
+        jobs *= 2
+    counts.append(maximum)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=1000, help="variables per batch")
+    parser.add_argument("--key-size", type=int, default=4096, help="RSA key size")
+    parser.add_argument(
+        "--max-jobs",
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help="largest number of worker processes",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs per job count")
+    arguments = parser.parse_args(argv)
+
+    key = generate_public_key(arguments.key_size)
+    items = [
+        ("VARIABLE_{}".format(i), "value-{}".format(i)) for i in range(arguments.count)
+    ]
+
+    print("{} variables, {}-bit key".format(arguments.count, arguments.key_size))
+    print("{:>5} {:>10} {:>12} {:>8}".format("jobs", "seconds", "values/s", "speedup"))
+
+    baseline = None
+    for jobs in job_counts(arguments.max_jobs):
+        best = min(
+            timed(encrypt_many, key, items, jobs) for _ in range(arguments.repeat)
+        )
+        baseline = baseline or best
+        print(
+            "{:>5} {:>10.3f} {:>12.0f} {:>7.2f}x".format(
+                jobs, best, arguments.count / best, baseline / best
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Benchmark ordered_load and ordered_dump with both PyYAML backends.
+
+A multi-stage .travis.yml is generated with the given number of jobs and
+loaded and dumped with the libyaml C backend and the pure Python backend.
+
+Example: python -m benchmarks.bench_yaml --jobs 2000
+"""
+import argparse
+from collections import OrderedDict
+import base64
+import os
+import time
+
+import yaml
+
+from travis import orderer
+
+
+def generate_configuration(jobs):
+    """Generate a .travis.yml with stages, a job matrix and encrypted variables."""
+    stages = ["lint", "test", "build", "deploy"]
+    return OrderedDict(
+        [
+            ("language", "python"),
+            ("dist", "xenial"),
+            ("stages", stages),
+            (
+                "env",
+                OrderedDict(
+                    [
+                        (
+                            "global",
+                            [
+                                OrderedDict(
+                                    [
+                                        (
+                                            "secure",
+                                            base64.b64encode(os.urandom(512)).decode(),
+                                        )
+                                    ]
+                                )
+                                for _ in range(jobs // 10 or 1)
+                            ],
+                        )
+                    ]
+                ),
+            ),
+            (
+                "jobs",
+                OrderedDict(
+                    [
+                        (
+                            "include",
+                            [
+                                OrderedDict(
+                                    [
+                                        ("stage", stages[i % len(stages)]),
+                                        ("name", "job {}".format(i)),
+                                        ("python", "3.{}".format(5 + i % 4)),
+                                        ("env", ["SHARD={}".format(i), "CI=true"]),
+                                        ("install", ["pip install -e .[test]"]),
+                                        ("script", ["pytest -k shard{}".format(i)]),
+                                    ]
+                                )
+                                for i in range(jobs)
+                            ],
+                        )
+                    ]
+                ),
+            ),
+        ]
+    )
+
+
+def best_of(repeat, function, *args, **kwargs):
+    """Return the fastest of repeat runs of the function in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=1000, help="jobs in the matrix")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement")
+    arguments = parser.parse_args(argv)
+
+    text = orderer.ordered_dump(
+        generate_configuration(arguments.jobs), default_flow_style=False
+    )
+    print("{} jobs, {:.1f} KiB of YAML".format(arguments.jobs, len(text) / 1024.0))
+
+    backends = [("python", yaml.SafeLoader, yaml.SafeDumper)]
+    if orderer.LIBYAML:
+        backends.append(("libyaml", yaml.CSafeLoader, yaml.CSafeDumper))
+
+    outputs = []
+    print("{:>8} {:>10} {:>10}".format("backend", "load (s)", "dump (s)"))
+    for name, Loader, Dumper in backends:
+        config = orderer.ordered_load(text, Loader=Loader)
+        load = best_of(arguments.repeat, orderer.ordered_load, text, Loader=Loader)
+        dump = best_of(
+            arguments.repeat,
+            orderer.ordered_dump,
+            config,
+            Dumper=Dumper,
+            default_flow_style=False,
+        )
+        outputs.append(
+            orderer.ordered_dump(config, Dumper=Dumper, default_flow_style=False)
+        )
+        print("{:>8} {:>10.3f} {:>10.3f}".format(name, load, dump))
+
+    print("identical output: {}".format(all(output == text for output in outputs)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Helpers shared by the benchmarks."""
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+
+def generate_public_key(key_size=2048):
+    """Generate a PEM encoded public key like the one served by the Travis API."""
+    private_key = rsa.generate_private_key(
+        public_exponent=65537, key_size=key_size, backend=default_backend()
+    )
+    return (
+        private_key.public_key()
+        .public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+        .decode("ascii")
+    )
+
+
+def percentile(values, percent):
+    """Return the nearest-rank percentile of the values."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+def timed(function, *args, **kwargs):
+    """Return the seconds taken by calling the function."""
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def print_row(label, count, latencies, total):
+    """Print the throughput and latency percentiles of a measurement.
+
+    The percentiles are left blank when no per item latencies were recorded.
+    """
+    if latencies:
+        columns = [
+            "{:>8.2f}".format(percentile(latencies, percent) * 1000)
+            for percent in (50, 95, 99)
+        ]
+    else:
+        columns = ["{:>8}".format("-")] * 3
+    print(
+        "{:<28} {:>6} {:>9.3f} {:>10.1f} {}".format(
+            label,
+            count,
+            total,
+            count / total if total else float("inf"),
+            " ".join(columns),
+        )
+    )
+
+
+def print_header():
+    """Print the column names of print_row."""
+    print(
+        "{:<28} {:>6} {:>9} {:>10} {:>8} {:>8} {:>8}".format(
+            "benchmark", "count", "seconds", "per sec", "p50 ms", "p95 ms", "p99 ms"
+        )
+    )
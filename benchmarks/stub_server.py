@@ -0,0 +1,241 @@
+"""A local stand-in for the Travis CI API serving generated public keys.
+
+Both the legacy /repos/<owner>/<repo>/key endpoint and the v3
+/v3/repo/<owner>%2f<repo>/key_pair/generated endpoint are served, with
+ETag revalidation, along with the paginated v3 /v3/owner/<owner>/repos
+listing of the repositories given to the stub. Latency and 500 and 429
+errors can be injected. Point Travis Encrypt at it with the
+TRAVIS_ENCRYPT_API_URL environment variable.
+
+Example: python -m benchmarks.stub_server --port 8000 --latency 0.05
+"""
+
+import argparse
+import hashlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import random
+import re
+from socketserver import ThreadingMixIn
+import threading
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from benchmarks.common import generate_public_key
+
+LEGACY_PATH = re.compile(r"^/repos/([^/]+)/([^/]+)/key$")
+V3_PATH = re.compile(r"^/v3/repo/([^/]+)/key_pair/generated$")
+OWNER_PATH = re.compile(r"^/v3/owner/([^/]+)/repos$")
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubTravisAPI(object):
+    """Serve public keys on 127.0.0.1 from a background thread.
+
+    Parameters
+    ----------
+    port: int
+        the port to listen on, 0 picks a free one
+    latency: float
+        seconds every response is delayed by
+    jitter: float
+        up to this many seconds are randomly added to the latency
+    error_rate: float
+        the fraction of requests answered with 500 Internal Server Error
+    rate_limit_rate: float
+        the fraction of requests answered with 429 Too Many Requests
+    repositories: iterable
+        the only 'owner/repo' names served and listed by the owner endpoint,
+        every name is served and none is listed when None
+    distinct_keys: bool
+        generate a key per repository instead of sharing one key
+    key_size: int
+        the size of the generated RSA keys
+    """
+
+    def __init__(
+        self,
+        port=0,
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        rate_limit_rate=0.0,
+        repositories=None,
+        distinct_keys=False,
+        key_size=2048,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.repositories = None if repositories is None else set(repositories)
+        self.distinct_keys = distinct_keys
+        self.key_size = key_size
+        self.keys = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.random = random.Random(0)
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        """The base URL to export as TRAVIS_ENCRYPT_API_URL."""
+        return "http://127.0.0.1:{}".format(self.server.server_address[1])
+
+    def key(self, user_repo):
+        """Return the public key served for the repository, generating it once."""
+        name = user_repo if self.distinct_keys else None
+        with self.lock:
+            if name not in self.keys:
+                self.keys[name] = generate_public_key(self.key_size)
+            return self.keys[name]
+
+    def start(self):
+        """Serve requests from a daemon thread."""
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket."""
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def respond(self, path, headers):
+        """Return the status, headers and JSON body answering a GET request."""
+        with self.lock:
+            self.requests += 1
+            draw = self.random.random()
+            delay = self.latency + self.random.random() * self.jitter
+        time.sleep(delay)
+
+        if draw < self.error_rate:
+            return 500, {}, {"error_message": "injected error"}
+        if draw < self.error_rate + self.rate_limit_rate:
+            return 429, {"Retry-After": "0"}, {"error_message": "rate limited"}
+
+        url = urlsplit(path)
+        owner = OWNER_PATH.match(url.path)
+        if owner:
+            if not (headers.get("Authorization") or "").startswith("token "):
+                return 403, {}, {"error_message": "login required"}
+            return 200, {}, self.owner_page(owner.group(1), parse_qs(url.query))
+
+        legacy = LEGACY_PATH.match(path)
+        v3 = V3_PATH.match(path)
+        if legacy:
+            user_repo = "{}/{}".format(*legacy.groups())
+        elif v3:
+            user_repo = unquote(v3.group(1))
+            if not (headers.get("Authorization") or "").startswith("token "):
+                return 403, {}, {"error_message": "login required"}
+        else:
+            return 404, {}, {"error_message": "resource not found"}
+
+        if self.repositories is not None and user_repo not in self.repositories:
+            return 404, {}, {"file": "not found"}
+
+        key = self.key(user_repo)
+        etag = '"{}"'.format(hashlib.sha1(key.encode("ascii")).hexdigest())
+        if headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag}, None
+
+        if legacy:
+            body = {"key": key.replace(" PUBLIC ", " RSA PUBLIC "), "fingerprint": ""}
+        else:
+            body = {"public_key": key, "fingerprint": ""}
+        return 200, {"ETag": etag}, body
+
+    def owner_page(self, owner, query):
+        """Return one page of the repositories of the owner, sorted by name."""
+        limit = int(query.get("limit", ["25"])[0])
+        offset = int(query.get("offset", ["0"])[0])
+        slugs = sorted(
+            user_repo
+            for user_repo in self.repositories or ()
+            if user_repo.split("/")[0] == owner
+        )
+        page = slugs[offset : offset + limit]
+        return {
+            "@type": "repositories",
+            "@pagination": {
+                "limit": limit,
+                "offset": offset,
+                "count": len(slugs),
+                "is_last": offset + limit >= len(slugs),
+            },
+            "repositories": [
+                {"slug": slug, "name": slug.split("/")[1]} for slug in page
+            ],
+        }
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                status, headers, body = stub.respond(self.path, self.headers)
+                payload = b"" if body is None else json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8000, help="port to listen on")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds of delay")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra delay")
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="fraction of 500s"
+    )
+    parser.add_argument(
+        "--rate-limit-rate", type=float, default=0.0, help="fraction of 429s"
+    )
+    parser.add_argument(
+        "--distinct-keys", action="store_true", help="one key per repository"
+    )
+    arguments = parser.parse_args(argv)
+
+    stub = StubTravisAPI(
+        port=arguments.port,
+        latency=arguments.latency,
+        jitter=arguments.jitter,
+        error_rate=arguments.error_rate,
+        rate_limit_rate=arguments.rate_limit_rate,
+        distinct_keys=arguments.distinct_keys,
+    )
+    print("export TRAVIS_ENCRYPT_API_URL={}".format(stub.url))
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,7 @@ setup(
         "requests>=2.21",
         "pyperclip==1.7",
         "python-dotenv>=0.10",
+        'futures>=3.2; python_version < "3"',
     ],
     entry_points="""
           [console_scripts]
@@ -0,0 +1,53 @@
+"""Shared fixtures for the Travis Encrypt test suite.
+
+Fixtures:
+key_cache_directory -- isolate the on-disk public key cache for every test
+rsa_private_key -- a locally generated RSA private key
+public_key -- the PEM encoded public key of rsa_private_key
+
+Modules relying on newer interpreters than the oldest supported one are
+left out of collection on older ones.
+"""
+import sys
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+import pytest
+
+collect_ignore = []
+if sys.version_info < (3, 7):
+    # async syntax and asyncio.run
+    collect_ignore.append("test_aio.py")
+if sys.version_info < (3,):
+    # benchmarks.stub_server is built on http.server
+    collect_ignore.append("test_stub_api.py")
+
+
+@pytest.fixture(autouse=True)
+def key_cache_directory(tmpdir, monkeypatch):
+    """Point the public key cache at a temporary directory."""
+    directory = str(tmpdir.join("key-cache"))
+    monkeypatch.setenv("TRAVIS_ENCRYPT_CACHE_DIR", directory)
+    return directory
+
+
+@pytest.fixture(scope="session")
+def rsa_private_key():
+    """Generate an RSA key pair so that tests do not depend on the Travis API."""
+    return rsa.generate_private_key(
+        public_exponent=65537, key_size=2048, backend=default_backend()
+    )
+
+
+@pytest.fixture(scope="session")
+def public_key(rsa_private_key):
+    """PEM encoded public key in the format returned by retrieve_public_key."""
+    return (
+        rsa_private_key.public_key()
+        .public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+        .decode("ascii")
+    )
@@ -0,0 +1,96 @@
+"""Test the aio module of Travis Encrypt.
+
+Test functions:
+test_retrieve_public_keys_async -- test bounded concurrent key retrieval
+test_retrieve_public_keys_async_cancelled -- test cancelling without blocking the loop
+test_encrypt_async -- test encrypting one password and a batch from an event loop
+"""
+import asyncio
+import base64
+import threading
+import time
+
+from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
+import mock
+
+from travis.aio import (
+    encrypt_key_async,
+    encrypt_many_async,
+    retrieve_public_keys_async,
+)
+from travis.encrypt import InvalidCredentialsError
+
+
+def test_retrieve_public_keys_async(public_key):
+    """Test that no more than concurrency retrievals run at once and errors are kept."""
+    lock = threading.Lock()
+    in_flight = {"current": 0, "peak": 0}
+
+    def retrieve(user_repo, url, **kwargs):
+        with lock:
+            in_flight["current"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["current"])
+        time.sleep(0.01)
+        with lock:
+            in_flight["current"] -= 1
+        if user_repo.endswith("missing"):
+            raise InvalidCredentialsError(user_repo)
+        return public_key
+
+    user_repos = ["mandeep/repo-{}".format(i) for i in range(20)] + ["mandeep/missing"]
+    with mock.patch("travis.aio.retrieve_public_key", side_effect=retrieve):
+        results = asyncio.run(retrieve_public_keys_async(user_repos, concurrency=4))
+
+    assert [result.user_repo for result in results] == user_repos
+    assert all(result.key == public_key for result in results[:-1])
+    assert isinstance(results[-1].error, InvalidCredentialsError)
+    assert in_flight["peak"] <= 4
+
+
+def test_retrieve_public_keys_async_cancelled(public_key):
+    """Test that a cancelled retrieval returns without waiting for its requests."""
+    started, release = threading.Event(), threading.Event()
+
+    def retrieve(user_repo, url, **kwargs):
+        started.set()
+        release.wait(5)
+        return public_key
+
+    async def cancel():
+        task = asyncio.ensure_future(retrieve_public_keys_async(["mandeep/slow"]))
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        start = time.time()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return time.time() - start
+
+    with mock.patch("travis.aio.retrieve_public_key", side_effect=retrieve):
+        try:
+            elapsed = asyncio.run(cancel())
+        finally:
+            release.set()
+
+    assert elapsed < 1
+
+
+def test_encrypt_async(rsa_private_key, public_key):
+    """Test that passwords encrypted from the event loop decrypt with the private key."""
+
+    async def encrypt():
+        single = await encrypt_key_async(public_key, b"ONE")
+        batch = await encrypt_many_async(
+            public_key, [("TWO", "TWO"), ("THREE", "THREE")]
+        )
+        return single, batch
+
+    single, batch = asyncio.run(encrypt())
+
+    def decrypt(value):
+        return rsa_private_key.decrypt(base64.b64decode(value), PKCS1v15())
+
+    assert decrypt(single) == b"ONE"
+    assert [decrypt(result.encrypted) for result in batch] == [b"TWO", b"THREE"]
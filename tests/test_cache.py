@@ -0,0 +1,134 @@
+"""Test the cache module of Travis Encrypt.
+
+Test functions:
+test_cache_round_trip -- test storing and retrieving a public key
+test_cache_expiry -- test that stale entries are not returned
+test_cache_invalidate -- test removing a single entry and every entry
+test_cache_unwritable -- test that an unwritable cache directory is not an error
+test_retrieve_public_key_uses_cache -- test that a cached key skips the network
+test_retrieve_public_key_refresh -- test that refresh bypasses a fresh cached key
+test_retrieve_public_key_not_modified -- test revalidating a stale key with a 304 response
+test_retrieve_public_key_rotated -- test that a changed key replaces the cached key
+"""
+import mock
+
+from travis.cache import KeyCache
+from travis.encrypt import retrieve_public_key
+
+URL = "https://api.travis-ci.org/repos/mandeep/Travis-Encrypt/key"
+
+
+def api_session(status_code=200, payload=None, headers=None):
+    """Build a mock session whose get method returns a Travis API response."""
+    response = mock.Mock(status_code=status_code, headers=headers or {})
+    response.json.return_value = payload
+    session = mock.Mock()
+    session.get.return_value = response
+    return session
+
+
+def test_cache_round_trip(tmpdir, public_key):
+    """Test that a stored key is returned for the same url only."""
+    cache = KeyCache(str(tmpdir))
+    assert cache.get(URL) is None
+
+    cache.set(URL, public_key)
+    assert cache.get(URL) == public_key
+    assert cache.get(URL.replace(".org", ".com")) is None
+
+
+def test_cache_expiry(tmpdir, public_key):
+    """Test that an entry older than the ttl is stale but can still be looked up."""
+    cache = KeyCache(str(tmpdir), ttl=60)
+    cache.set(URL, public_key)
+
+    with mock.patch("travis.cache.time.time", return_value=10 ** 12):
+        assert cache.get(URL) is None
+        assert cache.lookup(URL)["key"] == public_key
+
+
+def test_cache_invalidate(tmpdir, public_key):
+    """Test that invalidate removes one entry or all of them."""
+    cache = KeyCache(str(tmpdir))
+    other_url = URL.replace(".org", ".com")
+    cache.set(URL, public_key)
+    cache.set(other_url, public_key)
+
+    cache.invalidate(URL)
+    assert cache.get(URL) is None
+    assert cache.get(other_url) == public_key
+
+    cache.invalidate()
+    assert cache.get(other_url) is None
+
+
+def test_cache_unwritable(tmpdir, public_key):
+    """Test that keys are still returned when the cache cannot be written."""
+    blocker = tmpdir.join("not-a-directory")
+    blocker.write("")
+    cache = KeyCache(str(blocker.join("cache")))
+    session = api_session(payload={"key": public_key})
+
+    key = retrieve_public_key("mandeep/Travis-Encrypt", cache=cache, session=session)
+
+    assert key == public_key
+    assert cache.get(URL) is None
+
+
+def test_retrieve_public_key_uses_cache(tmpdir, public_key):
+    """Test that only the first retrieval goes to the Travis API."""
+    cache = KeyCache(str(tmpdir))
+    session = api_session(payload={"key": public_key})
+
+    first = retrieve_public_key("mandeep/Travis-Encrypt", cache=cache, session=session)
+    second = retrieve_public_key("mandeep/Travis-Encrypt", cache=cache, session=session)
+
+    assert first == second == public_key
+    session.get.assert_called_once_with(URL, headers={})
+
+
+def test_retrieve_public_key_refresh(tmpdir, public_key):
+    """Test that refresh retrieves the key even when a fresh key is cached."""
+    cache = KeyCache(str(tmpdir))
+    cache.set(URL, "STALE KEY")
+    session = api_session(payload={"key": public_key})
+
+    key = retrieve_public_key(
+        "mandeep/Travis-Encrypt", cache=cache, refresh=True, session=session
+    )
+
+    assert key == public_key
+    assert session.get.called
+    assert cache.get(URL) == public_key
+
+
+def test_retrieve_public_key_not_modified(tmpdir, public_key):
+    """Test that a stale key is reused when the API responds with 304."""
+    cache = KeyCache(str(tmpdir), ttl=0)
+    cache.set(
+        URL, public_key, etag='"abc"', last_modified="Sat, 25 Apr 2020 00:00:00 GMT"
+    )
+    session = api_session(304)
+
+    key = retrieve_public_key("mandeep/Travis-Encrypt", cache=cache, session=session)
+
+    assert key == public_key
+    session.get.assert_called_once_with(
+        URL,
+        headers={
+            "If-None-Match": '"abc"',
+            "If-Modified-Since": "Sat, 25 Apr 2020 00:00:00 GMT",
+        },
+    )
+
+
+def test_retrieve_public_key_rotated(tmpdir, public_key):
+    """Test that a key changed since the last retrieval replaces the cached key."""
+    cache = KeyCache(str(tmpdir), ttl=0)
+    cache.set(URL, "OLD KEY", etag='"old"')
+    session = api_session(payload={"key": public_key}, headers={"ETag": '"new"'})
+
+    key = retrieve_public_key("mandeep/Travis-Encrypt", cache=cache, session=session)
+
+    assert key == public_key
+    assert cache.lookup(URL)["etag"] == '"new"'
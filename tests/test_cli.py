@@ -8,9 +8,33 @@ test_deploy_empty_file -- test embedding a deployment password in an empty file
 test_depoy_nonempty_file -- test embedding a deployment password in a nonempty file
 test_environment_variable_empty_file -- test embedding an environment variable in an empty file
 test_environment_variable_nonempty_file -- test embedding an environment variable in a nonempty file
+test_dotenv_file_partial_failure -- test that variables which cannot be encrypted are reported
+test_many_repositories_json -- test encrypting a password for many repositories
+test_many_repositories_usage -- test that --repo cannot be combined with positional arguments
+test_owner_usage -- test that --owner requires a token and --include requires --owner
+test_owner_listing_error -- test that rows listed before a discovery error are printed
+test_many_repositories_ignored_options -- test that file options are rejected with --repo
+test_missing_arguments_before_prompt -- test that arguments are validated before prompting
+test_socket_usage -- test that --socket cannot be combined with endpoint options
+test_many_repositories_password_too_long -- test reporting a password too long for a key
+test_deploy_preserves_formatting -- test that an existing secure value is patched in place
+test_dotenv_list_form_global -- test the --env-file option with a list form env.global
+test_dotenv_fingerprints -- test that unchanged variables keep their ciphertext
+test_dotenv_fingerprints_errors -- test the errors of the --fingerprints option
+test_ndjson_stream -- test encrypting NDJSON records from standard input
+test_daemon_socket -- test encrypting a password through an encryption daemon
+test_key_file_offline -- test encrypting with a local key file without the Travis API
+test_group_help -- test that --help lists the commands and encrypt is the default
+test_prefetch -- test caching the public keys of the repositories of a manifest
+test_rotate -- test planning and applying a rotation manifest
+test_timings_profile -- test the --timings and --profile options
+test_metrics_file -- test writing metrics of a run with --metrics-file
 """
 import base64
+import json
+import pstats
 import string
+import threading
 from collections import OrderedDict
 
 import pyperclip
@@ -19,7 +43,12 @@ import pytest
 from click.testing import CliRunner
 
 from travis.cli import cli
+from travis.daemon import EncryptionServer
+from travis.encrypt import InvalidCredentialsError, public_key_fingerprint
+from travis.metrics import increment, metrics_snapshot
 from travis.orderer import ordered_load, ordered_dump
+from travis.patcher import render_scalar
+from travis.scheduler import RateLimitedError
 
 
 def test_password_output():
@@ -370,3 +399,564 @@ def test_dotenv_mutually_exclusive():
             in result.output
         )
         assert result.exception
+
+
+def test_dotenv_file_partial_failure(public_key):
+    """Test the --env-file CLI option with a variable that is too long to encrypt.
+
+    The remaining variables are still printed and the failure is reported."""
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open("test.env", "w") as env_file:
+            env_file.write("SECRET_KEY=MY_PASSWORD\nHUGE_KEY={}\n".format("X" * 1024))
+
+        with mock.patch("travis.client.retrieve_public_key", return_value=public_key):
+            result = runner.invoke(
+                cli, ["mandeep", "Travis-Encrypt", "--env-file=test.env"]
+            )
+
+        assert result.exit_code == 1
+        assert "SECRET_KEY:\n  secure: " in result.output
+        assert "could not be encrypted: HUGE_KEY" in result.output
+
+
+def test_many_repositories_json(public_key):
+    """Test the --repo and --repos-file CLI options with JSON output.
+
+    A repository whose key cannot be retrieved is reported without hiding the others."""
+
+    def retrieve(user_repo, url, **kwargs):
+        if user_repo == "mandeep/missing":
+            raise InvalidCredentialsError("missing")
+        return public_key
+
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open("repos.txt", "w") as repos_file:
+            repos_file.write("# deploy targets\nmandeep/second\n\nmandeep/missing\n")
+
+        with mock.patch("travis.encrypt.retrieve_public_key", side_effect=retrieve):
+            result = runner.invoke(
+                cli,
+                [
+                    "--repo",
+                    "mandeep/Travis-Encrypt",
+                    "--repos-file",
+                    "repos.txt",
+                    "--output",
+                    "json",
+                    "--password",
+                    "SUPER_SECURE_PASSWORD",
+                ],
+            )
+
+    assert result.exit_code == 1
+    rows = json.loads(result.stdout)
+    assert list(rows) == ["mandeep/Travis-Encrypt", "mandeep/second", "mandeep/missing"]
+    assert base64.b64decode(rows["mandeep/Travis-Encrypt"]["secure"])
+    assert base64.b64decode(rows["mandeep/second"]["secure"])
+    assert rows["mandeep/missing"] == {"error": "missing"}
+
+
+def test_many_repositories_usage():
+    """Test that --repo cannot be combined with the USERNAME and REPOSITORY arguments."""
+    runner = CliRunner()
+    result = runner.invoke(
+        cli,
+        ["mandeep", "Travis-Encrypt", "--repo", "mandeep/other", "--password", "TEST"],
+    )
+    assert result.exit_code == 2
+    assert "cannot be used with USERNAME REPOSITORY" in result.output
+
+    result = runner.invoke(cli, ["--repo", "not-a-repository", "--password", "TEST"])
+    assert result.exit_code == 2
+    assert "is not in the format of 'username/repository'" in result.output
+
+
+def test_owner_usage():
+    """Test the usage errors of the --owner, --include and --exclude options."""
+    runner = CliRunner()
+    without_token = runner.invoke(cli, ["--owner", "mandeep", "--password", "TEST"])
+    without_owner = runner.invoke(
+        cli, ["--repo", "mandeep/other", "--include", "service-*", "--password", "TEST"]
+    )
+
+    assert without_token.exit_code == 2
+    assert "--owner requires --token" in without_token.output
+    assert without_owner.exit_code == 2
+    assert "--include and --exclude require --owner" in without_owner.output
+
+
+def test_owner_listing_error(public_key):
+    """Test that a failure on a later page keeps the rows of the earlier pages."""
+
+    def repositories(*args):
+        yield "mandeep/first"
+        raise RateLimitedError("rate limited")
+
+    runner = CliRunner()
+    with mock.patch(
+        "travis.cli.iter_owner_repositories", side_effect=repositories
+    ), mock.patch("travis.client.retrieve_public_key", return_value=public_key):
+        result = runner.invoke(
+            cli,
+            ["--owner", "mandeep", "--token", "abc", "--output", "json"]
+            + ["--password", "TEST"],
+        )
+
+    assert result.exit_code == 1
+    assert list(json.loads(result.stdout)) == ["mandeep/first"]
+    assert "could not all be listed: rate limited" in result.output
+
+
+def test_many_repositories_ignored_options():
+    """Test that options writing to a file are rejected with --repo."""
+    runner = CliRunner()
+    for option in ("--deploy", "--env", "--clipboard"):
+        result = runner.invoke(
+            cli, ["--repo", "mandeep/other", option, "--password", "TEST"]
+        )
+        assert result.exit_code == 2
+        assert "cannot be used with USERNAME REPOSITORY PATH" in result.output
+
+
+def test_missing_arguments_before_prompt():
+    """Test that missing arguments are reported without prompting for a password."""
+    runner = CliRunner()
+    result = runner.invoke(cli, ["mandeep"], "SUPER_SECURE_PASSWORD")
+
+    assert result.exit_code == 2
+    assert "Missing argument 'USERNAME' or 'REPOSITORY'." in result.output
+    assert "Password" not in result.output
+
+
+def test_socket_usage():
+    """Test that --private and --token are rejected with --socket."""
+    runner = CliRunner()
+    for option in (["--private"], ["--token", "TOKEN"]):
+        result = runner.invoke(
+            cli,
+            ["mandeep", "Travis-Encrypt", "--socket", "daemon.sock", "--password", "T"]
+            + option,
+        )
+        assert result.exit_code == 2
+        assert "--socket cannot be used with the --private and --token" in result.output
+
+
+def test_many_repositories_password_too_long(public_key):
+    """Test that a password too long for the keys is reported for every repository."""
+    runner = CliRunner()
+    with mock.patch("travis.encrypt.retrieve_public_key", return_value=public_key):
+        result = runner.invoke(
+            cli,
+            ["--repo", "mandeep/first", "--output", "json", "--password", "x" * 512],
+        )
+
+    assert result.exit_code == 1
+    rows = json.loads(result.stdout)
+    assert list(rows) == ["mandeep/first"]
+    assert "could not be encrypted" in rows["mandeep/first"]["error"]
+
+
+def test_deploy_preserves_formatting(public_key):
+    """Test the --deploy flag with a YAML file containing comments.
+
+    The existing secure value is replaced without rewriting the rest of the file."""
+    initial_config = (
+        "# Deploy to PyPI\n"
+        "deploy:\n"
+        "  provider: pypi  # official index\n"
+        "  password:\n"
+        "    secure: SUPER_INSECURE_PASSWORD\n"
+    )
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open("file.yml", "w") as file:
+            file.write(initial_config)
+
+        with mock.patch("travis.client.retrieve_public_key", return_value=public_key):
+            result = runner.invoke(
+                cli,
+                ["--deploy", "mandeep", "Travis-Encrypt", "file.yml"],
+                "SUPER_SECURE_PASSWORD",
+            )
+        assert not result.exception
+
+        with open("file.yml") as file:
+            config_text = file.read()
+
+    encrypted_password = ordered_load(config_text)["deploy"]["password"]["secure"]
+    assert base64.b64decode(encrypted_password)
+    assert config_text == initial_config.replace(
+        "SUPER_INSECURE_PASSWORD", render_scalar(encrypted_password)
+    )
+
+
+def test_dotenv_list_form_global(public_key):
+    """Test the --env-file CLI option with a YAML file whose env.global is a list.
+
+    The existing API_KEY entry is updated and the new variable is appended."""
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open("test.env", "w") as env_file:
+            env_file.write("API_KEY=MY_PASSWORD\nNEW_KEY=MY_OTHER_PASSWORD\n")
+
+        initial_data = OrderedDict(
+            [
+                ("language", "python"),
+                (
+                    "env",
+                    {
+                        "global": [
+                            "DEBUG=1",
+                            {"API_KEY": {"secure": "SUPER_INSECURE_KEY"}},
+                        ]
+                    },
+                ),
+            ]
+        )
+        with open("file.yml", "w") as file:
+            ordered_dump(initial_data, file)
+
+        with mock.patch("travis.client.retrieve_public_key", return_value=public_key):
+            result = runner.invoke(
+                cli, ["mandeep", "Travis-Encrypt", "file.yml", "--env-file=test.env"]
+            )
+        assert not result.exception
+
+        with open("file.yml") as file:
+            config = ordered_load(file)
+
+    env_global = config["env"]["global"]
+    assert env_global[0] == "DEBUG=1"
+    assert list(env_global[1]) == ["API_KEY"]
+    assert base64.b64decode(env_global[1]["API_KEY"]["secure"])
+    assert list(env_global[2]) == ["NEW_KEY"]
+    assert base64.b64decode(env_global[2]["NEW_KEY"]["secure"])
+
+
+def test_dotenv_fingerprints(public_key):
+    """Test the --env-file CLI option with the --fingerprints option.
+
+    Running twice only encrypts the variable whose value changed."""
+    runner = CliRunner()
+    arguments = [
+        "mandeep",
+        "Travis-Encrypt",
+        "file.yml",
+        "--env-file=test.env",
+        "--fingerprints=fingerprints.json",
+    ]
+    with runner.isolated_filesystem():
+        with open("file.yml", "w") as file:
+            ordered_dump({"language": "python"}, file)
+
+        with mock.patch("travis.client.retrieve_public_key", return_value=public_key):
+            with open("test.env", "w") as env_file:
+                env_file.write("API_KEY=MY_PASSWORD\nTOKEN=MY_TOKEN\n")
+            first = runner.invoke(cli, arguments)
+            with open("file.yml") as file:
+                first_config = ordered_load(file)
+
+            with open("test.env", "w") as env_file:
+                env_file.write("API_KEY=MY_PASSWORD\nTOKEN=MY_NEW_TOKEN\n")
+            second = runner.invoke(cli, arguments)
+            with open("file.yml") as file:
+                second_config = ordered_load(file)
+
+    assert not first.exception
+    assert not second.exception
+    assert "Skipped 1 unchanged variables: API_KEY" in second.output
+    first_global = first_config["env"]["global"]
+    second_global = second_config["env"]["global"]
+    assert second_global["API_KEY"] == first_global["API_KEY"]
+    assert second_global["TOKEN"] != first_global["TOKEN"]
+
+
+def test_dotenv_fingerprints_errors(public_key):
+    """Test that --fingerprints needs a PATH and a corrupt sidecar is reported."""
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open("file.yml", "w") as file:
+            ordered_dump({"language": "python"}, file)
+        with open("test.env", "w") as env_file:
+            env_file.write("API_KEY=MY_PASSWORD\n")
+        with open("fingerprints.json", "w") as store_file:
+            store_file.write("{not json")
+
+        with mock.patch("travis.client.retrieve_public_key", return_value=public_key):
+            without_path = runner.invoke(
+                cli,
+                ["mandeep", "Travis-Encrypt", "--env-file=test.env"]
+                + ["--fingerprints=fingerprints.json"],
+            )
+            corrupt = runner.invoke(
+                cli,
+                ["mandeep", "Travis-Encrypt", "file.yml", "--env-file=test.env"]
+                + ["--fingerprints=fingerprints.json"],
+            )
+
+    assert without_path.exit_code == 2
+    assert "--fingerprints requires the --env-file flag" in without_path.output
+    assert corrupt.exit_code == 1
+    assert "Invalid fingerprint store fingerprints.json" in corrupt.output
+
+
+def test_ndjson_stream(public_key):
+    """Test the --ndjson CLI option.
+
+    No password is prompted for and a record with an unknown repository is
+    reported in band and makes the command fail once the input is exhausted."""
+    runner = CliRunner()
+    lines = [
+        {"repo": "mandeep/Travis-Encrypt", "name": "API_KEY", "value": "MY_PASSWORD"},
+        {"repo": "mandeep/missing", "name": "TOKEN", "value": "MY_TOKEN"},
+        {"repo": "mandeep/Travis-Encrypt", "name": "TOKEN", "value": "MY_TOKEN"},
+    ]
+
+    def retrieve(user_repo, *args, **kwargs):
+        if user_repo == "mandeep/missing":
+            raise InvalidCredentialsError("Please enter a valid user/repository name.")
+        return public_key
+
+    with mock.patch("travis.client.retrieve_public_key", side_effect=retrieve) as patched:
+        result = runner.invoke(
+            cli,
+            ["--ndjson", "--concurrency=1"],
+            input="".join(json.dumps(line) + "\n" for line in lines),
+        )
+
+    records = [json.loads(line) for line in result.stdout.splitlines()]
+    assert result.exit_code == 1
+    assert [(record["repo"], record["name"]) for record in records] == [
+        ("mandeep/Travis-Encrypt", "API_KEY"),
+        ("mandeep/missing", "TOKEN"),
+        ("mandeep/Travis-Encrypt", "TOKEN"),
+    ]
+    assert base64.b64decode(records[0]["secure"])
+    assert "error" in records[1]
+    assert patched.call_count == 2
+
+
+def test_daemon_socket(tmpdir, public_key):
+    """Test the --socket CLI option.
+
+    The password is encrypted by the daemon without retrieving a key."""
+    runner = CliRunner()
+    path = str(tmpdir.join("daemon.sock"))
+    server = EncryptionServer(path, lambda user_repo: public_key)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        with mock.patch("travis.client.retrieve_public_key") as patched:
+            result = runner.invoke(
+                cli,
+                ["mandeep", "Travis-Encrypt", "--socket", path],
+                input="SUPER_SECURE_PASSWORD",
+            )
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+    assert not result.exception
+    assert not patched.called
+    assert "Please add the following to your .travis.yml:\nsecure: " in result.output
+
+
+def test_key_file_offline(public_key):
+    """Test the --key-file CLI option.
+
+    A PEM file encrypts a password and a bundle encrypts for many repositories,
+    reporting repositories it holds no key for, without retrieving any key."""
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open("key.pem", "w") as key_file:
+            key_file.write(public_key)
+        with open("keys.json", "w") as bundle_file:
+            json.dump({"mandeep/Travis-Encrypt": public_key}, bundle_file)
+
+        with mock.patch("travis.client.retrieve_public_key") as retrieve, mock.patch(
+            "travis.client.retrieve_public_keys"
+        ) as retrieve_many:
+            single = runner.invoke(
+                cli,
+                ["mandeep", "Travis-Encrypt", "--key-file=key.pem"],
+                input="SUPER_SECURE_PASSWORD",
+            )
+            many = runner.invoke(
+                cli,
+                [
+                    "--key-file=keys.json",
+                    "--repo=mandeep/Travis-Encrypt",
+                    "--repo=mandeep/missing",
+                    "--output=json",
+                ],
+                input="SUPER_SECURE_PASSWORD",
+            )
+
+    assert not single.exception
+    assert "Please add the following to your .travis.yml:\nsecure: " in single.output
+    assert many.exit_code == 1
+    rows = json.loads(many.stdout[many.stdout.index("{") :])
+    assert "secure" in rows["mandeep/Travis-Encrypt"]
+    assert "no public key" in rows["mandeep/missing"]["error"]
+    assert not retrieve.called
+    assert not retrieve_many.called
+
+
+def test_group_help():
+    """Test that a leading --help describes the group rather than encrypt."""
+    runner = CliRunner()
+    result = runner.invoke(cli, ["--help"])
+    encrypt_help = runner.invoke(cli, ["mandeep", "--help"])
+
+    assert result.exit_code == 0
+    assert "prefetch" in result.output and "rotate" in result.output
+    assert encrypt_help.exit_code == 0
+    assert "--password" in encrypt_help.output
+
+
+def test_prefetch(public_key):
+    """Test the prefetch command.
+
+    The prefetched key is used from the cache by a later encryption."""
+
+    def retrieve(user_repo, url, token=None, cache=None, **kwargs):
+        if user_repo == "mandeep/missing":
+            raise InvalidCredentialsError("missing")
+        cache.set("{}/{}/key".format(url, user_repo), public_key)
+        return public_key
+
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open("manifest.yml", "w") as manifest_file:
+            manifest_file.write("- mandeep/Travis-Encrypt\n- mandeep/missing\n")
+
+        with mock.patch("travis.encrypt.retrieve_public_key", side_effect=retrieve):
+            result = runner.invoke(cli, ["prefetch", "manifest.yml"])
+
+        with mock.patch("travis.encrypt.get_session") as get_session:
+            encrypted = runner.invoke(
+                cli, ["mandeep", "Travis-Encrypt"], input="SUPER_SECURE_PASSWORD"
+            )
+
+    assert result.exit_code == 1
+    lines = result.stdout.splitlines()
+    assert lines[0].startswith("mandeep/Travis-Encrypt")
+    assert lines[0].endswith(public_key_fingerprint(public_key))
+    assert "ERROR: missing" in lines[1]
+    assert "Prefetched 1 of 2 public keys" in lines[2]
+    assert "could not be prefetched for: mandeep/missing" in result.output
+    assert not encrypted.exception
+    assert not get_session.called
+
+
+def test_rotate(public_key):
+    """Test the rotate command.
+
+    The dry run touches neither the API nor the files and reports missing
+    values; the rotation then writes the variables into each file."""
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        manifest = {
+            "env_file": "secrets.env",
+            "targets": [
+                {
+                    "repo": "mandeep/Travis-Encrypt",
+                    "files": ["a.yml", "b.yml"],
+                    "variables": ["API_KEY", "TOKEN"],
+                }
+            ],
+        }
+        with open("manifest.yml", "w") as manifest_file:
+            ordered_dump(manifest, manifest_file)
+        with open("secrets.env", "w") as env_file:
+            env_file.write("API_KEY=MY_PASSWORD\n")
+        for path in ("a.yml", "b.yml"):
+            with open(path, "w") as config_file:
+                ordered_dump({"language": "python"}, config_file)
+
+        with mock.patch(
+            "travis.rotate.retrieve_public_key", return_value=public_key
+        ) as retrieve:
+            plan = runner.invoke(cli, ["rotate", "manifest.yml", "--dry-run"])
+            assert not retrieve.called
+            with open("a.yml") as config_file:
+                assert "env" not in ordered_load(config_file)
+
+            result = runner.invoke(cli, ["rotate", "manifest.yml"])
+            with open("b.yml") as config_file:
+                config = ordered_load(config_file)
+
+    assert plan.exit_code == 0
+    assert "a.yml  mandeep/Travis-Encrypt  API_KEY, TOKEN  (missing: TOKEN)" in (
+        plan.output
+    )
+    assert "1 public keys to retrieve, 2 files to update, 4 values" in plan.output
+    assert result.exit_code == 1
+    assert "Updated a.yml: API_KEY" in result.output
+    assert "Failed b.yml TOKEN: no value" in result.output
+    assert retrieve.call_count == 1
+    assert base64.b64decode(config["env"]["global"]["API_KEY"]["secure"])
+
+
+def test_timings_profile(public_key):
+    """Test the --timings and --profile options.
+
+    The phase breakdown is printed to standard error and the profile can be
+    loaded with pstats, while standard output is unchanged."""
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with mock.patch("travis.client.retrieve_public_key", return_value=public_key):
+            result = runner.invoke(
+                cli,
+                ["mandeep", "Travis-Encrypt", "--timings", "--profile=run.prof"],
+                input="SUPER_SECURE_PASSWORD",
+            )
+        stats = pstats.Stats("run.prof")
+
+    assert not result.exception
+    assert result.stdout.startswith("Password: \n\nPlease add the following")
+    phases = [line.split()[0] for line in result.stderr.splitlines()]
+    assert phases[0] == "phase"
+    assert {"command", "encrypt"} <= set(phases[1:])
+    assert stats.total_calls
+
+
+def test_metrics_file(public_key):
+    """Test the --metrics-file option.
+
+    The encryptions and the write of a .env run are counted, and collection
+    stops with the command."""
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open("test.env", "w") as env_file:
+            env_file.write("API_KEY=MY_PASSWORD\nNEW_KEY=MY_OTHER_PASSWORD\n")
+        with open("file.yml", "w") as file:
+            file.write("language: python\n")
+
+        with mock.patch("travis.client.retrieve_public_key", return_value=public_key):
+            result = runner.invoke(
+                cli,
+                [
+                    "mandeep",
+                    "Travis-Encrypt",
+                    "file.yml",
+                    "--env-file=test.env",
+                    "--metrics-file=metrics.json",
+                ],
+            )
+        with open("metrics.json") as metrics_file:
+            metrics = json.load(metrics_file)
+        with open("file.yml") as file:
+            size = len(file.read().encode("utf-8"))
+    collected = metrics_snapshot()
+    increment("encryptions")
+
+    assert not result.exception
+    assert metrics["counters"]["encryptions"] == 2
+    assert metrics["counters"]["files_written"] == 1
+    assert metrics["counters"]["bytes_written"] == size
+    assert metrics["histograms"]["command"]["count"] == 1
+    assert metrics_snapshot() == collected
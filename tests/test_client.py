@@ -0,0 +1,174 @@
+"""Test the client module of Travis Encrypt.
+
+Test functions:
+test_encryptor_reuses_keys -- test that each public key is retrieved once
+test_encryptor_endpoint -- test the endpoint used for private and token requests
+test_encryptor_get_keys -- test that concurrently retrieved keys are memoized
+test_encryptor_iter_keys -- test retrieving keys while repositories are still arriving
+test_encryptor_iter_keys_listing_error -- test that keys are yielded before a listing error
+test_encryptor_offline_keys -- test encrypting with a key bundle instead of the API
+test_encryptor_config_updates -- test writing encrypted values to .travis.yml
+"""
+
+import base64
+
+from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
+import mock
+import pytest
+
+from travis.client import TravisEncryptor
+from travis.encrypt import InvalidCredentialsError
+from travis.keyfile import KeyBundle
+from travis.orderer import ordered_load
+from travis.scheduler import RateLimitedError
+
+
+def api_session(public_key):
+    """Build a mock session whose get method returns the public key."""
+    response = mock.Mock(status_code=200, headers={})
+    response.json.return_value = {"key": public_key, "public_key": public_key}
+    session = mock.Mock()
+    session.get.return_value = response
+    return session
+
+
+def decrypt(rsa_private_key, encrypted):
+    """Decrypt a base64 encoded value encrypted by the client."""
+    return rsa_private_key.decrypt(base64.b64decode(encrypted), PKCS1v15())
+
+
+def test_encryptor_reuses_keys(rsa_private_key, public_key):
+    """Test that many encryptions for a repository share one request and the session."""
+    session = api_session(public_key)
+    with TravisEncryptor(session=session) as encryptor:
+        first = encryptor.encrypt("mandeep/Travis-Encrypt", "password")
+        second = encryptor.encrypt("mandeep/Travis-Encrypt", b"other")
+        results = encryptor.encrypt_many("mandeep/Travis-Encrypt", [("A", "a")])
+
+    assert decrypt(rsa_private_key, first) == b"password"
+    assert decrypt(rsa_private_key, second) == b"other"
+    assert decrypt(rsa_private_key, results[0].encrypted) == b"a"
+    session.get.assert_called_once_with(
+        "https://api.travis-ci.org/repos/mandeep/Travis-Encrypt/key", headers={}
+    )
+    session.close.assert_called_once_with()
+
+
+def test_encryptor_endpoint(public_key):
+    """Test that the private and token settings select the endpoint and headers."""
+    session = api_session(public_key)
+    encryptor = TravisEncryptor(private=True, token="abc", session=session)
+
+    assert encryptor.get_key("mandeep/Travis-Encrypt") == public_key
+    session.get.assert_called_once_with(
+        "https://api.travis-ci.com/v3/repo/mandeep%2fTravis-Encrypt/key_pair/generated",
+        headers={"Authorization": "token abc"},
+    )
+
+
+def test_encryptor_get_keys(public_key):
+    """Test that keys retrieved for many repositories are reused by encrypt."""
+    session = api_session(public_key)
+    encryptor = TravisEncryptor(session=session)
+
+    results = encryptor.get_keys(["mandeep/first", "mandeep/second", "mandeep/first"])
+    encryptor.encrypt("mandeep/second", "password")
+
+    assert [result.user_repo for result in results] == [
+        "mandeep/first",
+        "mandeep/second",
+    ]
+    assert session.get.call_count == 2
+
+
+def test_encryptor_iter_keys(public_key):
+    """Test that keys are yielded in input order before the input is exhausted."""
+    consumed = []
+
+    def user_repos():
+        for name in ["first", "missing", "first", "second"]:
+            consumed.append(name)
+            yield "mandeep/{}".format(name)
+
+    def keys(user_repo):
+        if user_repo == "mandeep/missing":
+            raise InvalidCredentialsError("missing")
+        return public_key
+
+    results = TravisEncryptor(keys=keys).iter_keys(user_repos(), jobs=1)
+
+    assert next(results).user_repo == "mandeep/first"
+    assert len(consumed) < 4
+    rest = list(results)
+    assert [result.user_repo for result in rest] == [
+        "mandeep/missing",
+        "mandeep/second",
+    ]
+    assert str(rest[0].error) == "missing"
+
+
+def test_encryptor_iter_keys_listing_error(public_key):
+    """Test that the keys of repositories already given precede a listing error."""
+
+    def user_repos():
+        yield "mandeep/first"
+        yield "mandeep/second"
+        raise RateLimitedError("rate limited")
+
+    results = TravisEncryptor(keys=lambda user_repo: public_key).iter_keys(
+        user_repos(), jobs=4
+    )
+
+    assert [next(results).user_repo, next(results).user_repo] == [
+        "mandeep/first",
+        "mandeep/second",
+    ]
+    with pytest.raises(RateLimitedError):
+        next(results)
+
+
+def test_encryptor_offline_keys(rsa_private_key, public_key):
+    """Test that a key bundle replaces the API and reports missing repositories."""
+    session = mock.Mock()
+    encryptor = TravisEncryptor(
+        keys=KeyBundle({"mandeep/Travis-Encrypt": public_key}), session=session
+    )
+
+    results = encryptor.get_keys(
+        ["mandeep/Travis-Encrypt", "mandeep/missing", "mandeep/Travis-Encrypt"]
+    )
+    encrypted = encryptor.encrypt("mandeep/Travis-Encrypt", "password")
+
+    assert [result.user_repo for result in results] == [
+        "mandeep/Travis-Encrypt",
+        "mandeep/missing",
+    ]
+    assert results[0].key == public_key and results[0].error is None
+    assert "no public key" in str(results[1].error)
+    assert decrypt(rsa_private_key, encrypted) == b"password"
+    assert not session.get.called
+
+
+def test_encryptor_config_updates(tmpdir, rsa_private_key, public_key):
+    """Test that the config methods encrypt and write values with one write each."""
+    path = str(tmpdir.join(".travis.yml"))
+    with open(path, "w") as config_file:
+        config_file.write("language: python\n")
+    encryptor = TravisEncryptor(keys=lambda user_repo: public_key)
+
+    encryptor.set_secure(
+        path, "mandeep/Travis-Encrypt", "deploy", ("deploy", "password")
+    )
+    encryptor.set_env_secure(path, "mandeep/Travis-Encrypt", "anonymous")
+    results = encryptor.set_env_variables(
+        path, "mandeep/Travis-Encrypt", [("API_KEY", "abc123"), ("HUGE", "X" * 1024)]
+    )
+
+    with open(path) as config_file:
+        config = ordered_load(config_file)
+    assert decrypt(rsa_private_key, config["deploy"]["password"]["secure"]) == b"deploy"
+    env_global = config["env"]["global"]
+    assert decrypt(rsa_private_key, env_global["secure"]) == b"anonymous"
+    assert decrypt(rsa_private_key, env_global["API_KEY"]["secure"]) == b"abc123"
+    assert "HUGE" not in env_global
+    assert results[1].error is not None
@@ -0,0 +1,210 @@
+"""Test the config module of Travis Encrypt.
+
+Test functions:
+test_index_mapping_form -- test upserting variables of a mapping form env.global
+test_index_list_form -- test upserting variables of a list form env.global
+test_index_set_secure -- test updating anonymous secure values
+test_index_creates_env_global -- test configurations without env.global
+test_config_file_many_anonymous -- test replacing one of many anonymous secure values
+test_config_file_falls_back_to_dump -- test adding values that do not exist yet
+test_config_file_unchanged -- test that an unchanged file is not written
+test_config_file_crlf -- test that CRLF line endings survive a patch
+test_config_file_many_anonymous -- test that only one anonymous secure value is replaced
+test_write_file_atomic -- test that a failed write leaves the original file intact
+test_write_file_bytes -- test writing UTF-8 bytes as produced by yaml and json on Python 2
+"""
+from collections import OrderedDict
+import os
+
+import mock
+import pytest
+
+from travis import config as travis_config
+from travis.config import ConfigFile, EnvGlobalIndex, write_file
+from travis.orderer import ordered_load
+
+LIST_FORM = """\
+env:
+  global:
+    - DEBUG=1
+    - secure: ANONYMOUS
+    - API_KEY:
+        secure: OLD_API_KEY
+    - TOKEN=plain
+"""
+
+
+def test_index_mapping_form():
+    """Test that variables are stored under their names in mapping form."""
+    config = ordered_load("env:\n  global:\n    API_KEY:\n      secure: OLD\n")
+    index = EnvGlobalIndex(config)
+
+    assert "API_KEY" in index
+    index.upsert_many([("API_KEY", {"secure": "NEW"}), ("TOKEN", {"secure": "T"})])
+
+    assert config["env"]["global"] == {
+        "API_KEY": {"secure": "NEW"},
+        "TOKEN": {"secure": "T"},
+    }
+
+
+def test_index_list_form():
+    """Test that only the named entries change and new variables are appended."""
+    config = ordered_load(LIST_FORM)
+    index = EnvGlobalIndex(config)
+
+    assert index.get("DEBUG") == "1"
+    assert index.get("API_KEY") == {"secure": "OLD_API_KEY"}
+    index.upsert_many(
+        [
+            ("API_KEY", {"secure": "NEW_API_KEY"}),
+            ("TOKEN", {"secure": "NEW_TOKEN"}),
+            ("PASSWORD", {"secure": "NEW_PASSWORD"}),
+        ]
+    )
+
+    assert config["env"]["global"] == [
+        "DEBUG=1",
+        {"secure": "ANONYMOUS"},
+        {"API_KEY": {"secure": "NEW_API_KEY"}},
+        {"TOKEN": {"secure": "NEW_TOKEN"}},
+        {"PASSWORD": {"secure": "NEW_PASSWORD"}},
+    ]
+    assert index.get("PASSWORD") == {"secure": "NEW_PASSWORD"}
+
+
+def test_index_set_secure():
+    """Test that anonymous secure values are updated, or added when missing."""
+    config = ordered_load(LIST_FORM)
+    EnvGlobalIndex(config).set_secure("NEW")
+    assert config["env"]["global"][1] == {"secure": "NEW"}
+    assert config["env"]["global"][2] == {"API_KEY": {"secure": "OLD_API_KEY"}}
+
+    config = ordered_load("env:\n  global:\n    - DEBUG=1\n")
+    EnvGlobalIndex(config).set_secure("NEW")
+    assert config["env"]["global"] == ["DEBUG=1", {"secure": "NEW"}]
+
+
+def test_index_creates_env_global():
+    """Test that env.global is created and a bare env list is kept as the matrix."""
+    config = OrderedDict([("language", "python")])
+    EnvGlobalIndex(config).upsert("API_KEY", {"secure": "NEW"})
+    assert config["env"] == {"global": {"API_KEY": {"secure": "NEW"}}}
+
+    config = ordered_load("env:\n  - SHARD=1\n  - SHARD=2\n")
+    EnvGlobalIndex(config).upsert("API_KEY", {"secure": "NEW"})
+    assert config["env"] == {
+        "matrix": ["SHARD=1", "SHARD=2"],
+        "global": {"API_KEY": {"secure": "NEW"}},
+    }
+
+
+def test_config_file_patches_in_place(tmpdir):
+    """Test that many updates of existing values are applied with a single write."""
+    path = tmpdir.join("travis.yml")
+    path.write("# keep me\n" + LIST_FORM + "deploy:\n  password:\n    secure: OLD\n")
+    config_file = ConfigFile(str(path))
+
+    config_file.set_env_variable("API_KEY", "NEW_API_KEY")
+    config_file.set_env_secure("NEW_ANONYMOUS")
+    config_file.set_secure(("deploy", "password"), "NEW_DEPLOY")
+    with mock.patch(
+        "travis.config.write_file", side_effect=travis_config.write_file
+    ) as write:
+        assert config_file.flush()
+
+    assert write.call_count == 1
+    text = path.read()
+    assert text.startswith("# keep me\n")
+    config = ordered_load(text)
+    assert config["env"]["global"][1] == {"secure": "NEW_ANONYMOUS"}
+    assert config["env"]["global"][2] == {"API_KEY": {"secure": "NEW_API_KEY"}}
+    assert config["deploy"]["password"]["secure"] == "NEW_DEPLOY"
+
+
+def test_config_file_falls_back_to_dump(tmpdir):
+    """Test that values missing from the file are added by dumping the configuration."""
+    path = tmpdir.join("travis.yml")
+    path.write("")
+    config_file = ConfigFile(str(path))
+
+    config_file.set_secure(("password",), "NEW_PASSWORD")
+    config_file.set_env_variable("API_KEY", "NEW_API_KEY")
+    assert config_file.flush()
+
+    assert ordered_load(path.read()) == {
+        "password": {"secure": "NEW_PASSWORD"},
+        "env": {"global": {"API_KEY": {"secure": "NEW_API_KEY"}}},
+    }
+
+
+def test_config_file_many_anonymous(tmpdir):
+    """Test that the first anonymous secure value is replaced and the others kept."""
+    text = "env:\n  global:\n    - secure: FIRST\n    - secure: SECOND\n"
+    path = tmpdir.join("travis.yml")
+    path.write(text)
+    config_file = ConfigFile(str(path))
+
+    config_file.set_env_secure("NEW")
+    assert config_file.flush()
+
+    assert path.read() == text.replace("FIRST", "NEW")
+
+    config = ordered_load(text)
+    EnvGlobalIndex(config).set_secure("NEW")
+    assert config["env"]["global"] == [{"secure": "NEW"}, {"secure": "SECOND"}]
+
+
+def test_config_file_unchanged(tmpdir):
+    """Test that flushing identical values does not write the file."""
+    path = tmpdir.join("travis.yml")
+    path.write("password:\n  secure: SAME\n")
+    os.chmod(str(path), 0o640)
+    config_file = ConfigFile(str(path))
+
+    config_file.set_secure(("password",), "SAME")
+    with mock.patch("travis.config.write_file") as write:
+        assert not config_file.flush()
+    assert not write.called
+
+    config_file.set_secure(("password",), "OTHER")
+    assert config_file.flush()
+    assert os.stat(str(path)).st_mode & 0o777 == 0o640
+
+
+def test_config_file_crlf(tmpdir):
+    """Test that a file with CRLF line endings is patched without converting them."""
+    path = str(tmpdir.join("travis.yml"))
+    with open(path, "wb") as config_file:
+        config_file.write(b"language: python\r\npassword:\r\n  secure: OLD\r\n")
+    config_file = ConfigFile(path)
+
+    config_file.set_secure(("password",), "NEW")
+    assert config_file.flush()
+
+    with open(path, "rb") as config_file:
+        assert config_file.read() == (
+            b"language: python\r\npassword:\r\n  secure: NEW\r\n"
+        )
+
+
+def test_write_file_atomic(tmpdir):
+    """Test that the original file survives a failure and no temporary file is left."""
+    path = tmpdir.join("travis.yml")
+    path.write("language: python\n")
+
+    with mock.patch("travis.config.replace_file", side_effect=OSError("disk full")):
+        with pytest.raises(OSError):
+            write_file(str(path), "language: ruby\n")
+
+    assert path.read() == "language: python\n"
+    assert tmpdir.listdir() == [path]
+    assert not write_file(str(path), "language: python\n")
+
+
+def test_write_file_bytes(tmpdir):
+    """Test that UTF-8 encoded bytes are written as text."""
+    path = str(tmpdir.join("travis.yml"))
+
+    assert write_file(path, u"language: python  # \u00e9\n".encode("utf-8"))
+    assert not write_file(path, u"language: python  # \u00e9\n")
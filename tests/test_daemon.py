@@ -0,0 +1,92 @@
+"""Test the daemon module of Travis Encrypt.
+
+Test functions:
+test_daemon_encrypt -- test encrypting values through a running daemon
+test_daemon_stream -- test sending many NDJSON lines over one connection
+test_daemon_unreachable -- test that a missing daemon raises DaemonError
+test_daemon_invalid_utf8 -- test that undecodable lines are answered with an error
+test_daemon_already_running -- test that a live daemon's socket is not replaced
+"""
+import base64
+import json
+import threading
+
+from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
+import mock
+import pytest
+
+from travis.daemon import DaemonClient, DaemonError, EncryptionServer
+from travis.encrypt import InvalidCredentialsError
+
+
+@pytest.fixture
+def daemon(tmpdir, public_key):
+    """Run an EncryptionServer in a background thread and yield its socket path."""
+
+    def get_key(user_repo):
+        if user_repo == "mandeep/missing":
+            raise InvalidCredentialsError("Please enter a valid user/repository name.")
+        return public_key
+
+    path = str(tmpdir.join("daemon.sock"))
+    server = EncryptionServer(path, mock.Mock(side_effect=get_key))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield path
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_daemon_encrypt(daemon, rsa_private_key):
+    """Test that values are encrypted and errors are raised as DaemonError."""
+    with DaemonClient(daemon, timeout=10) as client:
+        encrypted = client.encrypt("mandeep/Travis-Encrypt", "password", "hunter2")
+        with pytest.raises(DaemonError, match="valid user/repository"):
+            client.encrypt("mandeep/missing", "password", "hunter2")
+
+    plaintext = rsa_private_key.decrypt(base64.b64decode(encrypted), PKCS1v15())
+    assert plaintext == b"hunter2"
+
+
+def test_daemon_stream(daemon):
+    """Test that every line is answered in order and blank lines are skipped."""
+    lines = [
+        json.dumps({"repo": "mandeep/Travis-Encrypt", "name": "A", "value": "a"}),
+        "\n",
+        "not json\n",
+        json.dumps({"repo": "mandeep/Travis-Encrypt", "name": "B", "value": "b"}),
+    ]
+    with DaemonClient(daemon, timeout=10) as client:
+        results = list(client.stream(lines))
+
+    assert len(results) == 3
+    assert results[0]["name"] == "A" and "secure" in results[0]
+    assert results[1]["error"].startswith("Invalid record")
+    assert results[2]["name"] == "B" and "secure" in results[2]
+
+
+def test_daemon_unreachable(tmpdir):
+    """Test that connecting to a socket nobody listens on raises DaemonError."""
+    with pytest.raises(DaemonError, match="Could not connect"):
+        DaemonClient(str(tmpdir.join("missing.sock")))
+
+
+def test_daemon_invalid_utf8(daemon):
+    """Test that an undecodable line is answered and the connection kept open."""
+    with DaemonClient(daemon, timeout=10) as client:
+        client.socket.sendall(b"\xff\xfe\n")
+        result = json.loads(client.reader.readline().decode("utf-8"))
+        encrypted = client.encrypt("mandeep/Travis-Encrypt", "password", "hunter2")
+
+    assert result["error"].startswith("Invalid record")
+    assert encrypted
+
+
+def test_daemon_already_running(daemon):
+    """Test that a second server refuses the socket of a running daemon."""
+    with pytest.raises(DaemonError, match="already listening"):
+        EncryptionServer(daemon, mock.Mock())
+
+    with DaemonClient(daemon, timeout=10) as client:
+        assert client.encrypt("mandeep/Travis-Encrypt", "password", "hunter2")
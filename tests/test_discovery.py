@@ -0,0 +1,87 @@
+"""Test the discovery module of Travis Encrypt.
+
+Test functions:
+test_match_repository -- test selecting repository names with include and exclude patterns
+test_iter_owner_repositories -- test that pages are requested as repositories are consumed
+test_iter_owner_repositories_forbidden -- test that an inaccessible owner is reported
+test_owner_repositories_url -- test that the owner is quoted in the endpoint path
+"""
+
+import mock
+import pytest
+
+from travis.discovery import (
+    iter_owner_repositories,
+    match_repository,
+    owner_repositories_url,
+)
+from travis.encrypt import InvalidCredentialsError
+
+URL = "https://api.travis-ci.com/v3/owner/mandeep/repos?limit=2&offset={}"
+
+
+def page(names, is_last):
+    """Build a mock response holding one page of repositories."""
+    response = mock.Mock(status_code=200, headers={})
+    response.json.return_value = {
+        "@pagination": {"is_last": is_last},
+        "repositories": [
+            {"slug": "mandeep/{}".format(name), "name": name} for name in names
+        ],
+    }
+    return response
+
+
+def test_match_repository():
+    """Test that include patterns select and exclude patterns reject names."""
+    assert match_repository("Travis-Encrypt")
+    assert match_repository("service-a", include=["service-*"])
+    assert not match_repository("Travis-Encrypt", include=["service-*"])
+    assert not match_repository("service-a", ["service-*"], exclude=["*-a"])
+    assert not match_repository("Service-b", include=["service-*"])
+
+
+def test_iter_owner_repositories():
+    """Test that each page is requested only once the previous one is consumed."""
+    session = mock.Mock()
+    session.get.side_effect = [
+        page(["service-a", "docs"], False),
+        page(["service-b"], True),
+    ]
+
+    repositories = iter_owner_repositories(
+        "mandeep",
+        "abc",
+        private=True,
+        include=["service-*"],
+        page_size=2,
+        session=session,
+    )
+
+    assert next(repositories) == "mandeep/service-a"
+    assert session.get.call_count == 1
+    assert list(repositories) == ["mandeep/service-b"]
+    assert [call[0][0] for call in session.get.call_args_list] == [
+        URL.format(0),
+        URL.format(2),
+    ]
+    assert session.get.call_args[1]["headers"] == {
+        "Authorization": "token abc",
+        "Travis-API-Version": "3",
+    }
+
+
+def test_iter_owner_repositories_forbidden():
+    """Test that a 403 response raises InvalidCredentialsError naming the owner."""
+    session = mock.Mock()
+    session.get.return_value = mock.Mock(status_code=403, headers={})
+
+    with pytest.raises(InvalidCredentialsError, match="'mandeep'.*HTTP 403"):
+        list(iter_owner_repositories("mandeep", "abc", session=session))
+
+
+def test_owner_repositories_url():
+    """Test that an owner cannot change the path or query of the endpoint."""
+    assert owner_repositories_url("../repo?x", limit=2) == (
+        "https://api.travis-ci.org/v3/owner/..%2Frepo%3Fx/repos?limit=2&offset=0"
+    )
@@ -7,11 +7,38 @@ Test functions:
 test_public_key_retrieval -- test the Travis CI API for public key retrieval
 test_invalid_credentials -- test the InvalidCredentialsError
 test_encrypt_key -- test the encrypt_key function
+test_encrypt_key_decrypts -- test that the private key decrypts the encrypted password
+test_encrypt_key_pkcs1 -- test encrypting with a PKCS#1 'BEGIN RSA PUBLIC KEY' PEM
+test_load_public_key_cache -- test that parsed public keys are reused
+test_encrypt_many -- test batch encryption with per item failures
+test_encrypt_many_jobs -- test that a process pool preserves input order
+test_endpoint_url -- test the .org, .com and v3 endpoints
+test_public_key_fingerprint -- test that the fingerprint ignores the PEM header spelling
+test_prefetch_public_keys -- test caching keys and reporting the keys that fail
 """
+
+import base64
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
+import mock
 import pytest
 import six
 
-from travis.encrypt import encrypt_key, InvalidCredentialsError, retrieve_public_key
+from travis.cache import KeyCache
+from travis.encrypt import (
+    encrypt_key,
+    encrypt_many,
+    endpoint_url,
+    InvalidCredentialsError,
+    load_public_key,
+    prefetch_public_keys,
+    public_key_fingerprint,
+    public_key_cache_clear,
+    public_key_cache_info,
+    retrieve_public_key,
+)
+from travis.manifest import RepositorySpec
 
 
 @pytest.fixture
@@ -40,3 +67,146 @@ def test_encrypt_key(repository):
     password = "SUPER_SECURE_PASSWORD"
     encrypted_password = encrypt_key(public_key, password.encode())
     assert isinstance(encrypted_password, six.text_type)
+
+
+def test_encrypt_key_decrypts(rsa_private_key, public_key):
+    """Test that the password round trips through a locally generated key pair."""
+    encrypted_password = encrypt_key(public_key, b"SUPER_SECURE_PASSWORD")
+    decrypted = rsa_private_key.decrypt(
+        base64.b64decode(encrypted_password), PKCS1v15()
+    )
+    assert decrypted == b"SUPER_SECURE_PASSWORD"
+
+
+def test_encrypt_key_pkcs1(rsa_private_key, public_key):
+    """Test that a genuine PKCS#1 key is parsed as such and not stripped of RSA."""
+    pkcs1_key = (
+        rsa_private_key.public_key()
+        .public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.PKCS1)
+        .decode("ascii")
+    )
+    assert "BEGIN RSA PUBLIC KEY" in pkcs1_key
+    public_key_cache_clear()
+
+    encrypted_password = encrypt_key(pkcs1_key, b"SUPER_SECURE_PASSWORD")
+
+    decrypted = rsa_private_key.decrypt(
+        base64.b64decode(encrypted_password), PKCS1v15()
+    )
+    assert decrypted == b"SUPER_SECURE_PASSWORD"
+    assert public_key_fingerprint(pkcs1_key) == public_key_fingerprint(public_key)
+
+
+def test_load_public_key_cache(public_key):
+    """Test that the PEM is parsed once and the RSA header spelling shares the entry."""
+    public_key_cache_clear()
+    rsa_spelling = public_key.replace(" PUBLIC ", " RSA PUBLIC ")
+
+    first = load_public_key(public_key)
+    second = load_public_key(rsa_spelling)
+    encrypt_key(public_key, b"SUPER_SECURE_PASSWORD")
+
+    assert first is second
+    info = public_key_cache_info()
+    assert (info.hits, info.misses, info.currsize) == (2, 1, 1)
+
+
+def test_encrypt_many(rsa_private_key, public_key):
+    """Test that a batch keeps input order and reports values that cannot be encrypted."""
+    results = encrypt_many(
+        public_key,
+        [("FIRST", "ONE"), ("TOO_LONG", "X" * 1024), ("EMPTY", None), ("LAST", b"TWO")],
+    )
+
+    assert [result.name for result in results] == ["FIRST", "TOO_LONG", "EMPTY", "LAST"]
+    assert isinstance(results[1].error, ValueError)
+    assert results[2].error is not None
+    for result, expected in ((results[0], b"ONE"), (results[3], b"TWO")):
+        assert result.error is None
+        decrypted = rsa_private_key.decrypt(
+            base64.b64decode(result.encrypted), PKCS1v15()
+        )
+        assert decrypted == expected
+
+
+def test_encrypt_many_jobs(rsa_private_key, public_key):
+    """Test that encrypting with several worker processes keeps results in order."""
+    items = [("VARIABLE_{}".format(i), "value-{}".format(i)) for i in range(9)]
+    items.insert(4, ("TOO_LONG", "X" * 1024))
+
+    results = encrypt_many(public_key, items, jobs=3)
+
+    assert [result.name for result in results] == [name for name, _ in items]
+    assert isinstance(results[4].error, ValueError)
+    for (_, value), result in zip(items[:4] + items[5:], results[:4] + results[5:]):
+        decrypted = rsa_private_key.decrypt(
+            base64.b64decode(result.encrypted), PKCS1v15()
+        )
+        assert decrypted == value.encode()
+
+
+def test_endpoint_url():
+    """Test the endpoint used for every combination of --private and --token."""
+    assert endpoint_url("mandeep/Travis-Encrypt") == "https://api.travis-ci.org/repos"
+    assert (
+        endpoint_url("mandeep/Travis-Encrypt", private=True)
+        == "https://api.travis-ci.com/repos"
+    )
+    assert (
+        endpoint_url("mandeep/Travis-Encrypt", token="TOKEN")
+        == "https://api.travis-ci.org/v3/repo/mandeep%2fTravis-Encrypt/key_pair/generated"
+    )
+    assert (
+        endpoint_url("mandeep/Travis-Encrypt", private=True, token="TOKEN")
+        == "https://api.travis-ci.com/v3/repo/mandeep%2fTravis-Encrypt/key_pair/generated"
+    )
+
+
+def test_public_key_fingerprint(public_key):
+    """Test that both PEM header spellings of a key share one fingerprint."""
+    fingerprint = public_key_fingerprint(public_key)
+
+    assert fingerprint.startswith("SHA256:")
+    assert len(fingerprint) == len("SHA256:") + 64
+    assert fingerprint == public_key_fingerprint(
+        public_key.replace(" PUBLIC ", " RSA PUBLIC ")
+    )
+
+
+def test_prefetch_public_keys(tmpdir, public_key):
+    """Test that valid keys are cached and invalid or missing keys are reported."""
+    cache = KeyCache(str(tmpdir))
+    responses = {
+        "mandeep/Travis-Encrypt": public_key,
+        "mandeep/broken": "not a key",
+    }
+
+    def retrieve(user_repo, url, token=None, cache=None, **kwargs):
+        if user_repo not in responses:
+            raise InvalidCredentialsError("missing")
+        cache_url = url if token else "{}/{}/key".format(url, user_repo)
+        cache.set(cache_url, responses[user_repo])
+        return responses[user_repo]
+
+    specs = [
+        RepositorySpec("mandeep/Travis-Encrypt", True, "token"),
+        RepositorySpec("mandeep/broken", False, None),
+        RepositorySpec("mandeep/missing", False, None),
+    ]
+    with mock.patch("travis.encrypt.retrieve_public_key", side_effect=retrieve):
+        results = prefetch_public_keys(specs, cache, jobs=2)
+
+    assert [result.user_repo for result in results] == [
+        "mandeep/Travis-Encrypt",
+        "mandeep/broken",
+        "mandeep/missing",
+    ]
+    assert results[0].fingerprint == public_key_fingerprint(public_key)
+    assert results[0].error is None
+    assert isinstance(results[1].error, ValueError)
+    assert isinstance(results[2].error, InvalidCredentialsError)
+    assert all(result.elapsed >= 0 for result in results)
+
+    v3_url = endpoint_url("mandeep/Travis-Encrypt", True, "token")
+    assert cache.get(v3_url) == public_key
+    assert cache.get("https://api.travis-ci.org/repos/mandeep/broken/key") is None
@@ -0,0 +1,66 @@
+"""Test the fingerprints module of Travis Encrypt.
+
+Test functions:
+test_fingerprint_store -- test recording, saving and reloading fingerprints
+test_fingerprint_store_key_rotation -- test that a new public key invalidates fingerprints
+test_fingerprint_secret -- test that the fingerprint secret changes every fingerprint
+test_fingerprint_store_invalid -- test that unusable sidecar files raise ValueError
+"""
+import json
+
+import pytest
+
+from travis.fingerprints import FingerprintStore
+
+
+def test_fingerprint_store(tmpdir):
+    """Test that recorded values are recognized after the store is reloaded."""
+    path = str(tmpdir.join("fingerprints.json"))
+    store = FingerprintStore(path)
+    store.record("API_KEY", "MY_PASSWORD", "SHA256:key")
+    store.save()
+
+    with open(path) as store_file:
+        data = json.load(store_file)
+    assert "MY_PASSWORD" not in json.dumps(data)
+
+    store = FingerprintStore(path)
+    assert store.is_unchanged("API_KEY", "MY_PASSWORD", "SHA256:key")
+    assert not store.is_unchanged("API_KEY", "NEW_PASSWORD", "SHA256:key")
+    assert not store.is_unchanged("OTHER_KEY", "MY_PASSWORD", "SHA256:key")
+    assert not store.is_unchanged("API_KEY", None, "SHA256:key")
+
+
+def test_fingerprint_store_key_rotation(tmpdir):
+    """Test that values recorded with another public key are considered changed."""
+    store = FingerprintStore(str(tmpdir.join("fingerprints.json")))
+    store.record("API_KEY", "MY_PASSWORD", "SHA256:old")
+
+    assert not store.is_unchanged("API_KEY", "MY_PASSWORD", "SHA256:new")
+
+
+def test_fingerprint_secret(tmpdir, monkeypatch):
+    """Test that fingerprints depend on the salt and TRAVIS_ENCRYPT_FINGERPRINT_KEY."""
+    path = str(tmpdir.join("fingerprints.json"))
+    store = FingerprintStore(path)
+    other_store = FingerprintStore(str(tmpdir.join("other.json")))
+    assert store.fingerprint("API_KEY", "X") != other_store.fingerprint("API_KEY", "X")
+
+    store.record("API_KEY", "MY_PASSWORD", "SHA256:key")
+    store.save()
+    monkeypatch.setenv("TRAVIS_ENCRYPT_FINGERPRINT_KEY", "secret")
+    assert not FingerprintStore(path).is_unchanged(
+        "API_KEY", "MY_PASSWORD", "SHA256:key"
+    )
+
+
+@pytest.mark.parametrize(
+    "contents", ["{not json", "[]", '{"version": 99, "variables": {}}']
+)
+def test_fingerprint_store_invalid(tmpdir, contents):
+    """Test that corrupt, malformed and unsupported sidecar files raise ValueError."""
+    path = tmpdir.join("fingerprints.json")
+    path.write(contents)
+
+    with pytest.raises(ValueError, match="fingerprint store"):
+        FingerprintStore(str(path))
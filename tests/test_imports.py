@@ -0,0 +1,51 @@
+"""Test the import time of the Travis Encrypt command line interface.
+
+Every test runs a fresh interpreter, since the modules imported by other
+tests are already cached by the interpreter running the test suite.
+
+Test functions:
+test_cli_lazy_imports -- test that heavy dependencies are not imported at startup
+test_cli_import_budget -- test that importing the CLI stays within its time budget
+"""
+import json
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ("cryptography", "dotenv", "pyperclip", "requests", "urllib3", "yaml")
+
+# generous enough for slow CI machines, while the eager imports this test
+# guards against took several times longer than the lazy ones
+IMPORT_BUDGET = float(os.environ.get("TRAVIS_ENCRYPT_IMPORT_BUDGET", "0.5"))
+
+
+def run_python(code):
+    """Run the code in a new interpreter and return its last output line as JSON."""
+    output = subprocess.check_output([sys.executable, "-c", code])
+    return json.loads(output.decode("utf-8").splitlines()[-1])
+
+
+def test_cli_lazy_imports():
+    """Test that importing the CLI and printing --help load no heavy dependency."""
+    loaded = run_python(
+        "import json, sys\n"
+        "from travis.cli import cli\n"
+        "cli.main(['--help'], standalone_mode=False)\n"
+        "print(json.dumps(sorted(sys.modules)))\n"
+    )
+
+    heavy = [name for name in loaded if name.split(".")[0] in HEAVY_MODULES]
+    assert heavy == []
+
+
+def test_cli_import_budget():
+    """Test that the fastest of three imports of the CLI is within the budget."""
+    code = (
+        "import json, time\n"
+        "start = time.time()\n"
+        "import travis.cli\n"
+        "print(json.dumps(time.time() - start))\n"
+    )
+    elapsed = min(run_python(code) for _ in range(3))
+
+    assert elapsed < IMPORT_BUDGET
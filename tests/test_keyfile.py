@@ -0,0 +1,126 @@
+"""Test the keyfile module of Travis Encrypt.
+
+Test functions:
+test_load_pem_key_file -- test that a PEM file provides the key of every repository
+test_load_pkcs1_key_file -- test that a PKCS#1 PEM file is accepted
+test_load_json_bundle -- test loading a JSON bundle with pinned fingerprints
+test_load_yaml_bundle -- test loading a YAML bundle
+test_bundle_fingerprint_mismatch -- test that a key not matching its fingerprint is rejected
+test_bundle_invalid -- test that malformed bundles raise KeyFileError
+"""
+
+import json
+
+from cryptography.hazmat.primitives import serialization
+import pytest
+
+from travis.encrypt import InvalidCredentialsError, public_key_fingerprint
+from travis.keyfile import KeyFileError, load_key_file
+from travis.orderer import ordered_dump
+
+
+def test_load_pem_key_file(tmpdir, public_key):
+    """Test that the key of a PEM file is returned for any repository."""
+    path = tmpdir.join("key.pem")
+    path.write(public_key)
+
+    bundle = load_key_file(str(path))
+
+    assert bundle.get("mandeep/Travis-Encrypt") == public_key
+    assert bundle("mandeep/other") == public_key
+
+
+def test_load_pkcs1_key_file(tmpdir, rsa_private_key, public_key):
+    """Test that a 'BEGIN RSA PUBLIC KEY' file loads and pins to the same fingerprint."""
+    pkcs1_key = (
+        rsa_private_key.public_key()
+        .public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.PKCS1)
+        .decode("ascii")
+    )
+    path = tmpdir.join("keys.json")
+    path.write(
+        json.dumps(
+            {
+                "mandeep/Travis-Encrypt": {
+                    "key": pkcs1_key,
+                    "fingerprint": public_key_fingerprint(public_key),
+                }
+            }
+        )
+    )
+
+    bundle = load_key_file(str(path))
+
+    assert bundle.get("mandeep/Travis-Encrypt") == pkcs1_key
+
+
+def test_load_json_bundle(tmpdir, public_key):
+    """Test that pinned keys are returned and missing repositories are reported."""
+    path = tmpdir.join("keys.json")
+    path.write(
+        json.dumps(
+            {
+                "mandeep/Travis-Encrypt": {
+                    "key": public_key,
+                    "fingerprint": public_key_fingerprint(public_key).upper(),
+                },
+                "mandeep/other": public_key,
+            }
+        )
+    )
+
+    bundle = load_key_file(str(path))
+
+    assert bundle.get("mandeep/Travis-Encrypt") == public_key
+    assert bundle.get("mandeep/other") == public_key
+    with pytest.raises(InvalidCredentialsError):
+        bundle.get("mandeep/missing")
+
+
+def test_load_yaml_bundle(tmpdir, public_key):
+    """Test that bundles may be written in YAML."""
+    path = tmpdir.join("keys.yml")
+    path.write(
+        ordered_dump(
+            {
+                "mandeep/Travis-Encrypt": {
+                    "key": public_key,
+                    "fingerprint": public_key_fingerprint(public_key),
+                }
+            },
+            default_style="|",
+        )
+    )
+
+    assert load_key_file(str(path)).get("mandeep/Travis-Encrypt") == public_key
+
+
+def test_bundle_fingerprint_mismatch(tmpdir, public_key):
+    """Test that a pinned fingerprint that does not match the key is rejected."""
+    path = tmpdir.join("keys.json")
+    path.write(
+        json.dumps(
+            {"mandeep/Travis-Encrypt": {"key": public_key, "fingerprint": "SHA256:00"}}
+        )
+    )
+
+    with pytest.raises(KeyFileError, match="instead of the pinned SHA256:00"):
+        load_key_file(str(path))
+
+
+@pytest.mark.parametrize(
+    "contents",
+    [
+        "[]",
+        '{"mandeep/Travis-Encrypt": {"fingerprint": "SHA256:00"}}',
+        '{"mandeep/Travis-Encrypt": "not a key"}',
+        "mandeep/Travis-Encrypt: [unclosed",
+    ],
+)
+def test_bundle_invalid(tmpdir, contents):
+    """Test that malformed bundles and invalid keys raise KeyFileError."""
+    path = tmpdir.join("keys")
+    path.write(contents)
+
+    with pytest.raises(KeyFileError):
+        load_key_file(str(path))
@@ -0,0 +1,67 @@
+"""Test the manifest module of Travis Encrypt.
+
+Test functions:
+test_repository_specs -- test resolving the settings of every repository
+test_repository_specs_list -- test a manifest that only lists repositories
+test_repository_specs_invalid -- test that malformed manifests raise ManifestError
+"""
+import pytest
+
+from travis.manifest import (
+    ManifestError,
+    read_manifest,
+    repository_specs,
+    RepositorySpec,
+)
+
+
+def test_repository_specs(tmpdir, monkeypatch):
+    """Test that entries override the manifest defaults, which override the CLI."""
+    monkeypatch.setenv("TRAVIS_COM_TOKEN", "com-token")
+    path = tmpdir.join("manifest.yml")
+    path.write(
+        "defaults:\n"
+        "  private: true\n"
+        "  token_env: TRAVIS_COM_TOKEN\n"
+        "repositories:\n"
+        "  - mandeep/Travis-Encrypt\n"
+        "  - repo: mandeep/open-source\n"
+        "    private: false\n"
+        "    token: null\n"
+        "  - repo: mandeep/other\n"
+        "    token: other-token\n"
+        "  - mandeep/Travis-Encrypt\n"
+    )
+
+    specs = repository_specs(read_manifest(str(path)), token="cli-token")
+
+    assert specs == [
+        RepositorySpec("mandeep/Travis-Encrypt", True, "com-token"),
+        RepositorySpec("mandeep/open-source", False, None),
+        RepositorySpec("mandeep/other", True, "other-token"),
+    ]
+
+
+def test_repository_specs_list():
+    """Test that a plain list of repositories uses the given defaults."""
+    specs = repository_specs(["mandeep/Travis-Encrypt"], private=True, token="token")
+
+    assert specs == [RepositorySpec("mandeep/Travis-Encrypt", True, "token")]
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"repositories": "mandeep/Travis-Encrypt"},
+        ["mandeep"],
+        [{"repo": "mandeep/Travis-Encrypt", "endpoint": "com"}],
+        [{"repo": "mandeep/Travis-Encrypt", "token_env": "TRAVIS_UNSET_TOKEN"}],
+        {"defaults": ["private"], "repositories": []},
+    ],
+)
+def test_repository_specs_invalid(data, monkeypatch):
+    """Test that malformed entries and unset token variables are rejected."""
+    monkeypatch.delenv("TRAVIS_UNSET_TOKEN", raising=False)
+
+    with pytest.raises(ManifestError):
+        repository_specs(data)
@@ -0,0 +1,133 @@
+"""Test the metrics module of Travis Encrypt.
+
+Test functions:
+test_metrics_disabled -- test that nothing is counted unless metrics are enabled
+test_retrieval_metrics -- test the key, cache and HTTP counters of retrieve_public_key
+test_encryption_metrics -- test the encryption, parsed key and file counters
+test_latency_histograms -- test that spans are observed in cumulative buckets
+test_write_metrics -- test writing JSON and Prometheus textfiles
+"""
+
+import json
+
+import mock
+import pytest
+
+from travis.cache import KeyCache
+from travis.config import write_file
+from travis.encrypt import encrypt_key, encrypt_many, retrieve_public_key
+from travis.metrics import (
+    enable_metrics,
+    increment,
+    metrics_snapshot,
+    reset_metrics,
+    write_metrics,
+)
+from travis.timing import span
+
+
+@pytest.fixture
+def metrics():
+    """Enable metrics for the test and return a function returning the counters."""
+    reset_metrics()
+    enable_metrics()
+    yield lambda: metrics_snapshot()["counters"]
+    enable_metrics(False)
+    reset_metrics()
+
+
+def api_session(status_code=200, payload=None):
+    """Build a mock session whose get method returns a Travis API response."""
+    response = mock.Mock(status_code=status_code, headers={})
+    response.json.return_value = payload
+    session = mock.Mock()
+    session.get.return_value = response
+    return session
+
+
+def test_metrics_disabled():
+    """Test that counters and spans are ignored while metrics are disabled."""
+    reset_metrics()
+    increment("encryptions")
+    with span("encrypt"):
+        pass
+
+    snapshot = metrics_snapshot()
+    assert snapshot["counters"]["encryptions"] == 0
+    assert not snapshot["histograms"]
+
+
+def test_retrieval_metrics(tmpdir, public_key, metrics):
+    """Test that fetches, cache hits and misses and HTTP statuses are counted."""
+    cache = KeyCache(str(tmpdir))
+    session = api_session(payload={"key": public_key})
+
+    for _ in range(3):
+        retrieve_public_key("mandeep/Travis-Encrypt", cache=cache, session=session)
+
+    counters = metrics()
+    assert counters["key_fetches"] == 3
+    assert counters["key_cache_hits"] == 2
+    assert counters["key_cache_misses"] == 1
+    assert counters["http_responses"] == [{"labels": {"status": "200"}, "value": 1}]
+
+
+def test_encryption_metrics(tmpdir, public_key, metrics):
+    """Test that encryptions, their errors and written bytes are counted."""
+    encrypt_key(public_key, b"password")
+    encrypt_many(public_key, [("A", "a"), ("B", "b" * 1000)])
+    path = str(tmpdir.join(".travis.yml"))
+    write_file(path, "language: python\n")
+    write_file(path, "language: python\n")
+
+    counters = metrics()
+    assert counters["encryptions"] == 2
+    assert counters["encryption_errors"] == 1
+    assert counters["parsed_key_cache_hits"] + counters["parsed_key_cache_misses"] == 2
+    assert counters["files_written"] == 1
+    assert counters["files_unchanged"] == 1
+    assert counters["bytes_written"] == len("language: python\n")
+
+
+def test_latency_histograms(metrics):
+    """Test that span durations fill cumulative buckets per phase."""
+    clock = iter([0.0, 0.002, 1.0, 1.3])
+    with mock.patch("travis.timing.monotonic", lambda: next(clock)):
+        with span("key.http"):
+            pass
+        with span("key.http"):
+            pass
+
+    histogram = metrics_snapshot()["histograms"]["key.http"]
+    assert histogram["count"] == 2
+    assert histogram["sum"] == pytest.approx(0.302)
+    assert histogram["buckets"]["0.001"] == 0
+    assert histogram["buckets"]["0.0025"] == 1
+    assert histogram["buckets"]["0.25"] == 1
+    assert histogram["buckets"]["0.5"] == 2
+    assert histogram["buckets"]["+Inf"] == 2
+
+
+def test_write_metrics(tmpdir, metrics):
+    """Test that the format follows the extension and writing is not counted."""
+    increment("http_responses", status="429")
+    increment("http_responses", 2, status="200")
+    json_path = str(tmpdir.join("metrics.json"))
+    prom_path = str(tmpdir.join("metrics.prom"))
+
+    write_metrics(json_path)
+    write_metrics(prom_path)
+
+    with open(json_path) as json_file:
+        written = json.load(json_file)
+    assert written["counters"]["files_written"] == 0
+    assert written["counters"]["http_responses"][0] == {
+        "labels": {"status": "200"},
+        "value": 2,
+    }
+    with open(prom_path) as prom_file:
+        lines = prom_file.read().splitlines()
+    assert "# TYPE travis_encrypt_http_responses_total counter" in lines
+    assert 'travis_encrypt_http_responses_total{status="429"} 1' in lines
+    assert "travis_encrypt_files_written_total 0" in lines
+    assert metrics()["files_written"] == 0
@@ -0,0 +1,60 @@
+"""Test the orderer module of Travis Encrypt.
+
+Test functions:
+test_ordered_round_trip -- test that key order survives a load and dump
+test_ordered_classes_cached -- test that the loader and dumper classes are built once
+test_backends_identical -- test that the libyaml and pure Python backends agree
+"""
+from collections import OrderedDict
+
+import yaml
+
+from travis import orderer
+from travis.orderer import ordered_dump, ordered_load
+
+CONFIGURATION = """\
+language: python
+dist: xenial
+env:
+  global:
+  - secure: abc+/=
+  - DEBUG=1
+deploy:
+  provider: pypi
+  password:
+    secure: def
+"""
+
+
+def test_ordered_round_trip():
+    """Test that mappings load as OrderedDicts and dump in the same order."""
+    config = ordered_load(CONFIGURATION)
+
+    assert isinstance(config["deploy"], OrderedDict)
+    assert list(config) == ["language", "dist", "env", "deploy"]
+    assert ordered_dump(config, default_flow_style=False) == CONFIGURATION
+
+
+def test_ordered_classes_cached():
+    """Test that repeated calls reuse the loader and dumper classes."""
+    ordered_load(CONFIGURATION, Loader=yaml.SafeLoader)
+    ordered_dump({}, Dumper=yaml.SafeDumper)
+    loaders, dumpers = len(orderer._loaders), len(orderer._dumpers)
+
+    for _ in range(3):
+        ordered_load(CONFIGURATION)
+        ordered_load(CONFIGURATION, Loader=yaml.SafeLoader)
+        ordered_dump({}, Dumper=yaml.SafeDumper)
+
+    assert (len(orderer._loaders), len(orderer._dumpers)) == (loaders, dumpers)
+
+
+def test_backends_identical():
+    """Test that the pure Python backend loads and dumps like the default backend."""
+    fast = ordered_load(CONFIGURATION)
+    pure = ordered_load(CONFIGURATION, Loader=yaml.SafeLoader)
+
+    assert fast == pure
+    assert ordered_dump(fast, default_flow_style=False) == ordered_dump(
+        pure, Dumper=yaml.SafeDumper, default_flow_style=False
+    )
@@ -0,0 +1,120 @@
+"""Test the patcher module of Travis Encrypt.
+
+Test functions:
+test_patch_scalars -- test that only the targeted scalars change
+test_patch_scalars_sequence_wildcard -- test patching every secure item of a list
+test_patch_scalars_missing -- test the NodeNotFoundError for missing and block scalars
+test_patch_scalars_bom -- test patching a document starting with a byte order mark
+test_patch_scalars_not_in_place -- test that unpatchable scalars raise NodeNotFoundError
+test_render_scalar -- test quoting of replacement values
+"""
+import pytest
+import yaml
+
+from travis.config import ConfigFile
+from travis.orderer import ordered_load
+from travis.patcher import (
+    NodeNotFoundError,
+    patch_scalars,
+    render_scalar,
+)
+
+CONFIGURATION = """\
+# Deployment configuration
+language: python  # the language
+deploy: &deploy
+  provider: pypi
+  password:
+    secure: "OLD_DEPLOY"
+env:
+  global:
+    - DEBUG=1
+    - secure: 'OLD_ENV'
+    - {secure: OLD_FLOW}
+    - API_KEY:
+        secure: OLD_API_KEY
+notes: |
+  multi line
+staging: *deploy
+"""
+
+
+def test_patch_scalars():
+    """Test that comments, anchors and formatting survive a patch."""
+    patched = patch_scalars(
+        CONFIGURATION,
+        {
+            ("deploy", "password", "secure"): "NEW+/DEPLOY==",
+            ("env", "global", 3, "API_KEY", "secure"): "NEW_API_KEY",
+        },
+    )
+
+    assert patched == CONFIGURATION.replace('"OLD_DEPLOY"', '"NEW+/DEPLOY=="').replace(
+        "OLD_API_KEY", "NEW_API_KEY"
+    )
+    config = ordered_load(patched)
+    assert config["staging"]["password"]["secure"] == "NEW+/DEPLOY=="
+
+
+def test_patch_scalars_sequence_wildcard():
+    """Test that a None index patches the secure value of every list item."""
+    patched = patch_scalars(CONFIGURATION, {("env", "global", None, "secure"): "NEW"})
+
+    assert "- secure: 'NEW'" in patched
+    assert "- {secure: NEW}" in patched
+    assert "secure: OLD_API_KEY" in patched
+
+
+def test_patch_scalars_missing():
+    """Test that paths without a patchable scalar raise NodeNotFoundError."""
+    with pytest.raises(NodeNotFoundError):
+        patch_scalars(CONFIGURATION, {("password", "secure"): "NEW"})
+    with pytest.raises(NodeNotFoundError):
+        patch_scalars(CONFIGURATION, {("notes",): "NEW"})
+    with pytest.raises(NodeNotFoundError):
+        patch_scalars("", {("password", "secure"): "NEW"})
+
+
+@pytest.mark.parametrize("Loader", [None, yaml.SafeLoader])
+def test_patch_scalars_bom(Loader):
+    """Test that a byte order mark is kept and does not shift the patched ranges."""
+    text = u"\ufeff" + CONFIGURATION
+    replacements = {("env", "global", 3, "API_KEY", "secure"): "NEW_API_KEY"}
+    if Loader is None:
+        patched = patch_scalars(text, replacements)
+    else:
+        patched = patch_scalars(text, replacements, Loader)
+
+    assert patched == text.replace("OLD_API_KEY", "NEW_API_KEY")
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "deploy:\n  password:\n    secure:\n",
+        "deploy:\n  password:\n    secure: &pw OLD\nstaging: *pw\n",
+        "deploy:\n  password:\n    secure: !!str OLD\n",
+    ],
+)
+def test_patch_scalars_not_in_place(tmpdir, text):
+    """Test that scalars which cannot be replaced in place are dumped instead."""
+    with pytest.raises(NodeNotFoundError):
+        patch_scalars(text, {("deploy", "password", "secure"): "ABC+/="})
+
+    path = tmpdir.join("travis.yml")
+    path.write(text)
+    config_file = ConfigFile(str(path))
+    config_file.set_secure(("deploy", "password"), "ABC+/=")
+    config_file.flush()
+
+    assert ordered_load(path.read())["deploy"]["password"] == {"secure": "ABC+/="}
+
+
+def test_render_scalar():
+    """Test that values are only left unquoted when they load back as the same string."""
+    assert render_scalar("abc+/=", None) == "abc+/="
+    assert render_scalar("abc", "'") == "'abc'"
+    assert render_scalar("abc", '"') == '"abc"'
+    assert render_scalar("12345", None) == '"12345"'
+    assert render_scalar("true", None) == '"true"'
+    assert render_scalar("a: b", None) == '"a: b"'
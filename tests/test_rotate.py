@@ -0,0 +1,132 @@
+"""Test the rotate module of Travis Encrypt.
+
+Test functions:
+test_plan_rotation -- test grouping targets by file and deduplicating repositories
+test_plan_rotation_conflicts -- test that conflicting targets raise ManifestError
+test_read_values -- test reading plaintext from a .env file and the environment
+test_apply_rotation -- test encrypting a plan into its files
+test_apply_rotation_invalid_files -- test that unusable files are reported per file
+"""
+import base64
+
+from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
+import mock
+import pytest
+
+from travis.encrypt import InvalidCredentialsError
+from travis.manifest import ManifestError, RepositorySpec, RotationTarget
+from travis.orderer import ordered_dump, ordered_load
+from travis.rotate import apply_rotation, plan_rotation, read_values
+
+
+def target(user_repo, paths, variables, token=None):
+    """Return a RotationTarget of a public repository."""
+    return RotationTarget(RepositorySpec(user_repo, False, token), paths, variables)
+
+
+def test_plan_rotation():
+    """Test that files collect the variables of every target naming them."""
+    plan = plan_rotation(
+        [
+            target("mandeep/a", ["a.yml", "shared.yml"], ["API_KEY"]),
+            target("mandeep/b", ["b.yml"], ["API_KEY"]),
+            target("mandeep/a", ["shared.yml"], ["TOKEN", "API_KEY"]),
+        ]
+    )
+
+    assert list(plan.specs) == ["mandeep/a", "mandeep/b"]
+    assert list(plan.files.items()) == [
+        ("a.yml", ("mandeep/a", ["API_KEY"])),
+        ("shared.yml", ("mandeep/a", ["API_KEY", "TOKEN"])),
+        ("b.yml", ("mandeep/b", ["API_KEY"])),
+    ]
+
+
+@pytest.mark.parametrize(
+    "targets",
+    [
+        [target("mandeep/a", ["a.yml"], ["A"]), target("mandeep/b", ["a.yml"], ["B"])],
+        [
+            target("mandeep/a", ["a.yml"], ["A"]),
+            target("mandeep/a", ["b.yml"], ["B"], token="token"),
+        ],
+    ],
+)
+def test_plan_rotation_conflicts(targets):
+    """Test that a file of two repositories or a repository of two settings fails."""
+    with pytest.raises(ManifestError):
+        plan_rotation(targets)
+
+
+def test_read_values(tmpdir, monkeypatch):
+    """Test that the .env file takes precedence over the environment."""
+    env_file = tmpdir.join("secrets.env")
+    env_file.write("API_KEY=from-file\n")
+    monkeypatch.setenv("API_KEY", "from-environment")
+    monkeypatch.setenv("TOKEN", "token")
+    monkeypatch.delenv("MISSING", raising=False)
+
+    values = read_values(["API_KEY", "TOKEN", "MISSING"], str(env_file))
+
+    assert values == {"API_KEY": "from-file", "TOKEN": "token"}
+
+
+def test_apply_rotation(tmpdir, rsa_private_key, public_key):
+    """Test that keys are retrieved once and every file is written once."""
+    paths = [str(tmpdir.join(name)) for name in ("a.yml", "b.yml", "c.yml")]
+    for path in paths:
+        with open(path, "w") as config_file:
+            ordered_dump({"language": "python"}, config_file)
+
+    def retrieve(user_repo, url, **kwargs):
+        if user_repo == "mandeep/missing":
+            raise InvalidCredentialsError("missing")
+        return public_key
+
+    plan = plan_rotation(
+        [
+            target("mandeep/a", paths[:2], ["API_KEY", "TOKEN"]),
+            target("mandeep/missing", paths[2:], ["API_KEY"]),
+        ]
+    )
+    with mock.patch(
+        "travis.rotate.retrieve_public_key", side_effect=retrieve
+    ) as patched, mock.patch(
+        "travis.config.write_file", return_value=True
+    ) as write_file:
+        results = apply_rotation(plan, {"API_KEY": "MY_PASSWORD"}, jobs=1)
+
+    assert patched.call_count == 2
+    assert [write[0][0] for write in write_file.call_args_list] == paths[:2]
+    config = ordered_load(write_file.call_args_list[0][0][1])
+    secure = config["env"]["global"]["API_KEY"]["secure"]
+    plaintext = rsa_private_key.decrypt(base64.b64decode(secure), PKCS1v15())
+    assert plaintext == b"MY_PASSWORD"
+
+    assert [result.encrypted for result in results] == [["API_KEY"], ["API_KEY"], []]
+    assert results[0].written
+    assert results[0].errors == [("TOKEN", "no value in the environment or env_file")]
+    assert results[2].errors == [(None, "public key unavailable: missing")]
+
+
+def test_apply_rotation_invalid_files(tmpdir, rsa_private_key, public_key):
+    """Test that files which cannot be parsed or updated do not stop the others."""
+    contents = ["key: [unclosed\n", "- a list\n", "language: python\n"]
+    paths = [str(tmpdir.join(name)) for name in ("a.yml", "b.yml", "c.yml")]
+    for path, text in zip(paths, contents):
+        with open(path, "w") as config_file:
+            config_file.write(text)
+
+    names = ["VARIABLE_{}".format(number) for number in range(5)]
+    plan = plan_rotation([target("mandeep/a", paths, names)])
+    with mock.patch("travis.rotate.retrieve_public_key", return_value=public_key):
+        results = apply_rotation(plan, dict((name, name) for name in names), jobs=2)
+
+    assert [result.written for result in results] == [False, False, True]
+    assert results[0].encrypted == [] and results[0].errors[0][0] is None
+    assert results[1].encrypted == [] and results[1].errors[0][0] is None
+    assert results[2].encrypted == names and results[2].errors == []
+    with open(paths[2]) as config_file:
+        secure = ordered_load(config_file)["env"]["global"]["VARIABLE_4"]["secure"]
+    plaintext = rsa_private_key.decrypt(base64.b64decode(secure), PKCS1v15())
+    assert plaintext == b"VARIABLE_4"
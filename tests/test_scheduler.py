@@ -0,0 +1,122 @@
+"""Test the scheduler module of Travis Encrypt.
+
+Test functions:
+test_token_bucket -- test that acquisitions beyond the burst are spaced out
+test_scheduler_retries_rate_limited -- test that a 429 response is retried after Retry-After
+test_scheduler_raises_rate_limited -- test the RateLimitedError once attempts run out
+test_scheduler_pauses_when_exhausted -- test pausing until X-RateLimit-Reset
+test_scheduler_exhausted_beyond_max_wait -- test that a long reset raises an error
+test_retrieve_public_key_rate_limited -- test that 429 is not reported as invalid credentials
+"""
+import mock
+import pytest
+
+from travis.encrypt import retrieve_public_key
+from travis.scheduler import RateLimitedError, RequestScheduler, TokenBucket
+
+
+class FakeClock(object):
+    """A clock that only advances when sleep is called."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def api_session(*responses):
+    """Build a mock session returning the (status_code, headers) responses in order."""
+    session = mock.Mock()
+    session.get.side_effect = [
+        mock.Mock(status_code=status_code, headers=headers)
+        for status_code, headers in responses
+    ]
+    return session
+
+
+def test_token_bucket():
+    """Test that a bucket of 2 tokens refilled at 4 per second spaces out requests."""
+    clock = FakeClock()
+    bucket = TokenBucket(4, 2, clock=clock, sleep=clock.sleep)
+
+    for _ in range(4):
+        bucket.acquire()
+
+    assert clock.sleeps == [0.25, 0.25]
+
+
+def test_scheduler_retries_rate_limited():
+    """Test that a rate limited request is sent again after the Retry-After delay."""
+    clock = FakeClock()
+    scheduler = RequestScheduler(rate=None, clock=clock, sleep=clock.sleep)
+    session = api_session((429, {"Retry-After": "3"}), (200, {}))
+
+    response = scheduler.get(session, "https://api.travis-ci.org/repos")
+
+    assert response.status_code == 200
+    assert session.get.call_count == 2
+    assert clock.sleeps == [3]
+
+
+def test_scheduler_raises_rate_limited():
+    """Test that RateLimitedError is raised when every attempt is rate limited."""
+    clock = FakeClock()
+    scheduler = RequestScheduler(rate=None, attempts=2, clock=clock, sleep=clock.sleep)
+    session = api_session((429, {}), (429, {"Retry-After": "7"}))
+
+    with pytest.raises(RateLimitedError) as error:
+        scheduler.get(session, "https://api.travis-ci.org/repos")
+
+    assert error.value.retry_after == 7
+    assert clock.sleeps == [1]
+
+
+def test_scheduler_pauses_when_exhausted():
+    """Test that the next request waits for the reset once no requests remain."""
+    clock = FakeClock()
+    scheduler = RequestScheduler(rate=None, clock=clock, sleep=clock.sleep)
+    session = api_session(
+        (200, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "1005"}), (200, {})
+    )
+
+    with mock.patch("travis.scheduler.time.time", return_value=1000):
+        scheduler.get(session, "https://api.travis-ci.org/repos")
+        scheduler.get(session, "https://api.travis-ci.org/repos")
+
+    assert clock.sleeps == [5]
+
+
+def test_scheduler_exhausted_beyond_max_wait():
+    """Test that requests during a pause beyond max_wait fail instead of waiting."""
+    clock = FakeClock()
+    scheduler = RequestScheduler(rate=None, max_wait=60, clock=clock, sleep=clock.sleep)
+    session = api_session(
+        (200, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "4600"}), (200, {})
+    )
+
+    with mock.patch("travis.scheduler.time.time", return_value=1000):
+        assert scheduler.get(session, "https://api.travis-ci.org/repos")
+        with pytest.raises(RateLimitedError) as error:
+            scheduler.get(session, "https://api.travis-ci.org/repos")
+
+    assert error.value.retry_after == 3600
+    assert session.get.call_count == 1
+    assert clock.sleeps == []
+
+
+def test_retrieve_public_key_rate_limited():
+    """Test that retrieve_public_key raises RateLimitedError for a 429 response."""
+    clock = FakeClock()
+    scheduler = RequestScheduler(rate=None, attempts=1, clock=clock, sleep=clock.sleep)
+    session = api_session((429, {"Retry-After": "30"}))
+
+    with pytest.raises(RateLimitedError):
+        retrieve_public_key(
+            "mandeep/Travis-Encrypt", session=session, scheduler=scheduler
+        )
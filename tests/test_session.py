@@ -0,0 +1,64 @@
+"""Test the session module of Travis Encrypt.
+
+Test functions:
+test_create_session -- test the connection pool, timeout and retry settings
+test_session_default_timeout -- test that requests receive the default timeout
+test_configure_session -- test replacing the shared session
+test_retrieve_public_key_server_error -- test that a 5xx is not a bad repository error
+"""
+import mock
+import pytest
+from requests.exceptions import HTTPError
+
+from travis import session as travis_session
+from travis.encrypt import retrieve_public_key
+
+
+def test_create_session():
+    """Test that the adapter pools connections and retries 5xx responses."""
+    session = travis_session.create_session(
+        pool_size=4, connect_timeout=1, read_timeout=2, retries=5, backoff_factor=0.1
+    )
+    adapter = session.get_adapter("https://api.travis-ci.org")
+
+    assert session.timeout == (1, 2)
+    assert adapter._pool_maxsize == 4
+    assert adapter.max_retries.total == 5
+    assert adapter.max_retries.backoff_factor == 0.1
+    assert adapter.max_retries.respect_retry_after_header
+    assert 503 in adapter.max_retries.status_forcelist
+
+
+def test_session_default_timeout():
+    """Test that the session timeout is used unless a request overrides it."""
+    session = travis_session.create_session(connect_timeout=1, read_timeout=2)
+
+    with mock.patch("requests.Session.request") as request:
+        session.get("https://api.travis-ci.org/repos")
+        session.get("https://api.travis-ci.org/repos", timeout=9)
+
+    assert request.call_args_list[0][1]["timeout"] == (1, 2)
+    assert request.call_args_list[1][1]["timeout"] == 9
+
+
+def test_configure_session():
+    """Test that configure_session replaces the shared session on its next use."""
+    previous = travis_session.get_session()
+    travis_session.configure_session(retries=0)
+    session = travis_session.get_session()
+
+    assert travis_session.get_session() is session
+    assert session is not previous
+    assert session.get_adapter("https://").max_retries.total == 0
+    travis_session.configure_session()
+
+
+def test_retrieve_public_key_server_error():
+    """Test that a server error left after the retries raises HTTPError."""
+    response = mock.Mock(status_code=503, headers={})
+    response.json.return_value = {"error": "Service Unavailable"}
+    session = mock.Mock()
+    session.get.return_value = response
+
+    with pytest.raises(HTTPError, match="HTTP 503"):
+        retrieve_public_key("mandeep/Travis-Encrypt", session=session)
@@ -0,0 +1,159 @@
+"""Test the stream module of Travis Encrypt.
+
+Test functions:
+test_encrypt_stream -- test encrypting NDJSON records in input order
+test_encrypt_stream_concurrent -- test encrypting NDJSON records with many workers
+test_encrypt_stream_interactive -- test answering a caller that waits for each result
+test_encrypt_stream_errors -- test that invalid records are reported in band
+test_key_lookup -- test that public keys are retrieved once per repository
+test_key_lookup_ttl -- test that memoized public keys expire
+"""
+import base64
+import json
+import threading
+
+from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
+import mock
+
+from travis.encrypt import InvalidCredentialsError
+from travis.stream import encrypt_stream, KeyLookup
+
+
+def records(count):
+    """Return count NDJSON lines for two repositories."""
+    return [
+        json.dumps(
+            {
+                "repo": "mandeep/Travis-Encrypt-{}".format(number % 2),
+                "name": "VARIABLE_{}".format(number),
+                "value": "value-{}".format(number),
+            }
+        )
+        + "\n"
+        for number in range(count)
+    ]
+
+
+def test_encrypt_stream(rsa_private_key, public_key):
+    """Test that every record is encrypted and results keep the input order."""
+    results = list(encrypt_stream(records(3) + ["\n"], lambda user_repo: public_key))
+
+    assert [result["name"] for result in results] == [
+        "VARIABLE_0",
+        "VARIABLE_1",
+        "VARIABLE_2",
+    ]
+    assert results[1]["repo"] == "mandeep/Travis-Encrypt-1"
+    assert "value" not in results[1]
+    plaintext = rsa_private_key.decrypt(
+        base64.b64decode(results[1]["secure"]), PKCS1v15()
+    )
+    assert plaintext == b"value-1"
+
+
+def test_encrypt_stream_concurrent(public_key):
+    """Test that every record is yielded exactly once with many workers."""
+    results = list(
+        encrypt_stream(records(50), lambda user_repo: public_key, concurrency=4)
+    )
+
+    assert sorted(result["name"] for result in results) == sorted(
+        "VARIABLE_{}".format(number) for number in range(50)
+    )
+    assert all("secure" in result for result in results)
+
+
+def test_encrypt_stream_interactive(public_key):
+    """Test that each result is yielded before the next line arrives."""
+    answered = threading.Event()
+    waits = []
+
+    def lines():
+        for line in records(3):
+            answered.clear()
+            yield line
+            waits.append(answered.wait(10))
+
+    results = []
+    for result in encrypt_stream(lines(), lambda user_repo: public_key, concurrency=4):
+        results.append(result)
+        answered.set()
+
+    assert len(results) == 3
+    assert waits == [True, True, True]
+
+
+def test_encrypt_stream_errors(public_key):
+    """Test that invalid records and missing keys become error records.
+
+    Every result carries its input line, and the repo and name that could be
+    parsed, so that failures can be told apart in completion order."""
+
+    def get_key(user_repo):
+        if user_repo == "mandeep/missing":
+            raise InvalidCredentialsError("Please enter a valid user/repository name.")
+        return public_key
+
+    lines = [
+        "not json\n",
+        json.dumps({"repo": "mandeep/Travis-Encrypt", "name": "NO_VALUE"}),
+        json.dumps({"repo": "mandeep/missing", "name": "API_KEY", "value": "a"}),
+        json.dumps({"repo": "mandeep", "name": "API_KEY", "value": "a"}),
+        json.dumps({"repo": "mandeep/Travis-Encrypt", "name": "API_KEY", "value": "a"}),
+    ]
+    results = list(encrypt_stream(lines, get_key, concurrency=4))
+    results.sort(key=lambda result: result["line"])
+
+    assert list(results[0]) == ["line", "error"]
+    assert results[0]["error"].startswith("Invalid record")
+    assert list(results[1]) == ["line", "repo", "name", "error"]
+    assert results[1]["name"] == "NO_VALUE"
+    assert results[1]["error"].startswith("Invalid record")
+    assert results[2] == {
+        "line": 3,
+        "repo": "mandeep/missing",
+        "name": "API_KEY",
+        "error": "Please enter a valid user/repository name.",
+    }
+    assert "error" in results[3]
+    assert "secure" in results[4]
+
+
+def test_key_lookup(public_key):
+    """Test that keys are memoized, evicted when full and failures are retried."""
+    retrieve = mock.Mock(return_value=public_key)
+    lookup = KeyLookup(retrieve, maxsize=2)
+
+    assert lookup("mandeep/a") == public_key
+    lookup("mandeep/a")
+    lookup("mandeep/b")
+    lookup("mandeep/c")
+    lookup("mandeep/a")
+    assert [call[0][0] for call in retrieve.call_args_list] == [
+        "mandeep/a",
+        "mandeep/b",
+        "mandeep/c",
+        "mandeep/a",
+    ]
+
+    failing = KeyLookup(mock.Mock(side_effect=[InvalidCredentialsError, public_key]))
+    try:
+        failing("mandeep/a")
+    except InvalidCredentialsError:
+        pass
+    assert failing("mandeep/a") == public_key
+
+
+def test_key_lookup_ttl(public_key):
+    """Test that memoized keys are retrieved again once they expire."""
+    now = [0.0]
+    retrieve = mock.Mock(return_value=public_key)
+    lookup = KeyLookup(retrieve, ttl=60, clock=lambda: now[0])
+
+    lookup("mandeep/a")
+    now[0] = 59.0
+    lookup("mandeep/a")
+    assert retrieve.call_count == 1
+    now[0] = 120.0
+    lookup("mandeep/a")
+    assert retrieve.call_count == 2
@@ -0,0 +1,103 @@
+"""Test Travis Encrypt against the local stub of the Travis CI API.
+
+The stub in benchmarks.stub_server serves locally generated keys over HTTP,
+so these tests exercise the real HTTP path without touching the network.
+
+Fixtures:
+stub_api -- a running stub API that TRAVIS_ENCRYPT_API_URL points at
+
+Test functions:
+test_stub_retrieve_public_key -- test the legacy and v3 endpoints and revalidation
+test_stub_cli_ndjson -- test the --ndjson CLI mode end to end
+test_stub_cli_owner -- test encrypting for the repositories of an owner end to end
+"""
+
+import json
+
+from click.testing import CliRunner
+import pytest
+
+from benchmarks.stub_server import StubTravisAPI
+from travis.cache import KeyCache
+from travis.cli import cli
+from travis.discovery import iter_owner_repositories
+from travis.encrypt import endpoint_url, InvalidCredentialsError, retrieve_public_key
+
+
+@pytest.fixture
+def stub_api(monkeypatch):
+    """Serve the keys of two repositories and point the API URL at them."""
+    with StubTravisAPI(
+        repositories=["mandeep/Travis-Encrypt", "mandeep/other", "other/service"]
+    ) as stub:
+        monkeypatch.setenv("TRAVIS_ENCRYPT_API_URL", stub.url)
+        yield stub
+
+
+def test_stub_retrieve_public_key(stub_api, tmpdir):
+    """Test both endpoints, unknown repositories and 304 revalidation."""
+    user_repo = "mandeep/Travis-Encrypt"
+    key = stub_api.key(user_repo)
+    cache = KeyCache(str(tmpdir))
+
+    legacy = retrieve_public_key(user_repo, endpoint_url(user_repo), cache=cache)
+    v3 = retrieve_public_key(
+        user_repo, endpoint_url(user_repo, token="token"), token="token"
+    )
+    assert legacy == v3 == key
+
+    requests = stub_api.requests
+    assert retrieve_public_key(user_repo, endpoint_url(user_repo), cache=cache) == key
+    assert stub_api.requests == requests
+    revalidated = retrieve_public_key(
+        user_repo, endpoint_url(user_repo), cache=cache, refresh=True
+    )
+    assert revalidated == key
+    assert stub_api.requests == requests + 1
+
+    with pytest.raises(InvalidCredentialsError):
+        retrieve_public_key("mandeep/missing", endpoint_url("mandeep/missing"))
+
+
+def test_stub_cli_ndjson(stub_api):
+    """Test that --ndjson retrieves each key from the stub once."""
+    records = [
+        {"repo": "mandeep/Travis-Encrypt", "name": "A", "value": "a"},
+        {"repo": "mandeep/other", "name": "B", "value": "b"},
+        {"repo": "mandeep/Travis-Encrypt", "name": "C", "value": "c"},
+    ]
+
+    result = CliRunner().invoke(
+        cli,
+        ["--ndjson", "--no-cache", "--concurrency=1"],
+        input="".join(json.dumps(record) + "\n" for record in records),
+    )
+
+    assert result.exit_code == 0
+    results = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [record["name"] for record in results] == ["A", "B", "C"]
+    assert all("secure" in record for record in results)
+    assert stub_api.requests == 2
+
+
+def test_stub_cli_owner(stub_api):
+    """Test that --owner lists the owner's repositories page by page and filters them."""
+    assert list(iter_owner_repositories("mandeep", "token", page_size=1)) == [
+        "mandeep/Travis-Encrypt",
+        "mandeep/other",
+    ]
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli,
+        [
+            "--owner=mandeep",
+            "--token=token",
+            "--exclude=Travis-*",
+            "--output=json",
+            "--password=SUPER_SECURE_PASSWORD",
+        ],
+    )
+
+    assert not result.exception
+    assert list(json.loads(result.stdout)) == ["mandeep/other"]
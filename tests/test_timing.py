@@ -0,0 +1,78 @@
+"""Test the timing module of Travis Encrypt.
+
+Test functions:
+test_span_disabled -- test that nothing is recorded unless timing is enabled
+test_timing_summary -- test the count, total and percentiles of each phase
+test_format_timings -- test rendering the summary as a table
+"""
+
+import mock
+import pytest
+
+from travis import timing
+from travis.timing import (
+    enable_timings,
+    format_timings,
+    PhaseTiming,
+    reset_timings,
+    span,
+    timing_summary,
+)
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    """Start every test with timing disabled and nothing recorded."""
+    reset_timings()
+    yield
+    enable_timings(False)
+    reset_timings()
+
+
+def test_span_disabled():
+    """Test that spans record nothing while timing is disabled."""
+    with span("encrypt"):
+        pass
+
+    assert timing_summary() == []
+
+
+def test_timing_summary():
+    """Test that each phase reports its count, total and percentiles in seconds."""
+    enable_timings()
+    clock = iter([0.0, 0.5, 1.0, 1.1] + [2.0, 2.2] * 18 + [3.0, 4.0])
+    with mock.patch.object(timing, "monotonic", lambda: next(clock)):
+        with span("key.http"):
+            with span("encrypt"):
+                pass
+        for _ in range(19):
+            with span("encrypt"):
+                pass
+
+    summary = timing_summary()
+    assert [entry.phase for entry in summary] == ["encrypt", "key.http"]
+    encrypt, http = summary
+    assert encrypt.count == 20
+    assert encrypt.total == pytest.approx(0.5 + 0.2 * 18 + 1.0)
+    assert encrypt.p50 == pytest.approx(0.2)
+    assert encrypt.p95 == pytest.approx(0.5)
+    assert http == PhaseTiming("key.http", 1, 1.1, 1.1, 1.1)
+
+
+def test_format_timings():
+    """Test that the table lists every phase with durations in milliseconds."""
+    lines = format_timings(
+        [PhaseTiming("yaml.load", 2, 0.003, 0.001, 0.002)]
+    ).splitlines()
+
+    assert lines[0].split() == [
+        "phase",
+        "count",
+        "total",
+        "ms",
+        "p50",
+        "ms",
+        "p95",
+        "ms",
+    ]
+    assert lines[1].split() == ["yaml.load", "2", "3.00", "1.000", "2.000"]
@@ -0,0 +1,149 @@
+"""Encrypt passwords and environment variables for use with Travis CI.
+
+The aio module contains asyncio counterparts of the functions found in
+the encrypt module so that event loop based services can retrieve keys and
+encrypt passwords without blocking the loop. Blocking work is delegated to
+an executor while an asyncio.Semaphore bounds how much of it is in flight,
+so thousands of repositories can be awaited together with a small, fixed
+number of threads. This module requires Python 3.5 or newer.
+
+Available functions:
+retrieve_public_key_async -- retrieve the public key without blocking the event loop
+retrieve_public_keys_async -- retrieve the public keys of many repositories
+encrypt_key_async -- encrypt a password without blocking the event loop
+encrypt_many_async -- encrypt a batch of named values without blocking the event loop
+"""
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import functools
+
+from requests.exceptions import RequestException
+
+from travis.encrypt import (
+    encrypt_key,
+    encrypt_many,
+    endpoint_url,
+    InvalidCredentialsError,
+    KeyResult,
+    RateLimitedError,
+    retrieve_public_key,
+)
+from travis.session import DEFAULT_POOL_SIZE
+
+
+async def _run(executor, semaphore, function, *args, **kwargs):
+    """Run the blocking function in the executor once the semaphore allows it."""
+    loop = asyncio.get_event_loop()
+    call = functools.partial(function, *args, **kwargs)
+
+    if semaphore is None:
+        return await loop.run_in_executor(executor, call)
+    async with semaphore:
+        return await loop.run_in_executor(executor, call)
+
+
+async def retrieve_public_key_async(
+    user_repo,
+    url="https://api.travis-ci.org/repos",
+    token=None,
+    semaphore=None,
+    executor=None,
+    **kwargs
+):
+    """Retrieve the public key from the Travis API without blocking the event loop.
+
+    Parameters
+    ----------
+    user_repo: str
+        the repository in the format of 'username/repository'
+    url: str
+        the API endpoint, see travis.encrypt.endpoint_url
+    token: str
+        a travis-ci token used to authenticate the API request
+    semaphore: asyncio.Semaphore
+        an optional semaphore bounding the number of requests in flight
+    executor: concurrent.futures.Executor
+        the executor the request runs in, the loop's default executor if None
+    kwargs:
+        the cache, refresh, session and scheduler arguments of retrieve_public_key
+
+    Returns
+    -------
+    response: str
+        the public RSA key of the username's repository
+    """
+    return await _run(
+        executor, semaphore, retrieve_public_key, user_repo, url, token=token, **kwargs
+    )
+
+
+async def retrieve_public_keys_async(
+    user_repos, private=False, token=None, concurrency=DEFAULT_POOL_SIZE, **kwargs
+):
+    """Retrieve the public keys of many repositories from within an event loop.
+
+    At most concurrency requests are in flight at any time and they share a
+    thread pool of the same size, whatever the number of repositories.
+
+    Parameters
+    ----------
+    user_repos: iterable
+        repositories in the format of 'username/repository'
+    private: bool
+        use the travis-ci.com endpoint for private repositories
+    token: str
+        a travis-ci token used to authenticate the API requests
+    concurrency: int
+        the number of keys retrieved at the same time
+    kwargs:
+        the cache, refresh, session and scheduler arguments of retrieve_public_key
+
+    Returns
+    -------
+    results: list
+        a KeyResult(user_repo, key, error) for every distinct repository in
+        input order; key is None when error holds the exception raised
+    """
+    user_repos = list(OrderedDict.fromkeys(user_repos))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def retrieve(user_repo):
+        try:
+            key = await retrieve_public_key_async(
+                user_repo,
+                endpoint_url(user_repo, private, token),
+                token=token,
+                semaphore=semaphore,
+                executor=executor,
+                **kwargs
+            )
+        except (InvalidCredentialsError, RateLimitedError, RequestException) as error:
+            return KeyResult(user_repo, None, error)
+        return KeyResult(user_repo, key, None)
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        return await asyncio.gather(*[retrieve(user_repo) for user_repo in user_repos])
+    finally:
+        # waiting for requests still running after a cancellation would block
+        # the event loop, so they finish in the background instead
+        executor.shutdown(wait=False)
+
+
+async def encrypt_key_async(key, password, semaphore=None, executor=None):
+    """Encrypt the password with the public key without blocking the event loop.
+
+    See travis.encrypt.encrypt_key for the parameters and return value.
+    """
+    return await _run(executor, semaphore, encrypt_key, key, password)
+
+
+async def encrypt_many_async(key, items, jobs=1, semaphore=None, executor=None):
+    """Encrypt many named values without blocking the event loop.
+
+    The whole batch is handed to the executor at once, so the public key is
+    loaded a single time. See travis.encrypt.encrypt_many for the parameters
+    and return value.
+    """
+    return await _run(executor, semaphore, encrypt_many, key, list(items), jobs=jobs)
@@ -0,0 +1,152 @@
+"""Encrypt passwords and environment variables for use with Travis CI.
+
+The cache module contains a persistent on-disk cache for the public keys
+retrieved from the Travis CI API. A repository's public key rarely changes,
+so caching it allows repeated runs to skip the network round trip entirely.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+DEFAULT_TTL = 24 * 60 * 60
+
+# os.replace overwrites an existing file on every platform but is Python 3 only
+replace_file = getattr(os, "replace", os.rename)
+
+
+def default_cache_directory():
+    """Return the directory where public keys are cached.
+
+    The TRAVIS_ENCRYPT_CACHE_DIR environment variable takes precedence,
+    followed by XDG_CACHE_HOME and finally ~/.cache.
+    """
+    directory = os.environ.get("TRAVIS_ENCRYPT_CACHE_DIR")
+    if directory:
+        return directory
+
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "travis-encrypt")
+
+
+class KeyCache(object):
+    """Cache public keys on disk keyed by the API URL they were retrieved from.
+
+    Keying by URL keeps keys from the .org, .com and v3 endpoints apart.
+    Each entry is stored as a small JSON file so that concurrent processes
+    never share a single file that needs to be rewritten as a whole. Writes
+    are best-effort: an unwritable directory, such as a read-only home in
+    CI, only means that keys are retrieved again next time.
+
+    Parameters
+    ----------
+    directory: str
+        the directory where entries are stored, see default_cache_directory
+    ttl: int
+        the number of seconds an entry is considered fresh
+    """
+
+    def __init__(self, directory=None, ttl=DEFAULT_TTL):
+        self.directory = directory or default_cache_directory()
+        self.ttl = ttl
+
+    def _entry_path(self, url):
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, "{}.json".format(digest))
+
+    def lookup(self, url):
+        """Return the cached entry for the url regardless of its age, or None."""
+        try:
+            with open(self._entry_path(url)) as entry_file:
+                entry = json.load(entry_file)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if entry.get("url") != url or "key" not in entry:
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        """Return True if the entry was stored less than ttl seconds ago."""
+        return time.time() - entry.get("fetched_at", 0) < self.ttl
+
+    def get(self, url):
+        """Return the cached public key for the url if it is still fresh."""
+        entry = self.lookup(url)
+        if entry is not None and self.is_fresh(entry):
+            return entry["key"]
+        return None
+
+    def set(self, url, key, etag=None, last_modified=None):
+        """Store the public key for the url along with its HTTP validators.
+
+        The ETag and Last-Modified response headers are kept so that a stale
+        entry can later be revalidated with a conditional request.
+        """
+        self._write(
+            {
+                "url": url,
+                "key": key,
+                "etag": etag,
+                "last_modified": last_modified,
+                "fetched_at": time.time(),
+            }
+        )
+
+    def touch(self, entry):
+        """Mark a revalidated entry as fresh again without changing its key."""
+        entry = dict(entry, fetched_at=time.time())
+        self._write(entry)
+        return entry
+
+    def _write(self, entry):
+        """Write the entry to a temporary file and rename it into place.
+
+        Readers therefore never observe a partially written entry. Returns
+        False when the entry could not be written.
+        """
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            if not os.path.isdir(self.directory):
+                return False
+
+        try:
+            descriptor, temporary_path = tempfile.mkstemp(
+                dir=self.directory, suffix=".tmp"
+            )
+        except (IOError, OSError):
+            return False
+        try:
+            with os.fdopen(descriptor, "w") as entry_file:
+                json.dump(entry, entry_file)
+            replace_file(temporary_path, self._entry_path(entry["url"]))
+        except (IOError, OSError):
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
+            return False
+        return True
+
+    def invalidate(self, url=None):
+        """Remove the entry for the url, or every entry when no url is given."""
+        if url is not None:
+            paths = [self._entry_path(url)]
+        elif os.path.isdir(self.directory):
+            paths = [
+                os.path.join(self.directory, name)
+                for name in os.listdir(self.directory)
+                if name.endswith(".json")
+            ]
+        else:
+            paths = []
+
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
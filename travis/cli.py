@@ -5,17 +5,43 @@ It imports functions found in Travis Encrypt's module in order to
 create the CLI.
 """
 from collections import OrderedDict
+import functools
+from itertools import chain
+import json
+import os
+import sys
 
 import click
-from dotenv import dotenv_values
-import pyperclip
 
-from travis.encrypt import (
-    retrieve_public_key,
-    encrypt_key,
-    load_travis_configuration,
-    dump_travis_configuration,
+from travis.cache import DEFAULT_TTL, KeyCache
+from travis.config import ConfigFile, EnvGlobalIndex
+from travis.scheduler import (
+    configure_scheduler,
+    DEFAULT_RATE,
+    monotonic,
+    RateLimitedError,
 )
+from travis.session import (
+    configure_session,
+    DEFAULT_POOL_SIZE,
+    DEFAULT_READ_TIMEOUT,
+    DEFAULT_RETRIES,
+)
+from travis.client import TravisEncryptor
+from travis.discovery import iter_owner_repositories
+from travis.encrypt import prefetch_public_keys, InvalidCredentialsError
+from travis.fingerprints import FingerprintStore
+from travis.keyfile import KeyFileError, load_key_file
+from travis.manifest import (
+    ManifestError,
+    read_manifest,
+    repository_specs,
+    rotation_targets,
+)
+from travis.metrics import enable_metrics, reset_metrics, write_metrics
+from travis.rotate import apply_rotation, plan_rotation, read_values
+from travis.stream import encrypt_stream
+from travis.timing import enable_timings, format_timings, reset_timings, span
 
 
 class NotRequiredIf(click.Option):
@@ -26,40 +52,206 @@ class NotRequiredIf(click.Option):
     def __init__(self, *args, **kwargs):
         self.not_required_if = kwargs.pop("not_required_if")
         assert self.not_required_if, "'not_required_if' parameter required"
+        if isinstance(self.not_required_if, str):
+            self.not_required_if = [self.not_required_if]
         kwargs["help"] = (
             kwargs.get("help", "")
-            + " Mutually exclusive with %s" % self.not_required_if
+            + " Mutually exclusive with %s" % ", ".join(self.not_required_if)
         ).strip()
         super(NotRequiredIf, self).__init__(*args, **kwargs)
 
     def handle_parse_result(self, ctx, opts, args):
         we_are_present = self.name in opts
-        other_present = self.not_required_if in opts
+        others_present = [name for name in self.not_required_if if name in opts]
 
-        if other_present:
-            if we_are_present:
-                raise click.UsageError(
-                    "Illegal usage: `%s` flag cannot be used with `%s` flag."
-                    % (self.name, self.not_required_if)
-                )
-            else:
-                self.prompt = None
+        if others_present and we_are_present:
+            raise click.UsageError(
+                "Illegal usage: `%s` flag cannot be used with `%s` flag."
+                % (self.name, others_present[0])
+            )
 
         return super(NotRequiredIf, self).handle_parse_result(ctx, opts, args)
 
 
-@click.command()
-@click.argument("username")
-@click.argument("repository")
+def validate_repository(ctx, param, value):
+    """Check that every --repo value is in the format of 'username/repository'."""
+    for user_repo in value:
+        if user_repo.count("/") != 1 or not all(user_repo.split("/")):
+            raise click.BadParameter(
+                "'{}' is not in the format of 'username/repository'".format(user_repo)
+            )
+    return value
+
+
+def read_repositories(path):
+    """Read 'username/repository' lines from a file, skipping blanks and # comments."""
+    with open(path) as repositories_file:
+        lines = [line.split("#", 1)[0].strip() for line in repositories_file]
+    return validate_repository(None, None, [line for line in lines if line])
+
+
+API_OPTIONS = [
+    click.option(
+        "--private",
+        is_flag=True,
+        help="Use the travis-ci.com API endpoint for private repositories",
+    ),
+    click.option(
+        "--token", help="Authenticate the API request with a travis-ci token."
+    ),
+    click.option(
+        "--refresh-key",
+        is_flag=True,
+        help="Revalidate the cached public key with the API even if it is fresh",
+    ),
+    click.option(
+        "--cache-ttl",
+        type=click.IntRange(min=0),
+        default=DEFAULT_TTL,
+        show_default=True,
+        help="Number of seconds a cached public key is considered fresh",
+    ),
+    click.option(
+        "--timeout",
+        type=click.FloatRange(min=0),
+        default=DEFAULT_READ_TIMEOUT,
+        show_default=True,
+        help="Seconds to wait for the Travis API to respond",
+    ),
+    click.option(
+        "--retries",
+        type=click.IntRange(min=0),
+        default=DEFAULT_RETRIES,
+        show_default=True,
+        help="Number of times a failed Travis API request is retried",
+    ),
+    click.option(
+        "--concurrency",
+        type=click.IntRange(min=1),
+        default=DEFAULT_POOL_SIZE,
+        show_default=True,
+        help="Number of public keys retrieved from the Travis API at the same time",
+    ),
+    click.option(
+        "--rate-limit",
+        type=click.FloatRange(min=0),
+        default=DEFAULT_RATE,
+        show_default=True,
+        help="Maximum number of Travis API requests per second, 0 disables the limit",
+    ),
+]
+
+
+def api_options(command):
+    """Add the options controlling Travis API requests to the command."""
+    for option in reversed(API_OPTIONS):
+        command = option(command)
+    return command
+
+
+def instrumented(command):
+    """Add the --timings, --profile and --metrics-file options to the command.
+
+    Timing and metrics are only switched on for the duration of the command,
+    so spans and counters cost next to nothing unless asked for. The summary,
+    the profile and the metrics are written even when the command fails.
+    """
+
+    @click.option(
+        "--timings",
+        is_flag=True,
+        help="Print the time spent in each phase to standard error",
+    )
+    @click.option(
+        "--profile",
+        "profile_path",
+        type=click.Path(dir_okay=False, writable=True),
+        metavar="PATH",
+        help="Write cProfile statistics of the run to PATH",
+    )
+    @click.option(
+        "--metrics-file",
+        type=click.Path(dir_okay=False, writable=True),
+        metavar="PATH",
+        help="Write counters and latency histograms to PATH, as JSON when it "
+        "ends in .json and in the Prometheus text format otherwise",
+    )
+    @functools.wraps(command)
+    def run(*args, **kwargs):
+        timings = kwargs.pop("timings")
+        profile_path = kwargs.pop("profile_path")
+        metrics_file = kwargs.pop("metrics_file")
+        if not timings and not profile_path and not metrics_file:
+            return command(*args, **kwargs)
+
+        profiler = None
+        if profile_path:
+            import cProfile
+
+            profiler = cProfile.Profile()
+
+        reset_timings()
+        enable_timings(timings)
+        reset_metrics()
+        enable_metrics(bool(metrics_file))
+        try:
+            if profiler is not None:
+                profiler.enable()
+            with span("command"):
+                return command(*args, **kwargs)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(profile_path)
+            enable_timings(False)
+            if timings:
+                click.echo(format_timings(), err=True)
+            if metrics_file:
+                write_metrics(metrics_file)
+                enable_metrics(False)
+
+    return run
+
+
+class DefaultGroup(click.Group):
+    """Invoke the default command when no subcommand is named.
+
+    This keeps `travis-encrypt USERNAME REPOSITORY` working next to the
+    subcommands. A username that equals the name of a subcommand can still be
+    encrypted for by naming the default command explicitly. A leading --help
+    shows the help of the group, which lists every command.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.default_command = kwargs.pop("default_command")
+        super(DefaultGroup, self).__init__(*args, **kwargs)
+
+    def parse_args(self, ctx, args):
+        if not args or (
+            args[0] not in self.commands and args[0] not in ctx.help_option_names
+        ):
+            args = [self.default_command] + list(args)
+        return super(DefaultGroup, self).parse_args(ctx, args)
+
+
+@click.group(cls=DefaultGroup, default_command="encrypt")
+def cli():
+    """Encrypt passwords and environment variables for use with Travis CI.
+
+    Without a command, the arguments are given to the encrypt command, as in
+    travis-encrypt USERNAME REPOSITORY.
+    """
+
+
+@cli.command("encrypt")
+@click.argument("username", required=False)
+@click.argument("repository", required=False)
 @click.argument("path", type=click.Path(exists=True), required=False)
 @click.option(
     "--password",
     cls=NotRequiredIf,
-    not_required_if="env_file",
-    prompt=True,
-    hide_input=True,
-    confirmation_prompt=False,
-    help="The password to be encrypted.",
+    not_required_if=["env_file", "ndjson", "serve"],
+    help="The password to be encrypted, prompted for when not given.",
 )
 @click.option("--deploy", is_flag=True, help="Write to .travis.yml for deployment")
 @click.option(
@@ -74,12 +266,89 @@ class NotRequiredIf(click.Option):
     help="Path for a .env file containing variables to encrypt",
 )
 @click.option(
-    "--private",
+    "--no-cache", is_flag=True, help="Do not read or write the on-disk public key cache"
+)
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=0),
+    default=1,
+    show_default=True,
+    help="Number of worker processes used to encrypt a .env file, 0 uses every core",
+)
+@click.option(
+    "--repo",
+    "repos",
+    multiple=True,
+    callback=validate_repository,
+    metavar="USERNAME/REPOSITORY",
+    help="Encrypt the password for this repository, may be given many times",
+)
+@click.option(
+    "--repos-file",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Path for a file listing one USERNAME/REPOSITORY per line",
+)
+@click.option(
+    "--owner",
+    help="Encrypt the password for every repository of this user or organization, "
+    "listed with the v3 API; requires --token",
+)
+@click.option(
+    "--include",
+    multiple=True,
+    metavar="PATTERN",
+    help="Only encrypt for --owner repositories whose name matches this wildcard, "
+    "may be given many times",
+)
+@click.option(
+    "--exclude",
+    multiple=True,
+    metavar="PATTERN",
+    help="Skip --owner repositories whose name matches this wildcard, may be given "
+    "many times",
+)
+@click.option(
+    "--output",
+    type=click.Choice(["table", "json"]),
+    default="table",
+    show_default=True,
+    help="Output format used when encrypting for many repositories",
+)
+@click.option(
+    "--fingerprints",
+    type=click.Path(dir_okay=False),
+    help="Sidecar file of plaintext fingerprints; unchanged .env variables keep "
+    "their existing ciphertext",
+)
+@click.option(
+    "--ndjson",
     is_flag=True,
-    help="Use the travis-ci.com API endpoint for private repositories",
+    help="Encrypt newline delimited JSON records read from standard input and "
+    "write the results to standard output",
+)
+@click.option(
+    "--serve",
+    type=click.Path(dir_okay=False),
+    metavar="SOCKET",
+    help="Run an encryption daemon that keeps public keys warm and serves "
+    "requests on this Unix socket",
+)
+@click.option(
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False),
+    metavar="SOCKET",
+    help="Encrypt through the daemon listening on this Unix socket",
 )
-@click.option("--token", help="Authenticate the API request with a travis-ci token.")
-def cli(
+@click.option(
+    "--key-file",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Encrypt offline with a PEM public key or a bundle of pinned keys by "
+    "USERNAME/REPOSITORY instead of retrieving keys from the Travis API",
+)
+@api_options
+@instrumented
+def encrypt(
     username,
     repository,
     path,
@@ -90,6 +359,25 @@ def cli(
     env_file,
     private,
     token,
+    no_cache,
+    refresh_key,
+    cache_ttl,
+    jobs,
+    timeout,
+    retries,
+    repos,
+    repos_file,
+    owner,
+    include,
+    exclude,
+    output,
+    concurrency,
+    rate_limit,
+    fingerprints,
+    ndjson,
+    serve,
+    socket_path,
+    key_file,
 ):
     """Encrypt passwords and environment variables for use with Travis CI.
 
@@ -98,73 +386,202 @@ def cli(
     to be encrypted. The given password will then be encrypted via the PKCS1v15 padding
     scheme and printed to standard output. If the path to a .travis.yml file
     is given as an argument, the encrypted password is added to the .travis.yml file.
+
+    Instead of a username and repository, many repositories can be given with
+    --repo or --repos-file. Their public keys are retrieved concurrently and the
+    password encrypted for each of them is printed as a table or as JSON.
+    The keys of many repositories can be cached ahead of time with the
+    prefetch command, see travis-encrypt prefetch --help.
+
+    With --owner and --token, the repositories of a user or organization are
+    listed page by page and their keys are retrieved as each page arrives.
+    --include and --exclude select repositories by name with wildcards.
+
+    With --ndjson, records of the form {"repo": ..., "name": ..., "value": ...}
+    are read from standard input and {"repo": ..., "name": ..., "secure": ...}
+    records are written to standard output as soon as each is encrypted.
+
+    With --serve, a daemon keeps public keys and API sessions warm and answers
+    the same records on a Unix socket. Passwords and --ndjson records are
+    encrypted through that daemon when --socket is given.
+
+    With --key-file, public keys are read from a local PEM file or a JSON or
+    YAML bundle of pinned keys and the Travis API is never contacted.
     """
-    if token:
-        url = "https://api.travis-ci.org/v3/repo/{}%2f{}/key_pair/generated".format(
-            username, repository
+    cache = None if no_cache else KeyCache(ttl=cache_ttl)
+    configure_session(pool_size=concurrency, read_timeout=timeout, retries=retries)
+    configure_scheduler(rate=rate_limit, burst=concurrency, concurrency=concurrency)
+
+    bundle = None
+    if key_file:
+        try:
+            bundle = load_key_file(key_file)
+        except KeyFileError as error:
+            raise click.ClickException(str(error))
+
+    if socket_path and (private or token):
+        raise click.UsageError(
+            "Illegal usage: --socket cannot be used with the --private and --token "
+            "flags, the daemon uses the endpoint it was started with."
         )
-        if private:
-            url = "https://api.travis-ci.com/v3/repo/{}%2f{}/key_pair/generated".format(
-                username, repository
+
+    if serve or ndjson:
+        if username or repos or repos_file or owner or env_file:
+            raise click.UsageError(
+                "Illegal usage: --serve and --ndjson cannot be used with USERNAME "
+                "REPOSITORY arguments or the --repo, --repos-file, --owner and "
+                "--env-file flags."
             )
+        encryptor = TravisEncryptor(
+            private, token, cache, refresh_key, bundle, ttl=cache_ttl if serve else None
+        )
+        if serve:
+            serve_requests(serve, encryptor.get_key)
+        else:
+            stream_records(encryptor.get_key, concurrency, socket_path, timeout)
+        return
 
-        key = retrieve_public_key(
-            "{}/{}".format(username, repository), url, token=token
+    if socket_path and (env_file or repos or repos_file or owner or key_file):
+        raise click.UsageError(
+            "Illegal usage: --socket cannot be used with the --repo, --repos-file, "
+            "--owner, --env-file and --key-file flags."
         )
 
-    else:
-        url = "https://api.travis-ci.org/repos"
-        if private:
-            url = "https://api.travis-ci.com/repos"
+    if (include or exclude) and not owner:
+        raise click.UsageError(
+            "Illegal usage: --include and --exclude require --owner."
+        )
+    if owner and not token:
+        raise click.UsageError(
+            "Illegal usage: --owner requires --token, as the v3 API only lists "
+            "the repositories of an owner to authenticated requests."
+        )
 
-        key = retrieve_public_key("{}/{}".format(username, repository), url)
+    if repos or repos_file or owner:
+        if username or env_file or deploy or env or clipboard:
+            raise click.UsageError(
+                "Illegal usage: --repo, --repos-file and --owner cannot be used with "
+                "USERNAME REPOSITORY PATH arguments or the --deploy, --env, "
+                "--clipboard and --env-file flags."
+            )
+    elif not username or not repository:
+        raise click.UsageError("Missing argument 'USERNAME' or 'REPOSITORY'.")
+
+    if fingerprints and not (env_file and path):
+        raise click.UsageError(
+            "Illegal usage: --fingerprints requires the --env-file flag and a PATH "
+            "to a .travis.yml file."
+        )
+
+    if repos_file:
+        repos += tuple(read_repositories(repos_file))
+
+    # prompted for only once the arguments are known to be valid
+    if password is None and not env_file:
+        password = click.prompt("Password", hide_input=True)
+
+    encryptor = TravisEncryptor(private, token, cache, refresh_key, bundle)
+
+    if repos or owner:
+        if owner:
+            user_repos = chain(
+                repos,
+                iter_owner_repositories(owner, token, private, include, exclude),
+            )
+            results = encryptor.iter_keys(user_repos, jobs=concurrency)
+        else:
+            results = encryptor.get_keys(repos, jobs=concurrency)
+        print_repository_passwords(encryptor, results, password, output)
+        return
+
+    user_repo = "{}/{}".format(username, repository)
+    if bundle is not None and not socket_path:
+        try:
+            encryptor.get_key(user_repo)
+        except InvalidCredentialsError as error:
+            raise click.ClickException(str(error))
 
     if env_file:
+        from dotenv import dotenv_values
+
+        variables = dotenv_values(env_file)
+        config_file = ConfigFile(path) if path else None
+        store = None
+
+        if path and fingerprints:
+            try:
+                store = FingerprintStore(fingerprints)
+            except ValueError as error:
+                raise click.ClickException(str(error))
+            key_fingerprint = encryptor.fingerprint(user_repo)
+            index = EnvGlobalIndex(config_file.load())
+            unchanged = [
+                env_var
+                for env_var, value in variables.items()
+                if has_secure_value(index.get(env_var))
+                and store.is_unchanged(env_var, value, key_fingerprint)
+            ]
+            for env_var in unchanged:
+                del variables[env_var]
+
+        if path:
+            results = encryptor.set_env_variables(
+                path, user_repo, variables.items(), jobs=jobs
+            )
+        else:
+            results = encryptor.encrypt_many(user_repo, variables.items(), jobs=jobs)
+        encrypted_variables = [result for result in results if result.error is None]
+
         if path:
-            config = load_travis_configuration(path)
-
-            for env_var, value in dotenv_values(env_file).items():
-                encrypted_env = encrypt_key(key, value.encode())
-                config.setdefault("env", {}).setdefault("global", {})[env_var] = {
-                    "secure": encrypted_env
-                }
-            dump_travis_configuration(config, path)
             print("Encrypted variables from {} added to {}".format(env_file, path))
+
+            if store is not None:
+                for env_var, _, _ in encrypted_variables:
+                    store.record(env_var, variables[env_var], key_fingerprint)
+                store.save()
+                if unchanged:
+                    print(
+                        "Skipped {} unchanged variables: {}".format(
+                            len(unchanged), ", ".join(unchanged)
+                        )
+                    )
         else:
             print("\nPlease add the following to your .travis.yml:")
-            for env_var, value in dotenv_values(env_file).items():
-                encrypted_env = encrypt_key(key, value.encode())
+            for env_var, encrypted_env, _ in encrypted_variables:
                 print("{}:\n  secure: {}".format(env_var, encrypted_env))
+
+        failures = [result for result in results if result.error is not None]
+        if failures:
+            raise click.ClickException(
+                "The following variables could not be encrypted: {}".format(
+                    ", ".join(
+                        "{} ({})".format(result.name, result.error)
+                        for result in failures
+                    )
+                )
+            )
     else:
-        encrypted_password = encrypt_key(key, password.encode())
+        if socket_path:
+            encrypted_password = encrypt_with_daemon(
+                socket_path, user_repo, password, timeout
+            )
+        else:
+            encrypted_password = encryptor.encrypt(user_repo, password)
 
         if path:
-            config = load_travis_configuration(path)
-            if config is None:
-                config = OrderedDict()
-
+            config_file = ConfigFile(path)
             if deploy:
-                config.setdefault("deploy", {}).setdefault("password", {})[
-                    "secure"
-                ] = encrypted_password
-
+                config_file.set_secure(("deploy", "password"), encrypted_password)
             elif env:
-                try:
-                    config.setdefault("env", {}).setdefault("global", {})[
-                        "secure"
-                    ] = encrypted_password
-                except TypeError:
-                    for item in config["env"]["global"]:
-                        if isinstance(item, dict) and "secure" in item:
-                            item["secure"] = encrypted_password
-
+                config_file.set_env_secure(encrypted_password)
             else:
-                config.setdefault("password", {})["secure"] = encrypted_password
-
-            dump_travis_configuration(config, path)
+                config_file.set_secure(("password",), encrypted_password)
+            config_file.flush()
 
             print("Encrypted password added to {}".format(path))
         elif clipboard:
+            import pyperclip
+
             pyperclip.copy(encrypted_password)
             print("\nThe encrypted password has been copied to your clipboard.")
         else:
@@ -173,3 +590,322 @@ def cli(
                     encrypted_password
                 )
             )
+
+
+@cli.command()
+@click.argument("manifest", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--output",
+    type=click.Choice(["table", "json"]),
+    default="table",
+    show_default=True,
+    help="Output format of the report",
+)
+@api_options
+@instrumented
+def prefetch(
+    manifest,
+    output,
+    private,
+    token,
+    refresh_key,
+    cache_ttl,
+    timeout,
+    retries,
+    concurrency,
+    rate_limit,
+):
+    """Cache the public keys of the repositories listed in MANIFEST.
+
+    MANIFEST is a YAML or JSON list of USERNAME/REPOSITORY entries, each of
+    which may set private, token or token_env; --private and --token apply to
+    the entries that do not. The keys are retrieved concurrently, checked to
+    parse and stored in the public key cache, so that encrypting for these
+    repositories afterwards does not touch the network. The fingerprint of
+    every key, or the reason it could not be retrieved, is reported along
+    with the time spent on it.
+    """
+    try:
+        specs = repository_specs(read_manifest(manifest), private, token)
+    except ManifestError as error:
+        raise click.ClickException(str(error))
+
+    configure_session(pool_size=concurrency, read_timeout=timeout, retries=retries)
+    configure_scheduler(rate=rate_limit, burst=concurrency, concurrency=concurrency)
+
+    start = monotonic()
+    results = prefetch_public_keys(
+        specs, KeyCache(ttl=cache_ttl), jobs=concurrency, refresh=refresh_key
+    )
+    elapsed = monotonic() - start
+
+    if output == "json":
+        rows = OrderedDict()
+        for user_repo, fingerprint, seconds, error in results:
+            row = {"seconds": round(seconds, 3)}
+            if error is None:
+                row["fingerprint"] = fingerprint
+            else:
+                row["error"] = str(error)
+            rows[user_repo] = row
+        print(json.dumps(rows, indent=2))
+    else:
+        width = max([len(result.user_repo) for result in results] or [0])
+        for user_repo, fingerprint, seconds, error in results:
+            print(
+                "{}  {:7.3f}s  {}".format(
+                    user_repo.ljust(width),
+                    seconds,
+                    fingerprint if error is None else "ERROR: {}".format(error),
+                )
+            )
+        print(
+            "Prefetched {} of {} public keys in {:.3f}s".format(
+                sum(result.error is None for result in results), len(results), elapsed
+            )
+        )
+
+    failures = [result.user_repo for result in results if result.error is not None]
+    if failures:
+        raise click.ClickException(
+            "The public key could not be prefetched for: {}".format(", ".join(failures))
+        )
+
+
+@cli.command()
+@click.argument("manifest", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    help="Print the plan without retrieving keys or writing files",
+)
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=0),
+    default=1,
+    show_default=True,
+    help="Number of worker processes encrypting values, 0 uses every core",
+)
+@click.option(
+    "--no-cache", is_flag=True, help="Do not read or write the on-disk public key cache"
+)
+@api_options
+@instrumented
+def rotate(
+    manifest,
+    dry_run,
+    jobs,
+    no_cache,
+    private,
+    token,
+    refresh_key,
+    cache_ttl,
+    timeout,
+    retries,
+    concurrency,
+    rate_limit,
+):
+    """Encrypt the variables of a rotation MANIFEST into .travis.yml files.
+
+    MANIFEST lists targets, each naming a repository, its .travis.yml files
+    and the env.global variables to encrypt into them. The plaintext of every
+    variable is read from the env_file of the manifest or the environment.
+    Every public key is retrieved once, all values are encrypted together and
+    every file is written once.
+    """
+    try:
+        data = read_manifest(manifest)
+        targets = rotation_targets(data, os.path.dirname(manifest), private, token)
+        plan = plan_rotation(targets)
+    except ManifestError as error:
+        raise click.ClickException(str(error))
+
+    env_file = data.get("env_file")
+    if env_file:
+        env_file = os.path.join(os.path.dirname(manifest), env_file)
+    values = read_values(
+        set(name for _, names in plan.files.values() for name in names), env_file
+    )
+
+    if dry_run:
+        width = max([len(path) for path in plan.files] or [0])
+        for path, (user_repo, names) in plan.files.items():
+            missing = [name for name in names if name not in values]
+            print(
+                "{}  {}  {}{}".format(
+                    path.ljust(width),
+                    user_repo,
+                    ", ".join(names),
+                    "  (missing: {})".format(", ".join(missing)) if missing else "",
+                )
+            )
+        print(
+            "{} public keys to retrieve, {} files to update, {} values to "
+            "encrypt".format(
+                len(plan.specs),
+                len(plan.files),
+                sum(len(names) for _, names in plan.files.values()),
+            )
+        )
+        return
+
+    configure_session(pool_size=concurrency, read_timeout=timeout, retries=retries)
+    configure_scheduler(rate=rate_limit, burst=concurrency, concurrency=concurrency)
+
+    results = apply_rotation(
+        plan,
+        values,
+        cache=None if no_cache else KeyCache(ttl=cache_ttl),
+        refresh=refresh_key,
+        concurrency=concurrency,
+        jobs=jobs,
+    )
+
+    failures = 0
+    for path, user_repo, encrypted, written, errors in results:
+        if encrypted:
+            print(
+                "{} {}: {}".format(
+                    "Updated" if written else "Unchanged", path, ", ".join(encrypted)
+                )
+            )
+        for name, message in errors:
+            failures += 1
+            print(
+                "Failed {}{}: {}".format(
+                    path, " {}".format(name) if name else "", message
+                )
+            )
+
+    if failures:
+        raise click.ClickException(
+            "{} updates of the rotation could not be applied".format(failures)
+        )
+
+
+def has_secure_value(entry):
+    """Return True if an env.global entry holds an encrypted value."""
+    return isinstance(entry, dict) and bool(entry.get("secure"))
+
+
+def stream_records(get_key, concurrency, socket_path=None, timeout=None):
+    """Encrypt the NDJSON records on standard input and write the results.
+
+    Each result is flushed as soon as it is written so that downstream
+    consumers of the pipeline see it immediately. The command exits with a
+    non-zero status once the input is exhausted if any record failed.
+    """
+    stdin, stdout = sys.stdin, sys.stdout
+
+    if socket_path:
+        from travis.daemon import DaemonClient, DaemonError
+
+        try:
+            with DaemonClient(socket_path, timeout) as client:
+                failures = write_records(client.stream(stdin), stdout)
+        except DaemonError as error:
+            raise click.ClickException(str(error))
+    else:
+        failures = write_records(encrypt_stream(stdin, get_key, concurrency), stdout)
+
+    if failures:
+        raise click.ClickException("{} records could not be encrypted".format(failures))
+
+
+def write_records(results, stream):
+    """Write and flush every result record, returning the number of failures."""
+    failures = 0
+    for result in results:
+        failures += "error" in result
+        stream.write(json.dumps(result) + "\n")
+        stream.flush()
+    return failures
+
+
+def serve_requests(path, get_key):
+    """Serve encryption requests on the Unix socket until interrupted."""
+    from travis.daemon import DaemonError, EncryptionServer
+
+    try:
+        server = EncryptionServer(path, get_key)
+    except DaemonError as error:
+        raise click.ClickException(str(error))
+    click.echo("Serving encryption requests on {}".format(path), err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def encrypt_with_daemon(path, user_repo, password, timeout):
+    """Encrypt the password through the daemon listening on the Unix socket."""
+    from travis.daemon import DaemonClient, DaemonError
+
+    try:
+        with DaemonClient(path, timeout) as client:
+            return client.encrypt(user_repo, "password", password)
+    except DaemonError as error:
+        raise click.ClickException(str(error))
+
+
+def print_repository_passwords(encryptor, results, password, output):
+    """Encrypt the password with each retrieved key and print the results.
+
+    Repositories whose key could not be retrieved or whose key is too short
+    for the password are reported and make the command exit with a non-zero
+    status once every result has been printed.
+    Each password is encrypted as soon as its result arrives, so results may
+    be a generator still retrieving the remaining keys. When such a generator
+    fails, for instance while listing the repositories of an owner, the rows
+    gathered so far are printed before the error is reported.
+    """
+    from requests.exceptions import RequestException
+
+    rows = OrderedDict()
+    listing_error = None
+    try:
+        for user_repo, _, error in results:
+            if error is None:
+                try:
+                    secure = encryptor.encrypt(user_repo, password)
+                    rows[user_repo] = {"secure": secure}
+                except ValueError as encryption_error:
+                    rows[user_repo] = {
+                        "error": "The password could not be encrypted: {}".format(
+                            encryption_error
+                        )
+                    }
+            else:
+                rows[user_repo] = {"error": str(error)}
+    except (InvalidCredentialsError, RateLimitedError, RequestException) as error:
+        listing_error = error
+
+    if not rows:
+        raise click.ClickException(str(listing_error or "No repositories matched."))
+
+    if output == "json":
+        print(json.dumps(rows, indent=2))
+    else:
+        width = max(len(user_repo) for user_repo in rows)
+        for user_repo, row in rows.items():
+            print(
+                "{}  {}".format(
+                    user_repo.ljust(width),
+                    row.get("secure") or "ERROR: " + row["error"],
+                )
+            )
+
+    messages = []
+    failures = [user_repo for user_repo, row in rows.items() if "error" in row]
+    if failures:
+        messages.append(
+            "The password could not be encrypted for: {}".format(", ".join(failures))
+        )
+    if listing_error is not None:
+        messages.append(
+            "The repositories could not all be listed: {}".format(listing_error)
+        )
+    if messages:
+        raise click.ClickException("\n".join(messages))
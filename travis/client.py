@@ -0,0 +1,267 @@
+"""Encrypt passwords and environment variables for use with Travis CI.
+
+The client module contains TravisEncryptor, a long-lived object for
+services that encrypt values for many repositories. It owns the endpoint
+settings (.org or .com, anonymous or token authenticated), the HTTP
+session, the on-disk key cache and an in-memory LRU of public keys, so that
+thousands of calls share one set of connections and retrieve and parse
+each key once. The command line interface is built on it.
+
+Example:
+with TravisEncryptor(token=token, cache=KeyCache()) as encryptor:
+    encrypted = encryptor.encrypt("mandeep/Travis-Encrypt", "password")
+    encryptor.set_env_variables(".travis.yml", "mandeep/Travis-Encrypt", items)
+"""
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from travis.config import ConfigFile
+from travis.encrypt import (
+    encrypt_key,
+    encrypt_many,
+    endpoint_url,
+    InvalidCredentialsError,
+    KeyResult,
+    public_key_fingerprint,
+    retrieve_public_key,
+    retrieve_public_keys,
+)
+from travis.scheduler import RateLimitedError
+from travis.session import DEFAULT_POOL_SIZE
+from travis.stream import KeyLookup
+
+
+class TravisEncryptor(object):
+    """Encrypt values for Travis CI repositories, reusing keys and connections.
+
+    Parameters
+    ----------
+    private: bool
+        use the travis-ci.com endpoint for private repositories
+    token: str
+        a travis-ci token used to authenticate the API requests
+    cache: travis.cache.KeyCache
+        the on-disk cache consulted before the API, None to skip it
+    refresh: bool
+        revalidate cached keys with the API the first time they are needed
+    keys: callable
+        returns the public key of 'username/repository' instead of the
+        Travis API, such as a travis.keyfile.KeyBundle
+    maxsize: int
+        the number of public keys kept in memory
+    ttl: float
+        the number of seconds a key is kept in memory, None keeps it until
+        it is evicted; long-running services use it to notice key rotations
+    session: requests.Session
+        the session used for API requests and closed by close(), such as one
+        made by travis.session.create_session; the shared session by default
+    scheduler: travis.scheduler.RequestScheduler
+        the scheduler admitting API requests, the shared scheduler by default
+    """
+
+    def __init__(
+        self,
+        private=False,
+        token=None,
+        cache=None,
+        refresh=False,
+        keys=None,
+        maxsize=1024,
+        ttl=None,
+        session=None,
+        scheduler=None,
+    ):
+        self.private = private
+        self.token = token
+        self.cache = cache
+        self.refresh = refresh
+        self.keys = keys
+        self.session = session
+        self.scheduler = scheduler
+        self._lookup = KeyLookup(keys or self._retrieve, maxsize=maxsize, ttl=ttl)
+
+    def endpoint(self, user_repo):
+        """Return the API endpoint the public key of the repository is retrieved from."""
+        return endpoint_url(user_repo, self.private, self.token)
+
+    def _retrieve(self, user_repo):
+        return retrieve_public_key(
+            user_repo,
+            self.endpoint(user_repo),
+            token=self.token,
+            cache=self.cache,
+            refresh=self.refresh,
+            session=self.session,
+            scheduler=self.scheduler,
+        )
+
+    def get_key(self, user_repo):
+        """Return the public key of the repository, retrieving it at most once.
+
+        Raises
+        ------
+        InvalidCredentialsError
+            raised when an invalid 'username/repository' is given
+        RateLimitedError
+            raised when the Travis API keeps rejecting the request as rate limited
+        """
+        return self._lookup(user_repo)
+
+    __call__ = get_key
+
+    def get_keys(self, user_repos, jobs=DEFAULT_POOL_SIZE):
+        """Return the public keys of many repositories, retrieved concurrently.
+
+        Returns
+        -------
+        results: list
+            a KeyResult(user_repo, key, error) for every distinct repository
+            in input order; key is None when error holds the exception raised
+        """
+        if self.keys is not None:
+            results = self._lookup_keys(user_repos, jobs)
+        else:
+            results = retrieve_public_keys(
+                user_repos,
+                private=self.private,
+                token=self.token,
+                jobs=jobs,
+                cache=self.cache,
+                refresh=self.refresh,
+                session=self.session,
+                scheduler=self.scheduler,
+            )
+
+        for result in results:
+            if result.error is None:
+                self._lookup.add(result.user_repo, result.key)
+        return results
+
+    def iter_keys(self, user_repos, jobs=DEFAULT_POOL_SIZE):
+        """Yield the public keys of repositories while the repositories arrive.
+
+        Unlike get_keys, user_repos is consumed lazily, such as the output of
+        travis.discovery.iter_owner_repositories, and at most 2 * jobs keys
+        are retrieved ahead of the consumer. Duplicate repositories are
+        skipped. When user_repos raises InvalidCredentialsError,
+        RateLimitedError or a requests exception, the keys of the
+        repositories it already gave are yielded before the error is raised.
+
+        Yields
+        ------
+        result: travis.encrypt.KeyResult
+            a KeyResult(user_repo, key, error) for every distinct repository
+            in input order; key is None when error holds the exception raised
+        """
+        from requests.exceptions import RequestException
+
+        def lookup(user_repo):
+            try:
+                return KeyResult(user_repo, self.get_key(user_repo), None)
+            except (
+                InvalidCredentialsError,
+                RateLimitedError,
+                RequestException,
+            ) as error:
+                return KeyResult(user_repo, None, error)
+
+        seen = set()
+        pending = deque()
+        listing_error = None
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            try:
+                for user_repo in user_repos:
+                    if user_repo in seen:
+                        continue
+                    seen.add(user_repo)
+                    pending.append(executor.submit(lookup, user_repo))
+                    while len(pending) >= 2 * jobs or (pending and pending[0].done()):
+                        yield pending.popleft().result()
+            except (
+                InvalidCredentialsError,
+                RateLimitedError,
+                RequestException,
+            ) as error:
+                listing_error = error
+
+            while pending:
+                yield pending.popleft().result()
+
+        if listing_error is not None:
+            raise listing_error
+
+    def _lookup_keys(self, user_repos, jobs):
+        """Return the KeyResult of every repository using the keys callable."""
+
+        def lookup(user_repo):
+            try:
+                return KeyResult(user_repo, self.keys(user_repo), None)
+            except (InvalidCredentialsError, RateLimitedError) as error:
+                return KeyResult(user_repo, None, error)
+
+        user_repos = list(OrderedDict.fromkeys(user_repos))
+        if not user_repos:
+            return []
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(jobs, len(user_repos)))
+        ) as executor:
+            return list(executor.map(lookup, user_repos))
+
+    def fingerprint(self, user_repo):
+        """Return the SHA-256 fingerprint of the public key of the repository."""
+        return public_key_fingerprint(self.get_key(user_repo))
+
+    def encrypt(self, user_repo, value):
+        """Encrypt a str or bytes value for the repository and return it as ASCII."""
+        if not isinstance(value, bytes):
+            value = value.encode()
+        return encrypt_key(self.get_key(user_repo), value)
+
+    def encrypt_many(self, user_repo, items, jobs=1):
+        """Encrypt (name, value) pairs for the repository; see encrypt.encrypt_many."""
+        return encrypt_many(self.get_key(user_repo), items, jobs=jobs)
+
+    def set_secure(self, path, user_repo, value, keys=("password",)):
+        """Encrypt the value and write it as the secure value at keys of the file.
+
+        For example keys=("deploy", "password") sets deploy.password.secure.
+        The encrypted value is returned.
+        """
+        encrypted = self.encrypt(user_repo, value)
+        config_file = ConfigFile(path)
+        config_file.set_secure(keys, encrypted)
+        config_file.flush()
+        return encrypted
+
+    def set_env_secure(self, path, user_repo, value):
+        """Encrypt the value and write it as the secure value of env.global."""
+        encrypted = self.encrypt(user_repo, value)
+        config_file = ConfigFile(path)
+        config_file.set_env_secure(encrypted)
+        config_file.flush()
+        return encrypted
+
+    def set_env_variables(self, path, user_repo, items, jobs=1):
+        """Encrypt named values and write them to env.global with a single write.
+
+        Values that cannot be encrypted are left out of the file and reported
+        in their results; see encrypt.encrypt_many.
+        """
+        results = self.encrypt_many(user_repo, items, jobs=jobs)
+        config_file = ConfigFile(path)
+        for name, encrypted, error in results:
+            if error is None:
+                config_file.set_env_variable(name, encrypted)
+        config_file.flush()
+        return results
+
+    def close(self):
+        """Close the HTTP session given to the client, if any."""
+        if self.session is not None:
+            self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
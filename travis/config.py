@@ -0,0 +1,349 @@
+"""Encrypt passwords and environment variables for use with Travis CI.
+
+The config module contains helpers to update the encrypted values of a
+.travis.yml configuration. ConfigFile collects every update of a file and
+applies them with a single atomic write, which is skipped altogether when
+the file would not change.
+
+env.global may be written in mapping form:
+
+    env:
+      global:
+        API_KEY:
+          secure: ...
+
+or in list form, mixing plain variables, anonymous secure values and
+named secure values:
+
+    env:
+      global:
+        - DEBUG=1
+        - secure: ...
+        - API_KEY:
+            secure: ...
+
+EnvGlobalIndex indexes both forms by variable name so that each update
+finds its entry without scanning the list.
+"""
+from collections import OrderedDict
+import io
+import os
+import tempfile
+
+from travis.cache import replace_file
+from travis.metrics import increment
+from travis.timing import span
+
+try:
+    string_types = (basestring,)
+except NameError:
+    string_types = (str,)
+
+
+class EnvGlobalIndex(object):
+    """Index the entries of env.global of a configuration by variable name.
+
+    Creating the index adds an empty env.global mapping to the configuration
+    if it has none.
+
+    Parameters
+    ----------
+    config: collections.OrderedDict
+        the configuration loaded from .travis.yml
+    """
+
+    def __init__(self, config):
+        env = config.get("env")
+        if env is None:
+            env = config["env"] = OrderedDict()
+        elif not isinstance(env, dict):
+            # a bare list of variables is the build matrix
+            env = config["env"] = OrderedDict([("matrix", env)])
+
+        entries = env.get("global")
+        if entries is None:
+            entries = env["global"] = OrderedDict()
+        elif not isinstance(entries, (dict, list)):
+            entries = env["global"] = [entries]
+
+        self.entries = entries
+        self.positions = {}
+        self.anonymous = []
+
+        if isinstance(entries, dict):
+            for name in entries:
+                if name == "secure":
+                    self.anonymous.append(name)
+                else:
+                    self.positions[name] = name
+        else:
+            for position, item in enumerate(entries):
+                name = variable_name(item)
+                if name == "secure":
+                    self.anonymous.append(position)
+                elif name is not None:
+                    self.positions[name] = position
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def get(self, name):
+        """Return the value of the named variable, or None if it is not indexed."""
+        if name not in self.positions:
+            return None
+        item = self.entries[self.positions[name]]
+        if isinstance(self.entries, dict):
+            return item
+        if isinstance(item, dict):
+            return item[name]
+        return item.split("=", 1)[1]
+
+    def upsert(self, name, value):
+        """Set the named variable, replacing its entry or appending a new one.
+
+        In mapping form the value is stored under the name. In list form the
+        entry becomes a single key mapping of the name to the value.
+        """
+        if isinstance(self.entries, dict):
+            self.entries[name] = value
+            self.positions[name] = name
+            return
+
+        entry = OrderedDict([(name, value)])
+        if name in self.positions:
+            self.entries[self.positions[name]] = entry
+        else:
+            self.positions[name] = len(self.entries)
+            self.entries.append(entry)
+
+    def upsert_many(self, items):
+        """Set every (name, value) pair; see upsert."""
+        for name, value in items:
+            self.upsert(name, value)
+
+    def set_secure(self, encrypted):
+        """Set the anonymous secure value of env.global.
+
+        In mapping form this is the secure key of env.global. In list form
+        the first item that only holds a secure key is updated, so that the
+        other anonymous values are kept, and a new item is appended when
+        there is none.
+        """
+        if isinstance(self.entries, dict):
+            self.entries["secure"] = encrypted
+            if "secure" not in self.anonymous:
+                self.anonymous.append("secure")
+            return
+
+        if not self.anonymous:
+            self.anonymous.append(len(self.entries))
+            self.entries.append(OrderedDict())
+        self.entries[self.anonymous[0]]["secure"] = encrypted
+
+
+def variable_name(item):
+    """Return the variable name of an env.global list item.
+
+    Items are either 'NAME=value' strings, mappings of a single name to a
+    value, or anonymous {'secure': ...} mappings for which 'secure' is
+    returned. None is returned for items that name no variable.
+    """
+    if isinstance(item, dict):
+        if len(item) == 1:
+            return next(iter(item))
+        return "secure" if "secure" in item else None
+    if isinstance(item, string_types) and "=" in item:
+        return item.split("=", 1)[0].strip() or None
+    return None
+
+
+class ConfigFile(object):
+    """Collect updates of the encrypted values of a .travis.yml file.
+
+    Updates are only recorded until flush is called, so that any number of
+    them costs a single read and a single write of the file. Values that
+    already exist are patched in place (see travis.patcher); otherwise the
+    configuration is loaded, updated and dumped as a whole.
+
+    Parameters
+    ----------
+    path: str
+        The file path to the .travis.yml file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.updates = OrderedDict()
+        self._text = None
+
+    @property
+    def text(self):
+        """The contents of the file when it was first read, line endings kept."""
+        if self._text is None:
+            with io.open(self.path, encoding="utf-8", newline="") as config_file:
+                self._text = config_file.read()
+        return self._text
+
+    def load(self):
+        """Return the configuration as it was first read, without the updates."""
+        from travis.orderer import ordered_load
+
+        config = ordered_load(self.text)
+        return OrderedDict() if config is None else config
+
+    def set_secure(self, keys, encrypted):
+        """Set the secure value below the given keys, e.g. ('deploy', 'password')."""
+        self.updates["value", tuple(keys)] = encrypted
+
+    def set_env_secure(self, encrypted):
+        """Set the anonymous secure value of env.global; see EnvGlobalIndex."""
+        self.updates["env", None] = encrypted
+
+    def set_env_variable(self, name, encrypted):
+        """Set the secure value of the named env.global variable."""
+        self.updates["env", name] = encrypted
+
+    def render(self):
+        """Return the contents of the file with every update applied."""
+        from travis.orderer import ordered_dump
+        from travis.patcher import NodeNotFoundError, patch_scalars
+
+        text = self.text
+        if not self.updates:
+            return text
+
+        with span("yaml.patch"):
+            for replacements in self._replacements():
+                try:
+                    return patch_scalars(text, replacements)
+                except NodeNotFoundError:
+                    continue
+
+        config = self.load()
+
+        index = None
+        for (kind, target), encrypted in self.updates.items():
+            if kind == "value":
+                node = config
+                for key in target:
+                    node = node.setdefault(key, OrderedDict())
+                node["secure"] = encrypted
+            else:
+                index = index or EnvGlobalIndex(config)
+                if target is None:
+                    index.set_secure(encrypted)
+                else:
+                    index.upsert(target, OrderedDict([("secure", encrypted)]))
+
+        return ordered_dump(config, default_flow_style=False)
+
+    def flush(self):
+        """Write the updates to the file and forget them.
+
+        Returns
+        -------
+        written: bool
+            False when the file already had the updated contents
+        """
+        text = self.render()
+        if text == self.text:
+            increment("files_unchanged")
+        written = text != self.text and write_file(self.path, text)
+        self._text = text
+        self.updates.clear()
+        return written
+
+    def _replacements(self):
+        """Yield the patches for env.global in mapping form and then in list form."""
+        prefixes = [()]
+        if any(kind == "env" for kind, _ in self.updates):
+            prefixes.append((None,))
+
+        for prefix in prefixes:
+            replacements = {}
+            for (kind, target), encrypted in self.updates.items():
+                if kind == "value":
+                    replacements[target + ("secure",)] = encrypted
+                elif target is None:
+                    position = self._anonymous_position() if prefix else ()
+                    path = ("env", "global") + position + ("secure",)
+                    replacements[path] = encrypted
+                else:
+                    path = ("env", "global") + prefix + (target, "secure")
+                    replacements[path] = encrypted
+            yield replacements
+
+    def _anonymous_position(self):
+        """Return the path suffix of the first anonymous secure item of env.global.
+
+        The suffix holds its list index, or None, which matches no item when
+        env.global has no anonymous item in list form.
+        """
+        index = EnvGlobalIndex(self.load())
+        if isinstance(index.entries, list) and index.anonymous:
+            return (index.anonymous[0],)
+        return (None,)
+
+
+def write_file(path, text):
+    """Atomically replace the contents of the file at path with text.
+
+    The text is written to a temporary file in the same directory, flushed
+    to disk and renamed over the original file, so that a crash can never
+    leave a truncated file behind. The original file's permissions are kept,
+    and so are the line endings of the text, which are not translated.
+
+    Parameters
+    ----------
+    path: str
+        the path of the file to write
+    text: str
+        the new contents; UTF-8 encoded bytes are accepted as well, such as
+        the output of yaml and json on Python 2
+
+    Returns
+    -------
+    written: bool
+        False when the file already held the text and was left untouched
+    """
+    if isinstance(text, bytes):
+        text = text.decode("utf-8")
+
+    try:
+        with io.open(path, encoding="utf-8", newline="") as existing_file:
+            if existing_file.read() == text:
+                increment("files_unchanged")
+                return False
+    except (IOError, OSError):
+        pass
+
+    with span("file.write"):
+        directory = os.path.dirname(os.path.abspath(path))
+        descriptor, temporary_path = tempfile.mkstemp(
+            dir=directory, prefix=".travis-encrypt-", suffix=".tmp"
+        )
+        try:
+            with io.open(
+                descriptor, "w", encoding="utf-8", newline=""
+            ) as temporary_file:
+                temporary_file.write(text)
+                temporary_file.flush()
+                os.fsync(temporary_file.fileno())
+            if os.path.exists(path):
+                mode = os.stat(path).st_mode & 0o7777
+            else:
+                umask = os.umask(0)
+                os.umask(umask)
+                mode = 0o666 & ~umask
+            os.chmod(temporary_path, mode)
+            replace_file(temporary_path, path)
+        except Exception:
+            os.remove(temporary_path)
+            raise
+
+    increment("files_written")
+    increment("bytes_written", len(text.encode("utf-8")))
+    return True
@@ -0,0 +1,174 @@
+"""Encrypt passwords and environment variables for use with Travis CI.
+
+The daemon module serves encryption requests over a local Unix socket so that
+a long-running process keeps public keys and API sessions warm between
+requests. The protocol is the NDJSON protocol of the stream module: every
+line written to the socket is a {"repo": ..., "name": ..., "value": ...}
+record and is answered by a single result line.
+
+Available classes:
+EncryptionServer -- a threaded Unix socket server that encrypts records
+DaemonClient -- a client that sends records to an EncryptionServer
+"""
+import json
+import os
+from collections import OrderedDict
+import socket
+import stat
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from travis.stream import encrypt_record
+
+
+class DaemonError(Exception):
+    """Raised when the daemon cannot be reached or cannot encrypt a value."""
+
+
+def _is_listening(path):
+    """Return True if a server accepts connections on the Unix socket."""
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (IOError, OSError):
+        return False
+    finally:
+        probe.close()
+    return True
+
+
+class EncryptionRequestHandler(socketserver.StreamRequestHandler):
+    """Answer every record of a connection with its result record."""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                line = line.decode("utf-8")
+            except UnicodeDecodeError as error:
+                result = OrderedDict([("error", "Invalid record: {}".format(error))])
+            else:
+                result = encrypt_record(line, self.server.get_key)
+            self.wfile.write(json.dumps(result).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class EncryptionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serve encryption requests on a Unix socket, one thread per connection.
+
+    The socket is only accessible by the user running the server. A stale
+    socket left behind by a previous server is replaced, any other file at
+    the path is left alone and makes binding fail.
+
+    Raises
+    ------
+    DaemonError
+        raised when another server is still listening on the socket
+
+    Parameters
+    ----------
+    path: str
+        the path of the Unix socket
+    get_key: callable
+        called with 'username/repository' and returning its public key,
+        typically a travis.stream.KeyLookup shared by every connection
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, get_key):
+        self.get_key = get_key
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            if _is_listening(path):
+                raise DaemonError(
+                    "An encryption daemon is already listening on {}".format(path)
+                )
+            os.remove(path)
+
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, path, EncryptionRequestHandler)
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        try:
+            os.remove(self.server_address)
+        except OSError:
+            pass
+
+
+class DaemonClient(object):
+    """Send encryption requests to an EncryptionServer.
+
+    Parameters
+    ----------
+    path: str
+        the path of the Unix socket the server listens on
+    timeout: float
+        the number of seconds to wait for the server
+    """
+
+    def __init__(self, path, timeout=None):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        try:
+            self.socket.connect(path)
+        except (IOError, OSError) as error:
+            self.socket.close()
+            raise DaemonError(
+                "Could not connect to the encryption daemon at {}: {}".format(
+                    path, error
+                )
+            )
+        self.reader = self.socket.makefile("rb")
+
+    def stream(self, lines):
+        """Send NDJSON lines to the daemon and yield their result records.
+
+        Every line is answered before the next one is sent, so the results
+        keep the order of the lines; blank lines are skipped.
+        """
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                self.socket.sendall(line.rstrip("\n").encode("utf-8") + b"\n")
+                result = self.reader.readline()
+            except (IOError, OSError) as error:
+                raise DaemonError("The encryption daemon failed: {}".format(error))
+            if not result:
+                raise DaemonError("The encryption daemon closed the connection")
+            yield json.loads(result.decode("utf-8"))
+
+    def request(self, record):
+        """Send a record to the daemon and return its result record."""
+        return next(self.stream([json.dumps(record)]))
+
+    def encrypt(self, user_repo, name, value):
+        """Return the value encrypted with the public key of the repository.
+
+        Raises
+        ------
+        DaemonError: the daemon could not encrypt the value
+        """
+        result = self.request({"repo": user_repo, "name": name, "value": value})
+        if "error" in result:
+            raise DaemonError(result["error"])
+        return result["secure"]
+
+    def close(self):
+        """Close the connection to the daemon."""
+        self.reader.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,138 @@
+"""Encrypt passwords and environment variables for use with Travis CI.
+
+The discovery module enumerates the repositories of an owner, a user or an
+organization, through the paginated /owner/{login}/repos endpoint of the v3
+Travis API. The endpoint requires a token, like the key_pair/generated
+endpoint used when retrieving keys with a token.
+
+Repositories are yielded page by page as each page arrives, so that their
+keys can be retrieved while later pages are still being requested.
+
+Available functions:
+owner_repositories_url -- build the v3 endpoint listing the repositories of an owner
+iter_owner_repositories -- yield the repositories of an owner page by page
+match_repository -- check a repository name against include and exclude patterns
+"""
+from fnmatch import fnmatchcase
+
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+from travis.encrypt import api_url, InvalidCredentialsError
+from travis.metrics import increment
+from travis.scheduler import get_scheduler
+from travis.session import get_session
+from travis.timing import span
+
+PAGE_SIZE = 100
+
+
+def owner_repositories_url(owner, private=False, limit=PAGE_SIZE, offset=0):
+    """Return the URL of one page of the repositories of the owner.
+
+    The owner is quoted, so a login can never change the path of the request.
+    """
+    return "{}/v3/owner/{}/repos?limit={}&offset={}".format(
+        api_url(private), quote(owner, safe=""), limit, offset
+    )
+
+
+def match_repository(name, include=(), exclude=()):
+    """Return True if the repository name is selected by the patterns.
+
+    Patterns are shell-style wildcards matched case sensitively against the
+    repository name without its owner. A name is selected when it matches any
+    include pattern, or when there are none, and matches no exclude pattern.
+    """
+    if include and not any(fnmatchcase(name, pattern) for pattern in include):
+        return False
+    return not any(fnmatchcase(name, pattern) for pattern in exclude)
+
+
+def iter_owner_repositories(
+    owner,
+    token,
+    private=False,
+    include=(),
+    exclude=(),
+    page_size=PAGE_SIZE,
+    session=None,
+    scheduler=None,
+):
+    """Yield the 'owner/repository' slugs of the repositories of the owner.
+
+    Pages are requested one at a time and their repositories yielded before
+    the next page is requested, so a consumer can start working on the first
+    repositories right away. Enumeration stops at the page the API marks as
+    the last one, or at a page holding fewer repositories than requested.
+
+    Parameters
+    ----------
+    owner: str
+        the login of the user or organization
+    token: str
+        a travis-ci token used to authenticate the API requests
+    private: bool
+        use the travis-ci.com endpoint
+    include: iterable
+        only yield repositories whose name matches one of these patterns
+    exclude: iterable
+        skip repositories whose name matches one of these patterns
+    page_size: int
+        the number of repositories requested per page
+    session: requests.Session
+        the session used for the requests, the shared session by default
+    scheduler: travis.scheduler.RequestScheduler
+        the scheduler admitting the requests, the shared scheduler by default
+
+    Yields
+    ------
+    user_repo: str
+        a repository in the format of 'username/repository'
+
+    Raises
+    ------
+    InvalidCredentialsError
+        raised when the owner does not exist or the token cannot list its
+        repositories
+    RateLimitedError
+        raised when the Travis API keeps rejecting a request as rate limited
+    """
+    include, exclude = tuple(include), tuple(exclude)
+    headers = {"Authorization": "token {}".format(token), "Travis-API-Version": "3"}
+    session = session or get_session()
+    scheduler = scheduler or get_scheduler()
+
+    offset = 0
+    while True:
+        url = owner_repositories_url(owner, private, page_size, offset)
+        with span("owner.page"):
+            response = scheduler.get(session, url, headers=headers)
+        increment("http_responses", status=str(response.status_code))
+
+        try:
+            if response.status_code != 200:
+                raise ValueError(response.status_code)
+            page = response.json()
+            repositories = page["repositories"]
+        except (KeyError, TypeError, ValueError):
+            raise InvalidCredentialsError(
+                "Could not list the repositories of the owner: '{}' (HTTP {}). "
+                "Please check that the owner exists and that the token can "
+                "access it.".format(owner, response.status_code)
+            )
+        increment("owner_pages")
+
+        for repository in repositories:
+            slug = repository.get("slug") or "{}/{}".format(owner, repository["name"])
+            if match_repository(slug.split("/", 1)[-1], include, exclude):
+                yield slug
+
+        pagination = page.get("@pagination") or {}
+        if pagination.get("is_last", len(repositories) < page_size):
+            return
+        if not repositories:
+            return
+        offset += len(repositories)
@@ -1,24 +1,109 @@
 """Encrypt passwords and environment variables for use with Travis CI.
 
 Available functions:
+api_url -- return the root URL of the Travis CI API
+endpoint_url -- build the Travis CI API endpoint used to retrieve a public key
 retrieve_public_key -- retrieve the public key from the Travis CI API.
+retrieve_public_keys -- retrieve the public keys of many repositories concurrently
+prefetch_public_keys -- retrieve, validate and cache the keys of many repositories
+load_public_key -- deserialize a public key, reusing previously parsed keys
+public_key_cache_info -- report hit and miss statistics of the parsed key cache
+public_key_cache_clear -- empty the parsed key cache
+public_key_fingerprint -- compute the SHA-256 fingerprint of a public key
 encrypt_key -- load the public key and encrypt it with PKCSv15
+encrypt_many -- encrypt a batch of named values with a single loaded key
+encrypt_batches -- encrypt batches of named values with their own keys
+
+cryptography, requests and yaml are imported by the functions that use them
+rather than at module level, which keeps importing this module, and with it
+starting the command line interface, fast.
 """
 import base64
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import threading
+
+from travis.config import write_file
+from travis.metrics import increment
+from travis.scheduler import get_scheduler, monotonic, RateLimitedError
+from travis.session import DEFAULT_POOL_SIZE, get_session
+from travis.timing import span
+
+PUBLIC_KEY_CACHE_SIZE = 64
+
+PublicKeyCacheInfo = namedtuple(
+    "PublicKeyCacheInfo", ["hits", "misses", "maxsize", "currsize"]
+)
+
+KeyResult = namedtuple("KeyResult", ["user_repo", "key", "error"])
 
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
-from cryptography.hazmat.primitives.serialization import load_pem_public_key
-import requests
+PrefetchResult = namedtuple(
+    "PrefetchResult", ["user_repo", "fingerprint", "elapsed", "error"]
+)
 
-from travis.orderer import ordered_load, ordered_dump
+EncryptionResult = namedtuple("EncryptionResult", ["name", "encrypted", "error"])
+
+_public_keys = OrderedDict()
+_public_key_stats = {"hits": 0, "misses": 0}
+_public_key_lock = threading.Lock()
 
 
 class InvalidCredentialsError(Exception):
     """Error raised when a username or repository does not exist."""
 
 
-def retrieve_public_key(user_repo, url="https://api.travis-ci.org/repos", token=None):
+def api_url(private=False):
+    """Return the root URL of the Travis API, without a trailing slash.
+
+    Private repositories are served by travis-ci.com instead of
+    travis-ci.org. The TRAVIS_ENCRYPT_API_URL environment variable replaces
+    both, for example with a Travis CI Enterprise or a local stub API.
+    """
+    url = os.environ.get("TRAVIS_ENCRYPT_API_URL", "").rstrip("/")
+    if url:
+        return url
+    return "https://api.{}".format("travis-ci.com" if private else "travis-ci.org")
+
+
+def endpoint_url(user_repo, private=False, token=None):
+    """Build the API endpoint passed to retrieve_public_key for a repository.
+
+    Requests authenticated with a token use the v3 key_pair/generated endpoint
+    of the repository, while unauthenticated requests use the legacy repos
+    endpoint. See api_url for the root URL of the API.
+
+    Parameters
+    ----------
+    user_repo: str
+        the repository in the format of 'username/repository'
+    private: bool
+        use the travis-ci.com endpoint for private repositories
+    token: str
+        the travis-ci token the request will be authenticated with
+
+    Returns
+    -------
+    url: str
+        the endpoint of the Travis API
+    """
+    if token:
+        return "{}/v3/repo/{}/key_pair/generated".format(
+            api_url(private), user_repo.replace("/", "%2f")
+        )
+    return "{}/repos".format(api_url(private))
+
+
+def retrieve_public_key(
+    user_repo,
+    url="https://api.travis-ci.org/repos",
+    token=None,
+    cache=None,
+    refresh=False,
+    session=None,
+    scheduler=None,
+):
     """Retrieve the public key from the Travis API.
 
     The Travis API response is accessed as JSON so that Travis-Encrypt
@@ -27,10 +112,27 @@ def retrieve_public_key(user_repo, url="https://api.travis-ci.org/repos", token=
     returned from the Travis API as PKCS8 encoded, the key is returned with
     RSA removed from the header and footer.
 
+    When a cache is given, a fresh cached key is returned without touching
+    the network. A stale cached key is revalidated with a conditional request
+    (If-None-Match / If-Modified-Since) and reused when the API responds with
+    304 Not Modified, so the key is only downloaded again once it has changed.
+
     Parameters
     ----------
     user_repo: str
         the repository in the format of 'username/repository'
+    url: str
+        the API endpoint; the v3 key_pair/generated URL when a token is given
+    token: str
+        a travis-ci token used to authenticate the API request
+    cache: travis.cache.KeyCache
+        an optional cache consulted before and updated after the request
+    refresh: bool
+        revalidate the cached key with the API even if it is still fresh
+    session: requests.Session
+        the session used for the request, the shared session by default
+    scheduler: travis.scheduler.RequestScheduler
+        the scheduler admitting the request, the shared scheduler by default
 
     Returns
     -------
@@ -41,28 +143,58 @@ def retrieve_public_key(user_repo, url="https://api.travis-ci.org/repos", token=
     ------
     InvalidCredentialsError
         raised when an invalid 'username/repository' is given
+    RateLimitedError
+        raised when the Travis API keeps rejecting the request as rate limited
+    requests.exceptions.HTTPError
+        raised when the Travis API keeps failing with a server error
     """
+    url = _key_url(user_repo, url, token)
+
+    increment("key_fetches")
+    entry = None
+    if cache is not None:
+        entry = cache.lookup(url)
+        if entry is not None and not refresh and cache.is_fresh(entry):
+            increment("key_cache_hits")
+            return entry["key"]
+        increment("key_cache_misses")
+
+    headers = {}
     if token:
-        response = requests.get(
-            url, headers={"Authorization": "token {}".format(token)}
-        )
-
-        try:
-            return response.json()["public_key"]
-        except (KeyError, ValueError):
-            username, repository = user_repo.split("/")
-            raise InvalidCredentialsError(
-                "Either the username: '{}' or the repository: '{}' does not exist. Please enter a valid username or repository name. The username and repository name are both case sensitive.".format(
-                    username, repository
-                )
-            )
-
+        headers["Authorization"] = "token {}".format(token)
+        field = "public_key"
     else:
-        url = "{}/{}/key".format(url, user_repo)
-        response = requests.get(url)
+        field = "key"
+
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    session = session or get_session()
+    scheduler = scheduler or get_scheduler()
+    with span("key.http"):
+        response = scheduler.get(session, url, headers=headers)
+    increment("http_responses", status=str(response.status_code))
+
+    if entry is not None and response.status_code == 304:
+        increment("key_cache_revalidations")
+        return cache.touch(entry)["key"]
+
+    if response.status_code >= 500:
+        # the session gave up retrying, and an outage says nothing about
+        # whether the repository exists
+        from requests.exceptions import HTTPError
+
+        raise HTTPError(
+            "The Travis API failed with HTTP {} while requesting {}. "
+            "Please retry later.".format(response.status_code, url),
+            response=response,
+        )
 
     try:
-        return response.json()["key"].replace(" RSA ", " ")
+        key = response.json()[field]
     except (KeyError, ValueError):
         username, repository = user_repo.split("/")
         raise InvalidCredentialsError(
@@ -71,12 +203,236 @@ def retrieve_public_key(user_repo, url="https://api.travis-ci.org/repos", token=
             )
         )
 
+    if not token:
+        key = key.replace(" RSA ", " ")
+
+    if cache is not None:
+        cache.set(
+            url,
+            key,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+
+    return key
+
+
+def retrieve_public_keys(
+    user_repos, private=False, token=None, jobs=DEFAULT_POOL_SIZE, **kwargs
+):
+    """Retrieve the public keys of many repositories concurrently.
+
+    Retrieving a key is bound by network latency rather than CPU, so the
+    requests are made from a pool of threads sharing the HTTP session.
+    Duplicate repositories are only retrieved once.
+
+    Parameters
+    ----------
+    user_repos: iterable
+        repositories in the format of 'username/repository'
+    private: bool
+        use the travis-ci.com endpoint for private repositories
+    token: str
+        a travis-ci token used to authenticate the API requests
+    jobs: int
+        the number of keys retrieved at the same time
+    kwargs:
+        the cache, refresh, session and scheduler arguments of retrieve_public_key
+
+    Returns
+    -------
+    results: list
+        a KeyResult(user_repo, key, error) for every distinct repository in
+        input order; key is None when error holds the exception raised
+    """
+    from requests.exceptions import RequestException
+
+    user_repos = list(OrderedDict.fromkeys(user_repos))
+
+    def retrieve(user_repo):
+        try:
+            key = retrieve_public_key(
+                user_repo,
+                endpoint_url(user_repo, private, token),
+                token=token,
+                **kwargs
+            )
+        except (InvalidCredentialsError, RateLimitedError, RequestException) as error:
+            return KeyResult(user_repo, None, error)
+        return KeyResult(user_repo, key, None)
+
+    if not user_repos:
+        return []
+
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(user_repos)))) as executor:
+        return list(executor.map(retrieve, user_repos))
+
+
+def prefetch_public_keys(specs, cache, jobs=DEFAULT_POOL_SIZE, **kwargs):
+    """Retrieve the public keys of many repositories and store them in the cache.
+
+    Every key is parsed once retrieved, and a key that does not parse is
+    removed from the cache again, so that a later encryption pass can rely on
+    the cached keys without touching the network.
+
+    Parameters
+    ----------
+    specs: iterable
+        travis.manifest.RepositorySpec(user_repo, private, token) tuples
+    cache: travis.cache.KeyCache
+        the cache the keys are stored in
+    jobs: int
+        the number of keys retrieved at the same time
+    kwargs:
+        the refresh, session and scheduler arguments of retrieve_public_key
+
+    Returns
+    -------
+    results: list
+        a PrefetchResult(user_repo, fingerprint, elapsed, error) for every
+        spec in input order, where elapsed is the number of seconds taken and
+        fingerprint is None when error holds the exception raised
+    """
+    from requests.exceptions import RequestException
+
+    specs = list(specs)
+
+    def prefetch(spec):
+        user_repo, private, token = spec
+        url = endpoint_url(user_repo, private, token)
+        start = monotonic()
+        try:
+            key = retrieve_public_key(
+                user_repo, url, token=token, cache=cache, **kwargs
+            )
+            try:
+                fingerprint = public_key_fingerprint(key)
+            except (TypeError, ValueError):
+                cache.invalidate(_key_url(user_repo, url, token))
+                raise
+        except (
+            InvalidCredentialsError,
+            RateLimitedError,
+            RequestException,
+            TypeError,
+            ValueError,
+        ) as error:
+            return PrefetchResult(user_repo, None, monotonic() - start, error)
+        return PrefetchResult(user_repo, fingerprint, monotonic() - start, None)
+
+    if not specs:
+        return []
+
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(specs)))) as executor:
+        return list(executor.map(prefetch, specs))
+
+
+def load_public_key(key):
+    """Load the public key as an RSAPublicKey object.
+
+    Deserializing a PEM key requires parsing its ASN.1 structure, which is
+    wasteful when the same key encrypts many passwords. Parsed keys are
+    therefore kept in a bounded least recently used cache keyed by a hash
+    of the PEM, with the RSA header and footer normalized the same way
+    retrieve_public_key does so that both spellings share a cache entry.
+
+    The PEM is parsed as given first, which keeps genuine PKCS#1 keys
+    ('BEGIN RSA PUBLIC KEY') working. Only when that fails is it parsed
+    again with RSA removed, for SubjectPublicKeyInfo keys mislabelled as
+    PKCS#1 by the Travis API.
+
+    Parameters
+    ----------
+    key: str
+        Travis CI public RSA key that requires deserialization
+
+    Returns
+    -------
+    public_key: cryptography.hazmat.primitives.asymmetric.rsa.RSAPublicKey
+        the deserialized public key
+    """
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.serialization import load_pem_public_key
+
+    pem = key.encode()
+    digest = hashlib.sha256(key.replace(" RSA ", " ").encode()).digest()
+
+    with _public_key_lock:
+        public_key = _public_keys.pop(digest, None)
+        if public_key is not None:
+            _public_keys[digest] = public_key
+            _public_key_stats["hits"] += 1
+            increment("parsed_key_cache_hits")
+            return public_key
+        _public_key_stats["misses"] += 1
+    increment("parsed_key_cache_misses")
+
+    with span("key.parse"):
+        try:
+            public_key = load_pem_public_key(pem, default_backend())
+        except ValueError:
+            if b" RSA " not in pem:
+                raise
+            public_key = load_pem_public_key(
+                pem.replace(b" RSA ", b" "), default_backend()
+            )
+
+    with _public_key_lock:
+        _public_keys[digest] = public_key
+        while len(_public_keys) > PUBLIC_KEY_CACHE_SIZE:
+            _public_keys.popitem(last=False)
+
+    return public_key
+
+
+def public_key_cache_info():
+    """Return the hits, misses, maximum size and current size of the parsed key cache."""
+    with _public_key_lock:
+        return PublicKeyCacheInfo(
+            _public_key_stats["hits"],
+            _public_key_stats["misses"],
+            PUBLIC_KEY_CACHE_SIZE,
+            len(_public_keys),
+        )
+
+
+def public_key_cache_clear():
+    """Remove every parsed key from the cache and reset its statistics."""
+    with _public_key_lock:
+        _public_keys.clear()
+        _public_key_stats["hits"] = _public_key_stats["misses"] = 0
+
+
+def public_key_fingerprint(key):
+    """Return the SHA-256 fingerprint of the public key.
+
+    The fingerprint is computed over the DER encoded SubjectPublicKeyInfo,
+    so it does not depend on how the PEM is formatted.
+
+    Parameters
+    ----------
+    key: str
+        Travis CI public RSA key that requires deserialization
+
+    Returns
+    -------
+    fingerprint: str
+        'SHA256:' followed by the hexadecimal digest
+    """
+    from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+    der = load_public_key(key).public_bytes(
+        Encoding.DER, PublicFormat.SubjectPublicKeyInfo
+    )
+    return "SHA256:" + hashlib.sha256(der).hexdigest()
+
 
 def encrypt_key(key, password):
     """Encrypt the password with the public key and return an ASCII representation.
 
     The public key retrieved from the Travis API is loaded as an RSAPublicKey
-    object using Cryptography's default backend. Then the given password
+    object using Cryptography's default backend, reusing the object when the
+    same key was loaded before (see load_public_key). Then the given password
     is encrypted with the encrypt() method of RSAPublicKey. The encrypted
     password is then encoded to base64 and decoded into ASCII in order to
     convert the bytes object into a string object.
@@ -101,11 +457,150 @@ def encrypt_key(key, password):
     Example:
     OAEP(mgf=MGF1(algorithm=SHA256()), algorithm=SHA256(), label=None))
     """
-    public_key = load_pem_public_key(key.encode(), default_backend())
-    encrypted_password = public_key.encrypt(password, PKCS1v15())
+    from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
+
+    public_key = load_public_key(key)
+    with span("encrypt"):
+        encrypted_password = public_key.encrypt(password, PKCS1v15())
+    increment("encryptions")
     return base64.b64encode(encrypted_password).decode("ascii")
 
 
+def encrypt_many(key, items, jobs=1):
+    """Encrypt many named values with the same public key.
+
+    The public key is loaded once for the whole batch. A value that cannot
+    be encrypted, such as one too long for the PKCS1v15 padding of the key,
+    is reported in its result instead of aborting the remaining values.
+
+    RSA encryption is CPU bound, so with more than one job the batch is split
+    into contiguous chunks that are encrypted by a pool of worker processes.
+    Results are reassembled in input order regardless of the number of jobs.
+
+    Parameters
+    ----------
+    key: str
+        Travis CI public RSA key that requires deserialization
+    items: iterable
+        (name, value) pairs where value is a str or bytes object
+    jobs: int
+        the number of worker processes; 0 or None uses every available core
+
+    Returns
+    -------
+    results: list
+        an EncryptionResult(name, encrypted, error) for every item in input
+        order; encrypted is None when error holds the exception raised
+    """
+    return encrypt_batches([(key, items)], jobs)[0]
+
+
+def encrypt_batches(batches, jobs=1):
+    """Encrypt batches of named values, each with its own public key.
+
+    This lets values destined for many repositories share one pool of worker
+    processes; see encrypt_many for the handling of each batch. With more
+    than one job, batches are split into contiguous chunks of at most
+    1/jobs of all the values, so that a single large batch is spread over
+    every worker instead of keeping one of them busy.
+
+    Parameters
+    ----------
+    batches: iterable
+        (key, items) pairs where items are (name, value) pairs
+    jobs: int
+        the number of worker processes; 0 or None uses every available core
+
+    Returns
+    -------
+    results: list
+        the list of EncryptionResult of every batch in input order
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    batches = [(key, list(items)) for key, items in batches]
+    total = sum(len(items) for _, items in batches)
+    jobs = _job_count(jobs, total)
+
+    if jobs <= 1:
+        return [
+            _count_encryptions(_encrypt_batch(key, items)) for key, items in batches
+        ]
+
+    chunk_size = -(-total // jobs)
+    chunks = [
+        (position, key, items[start : start + chunk_size])
+        for position, (key, items) in enumerate(batches)
+        for start in range(0, len(items), chunk_size)
+    ]
+
+    # spans and counters recorded by the workers stay in their processes
+    with span("encrypt.pool"), ProcessPoolExecutor(max_workers=jobs) as executor:
+        chunk_results = executor.map(
+            _encrypt_batch,
+            [key for _, key, _ in chunks],
+            [items for _, _, items in chunks],
+        )
+        results = [[] for _ in batches]
+        for (position, _, _), batch_results in zip(chunks, chunk_results):
+            results[position].extend(batch_results)
+    return [_count_encryptions(batch_results) for batch_results in results]
+
+
+def _key_url(user_repo, url, token=None):
+    """Return the URL the key is requested from and cached under.
+
+    url is an endpoint built by endpoint_url; the legacy endpoint of
+    unauthenticated requests is completed with the repository.
+    """
+    if token:
+        return url
+    return "{}/{}/key".format(url, user_repo)
+
+
+def _job_count(jobs, tasks):
+    """Return the number of workers for the tasks; 0 or None uses every core."""
+    import multiprocessing
+
+    if not jobs or jobs < 1:
+        jobs = multiprocessing.cpu_count()
+    return min(jobs, tasks)
+
+
+def _count_encryptions(results):
+    """Count the encrypted values and errors of a batch and return its results."""
+    errors = sum(1 for result in results if result.error is not None)
+    increment("encryptions", len(results) - errors)
+    increment("encryption_errors", errors)
+    return results
+
+
+def _encrypt_batch(key, items):
+    """Encrypt the (name, value) pairs sequentially; see encrypt_many."""
+    from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
+
+    public_key = load_public_key(key)
+    padding = PKCS1v15()
+
+    results = []
+    for name, value in items:
+        try:
+            if not isinstance(value, bytes):
+                value = value.encode()
+            with span("encrypt"):
+                encrypted = public_key.encrypt(value, padding)
+        except (AttributeError, TypeError, ValueError) as error:
+            results.append(EncryptionResult(name, None, error))
+        else:
+            results.append(
+                EncryptionResult(
+                    name, base64.b64encode(encrypted).decode("ascii"), None
+                )
+            )
+
+    return results
+
+
 def load_travis_configuration(path):
     """Load the travis configuration settings from the travis.yml file.
 
@@ -122,6 +617,8 @@ def load_travis_configuration(path):
     config: collections.OrderedDict
         The configuration settings in an OrderedDict object
     """
+    from travis.orderer import ordered_load
+
     with open(path) as config_file:
         config = ordered_load(config_file)
 
@@ -133,7 +630,9 @@ def dump_travis_configuration(config, path):
 
     The configuration settings from the travis.yml will be dumped with
     ordering preserved. Thus, when a password is added to the travis.yml
-    file, a diff will show that only the password was added.
+    file, a diff will show that only the password was added. The file is
+    replaced atomically and is not written at all when its contents would
+    not change.
 
     Parameters
     ----------
@@ -146,5 +645,6 @@ def dump_travis_configuration(config, path):
     -------
     None
     """
-    with open(path, "w") as config_file:
-        ordered_dump(config, config_file, default_flow_style=False)
+    from travis.orderer import ordered_dump
+
+    write_file(path, ordered_dump(config, default_flow_style=False))
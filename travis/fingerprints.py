@@ -0,0 +1,88 @@
+"""Encrypt passwords and environment variables for use with Travis CI.
+
+The fingerprints module contains the sidecar store that remembers which
+plaintext every encrypted variable of a .travis.yml file holds. PKCS1v15
+encryption is randomized, so encrypting an unchanged value produces a new
+ciphertext; comparing fingerprints instead lets unchanged variables keep
+their existing ciphertext.
+
+A fingerprint is an HMAC-SHA256 of the variable name and value keyed with
+a random salt stored in the sidecar file, combined with the value of the
+TRAVIS_ENCRYPT_FINGERPRINT_KEY environment variable when it is set. The
+fingerprint of the public key is stored alongside so that a rotated key
+causes every variable to be encrypted again.
+"""
+import binascii
+import hashlib
+import hmac
+import io
+import json
+import os
+
+from travis.config import write_file
+
+VERSION = 1
+
+
+class FingerprintStore(object):
+    """Remember the fingerprints of encrypted variables in a JSON sidecar file.
+
+    Parameters
+    ----------
+    path: str
+        the sidecar file, created on save if it does not exist
+
+    Raises
+    ------
+    ValueError
+        raised when the sidecar file is not a fingerprint store of a
+        supported version
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with io.open(path, encoding="utf-8") as store_file:
+                data = json.load(store_file)
+        except (IOError, OSError):
+            data = {}
+        except ValueError as error:
+            raise ValueError("Invalid fingerprint store {}: {}".format(path, error))
+
+        if not isinstance(data, dict):
+            raise ValueError("Invalid fingerprint store {}: not an object".format(path))
+        if data.get("version", VERSION) != VERSION:
+            raise ValueError("Unsupported fingerprint store version in {}".format(path))
+
+        self.salt = data.get("salt") or binascii.hexlify(os.urandom(32)).decode("ascii")
+        self.variables = data.get("variables", {})
+        secret = os.environ.get("TRAVIS_ENCRYPT_FINGERPRINT_KEY", "")
+        self._hmac_key = (self.salt + secret).encode("utf-8")
+
+    def fingerprint(self, name, value):
+        """Return the keyed fingerprint of the variable's plaintext value."""
+        if not isinstance(value, bytes):
+            value = value.encode("utf-8")
+        message = name.encode("utf-8") + b"\0" + value
+        return hmac.new(self._hmac_key, message, hashlib.sha256).hexdigest()
+
+    def is_unchanged(self, name, value, key_fingerprint):
+        """Return True if the variable was recorded with this value and public key."""
+        entry = self.variables.get(name)
+        if entry is None or value is None:
+            return False
+        return entry.get("key") == key_fingerprint and hmac.compare_digest(
+            entry.get("fingerprint", ""), self.fingerprint(name, value)
+        )
+
+    def record(self, name, value, key_fingerprint):
+        """Remember that the variable now holds value encrypted with the public key."""
+        self.variables[name] = {
+            "fingerprint": self.fingerprint(name, value),
+            "key": key_fingerprint,
+        }
+
+    def save(self):
+        """Write the store to its sidecar file; see travis.config.write_file."""
+        data = {"version": VERSION, "salt": self.salt, "variables": self.variables}
+        return write_file(self.path, json.dumps(data, indent=2, sort_keys=True) + "\n")
@@ -0,0 +1,146 @@
+"""Encrypt passwords and environment variables for use with Travis CI.
+
+The keyfile module loads public keys from local files so that values can be
+encrypted without the Travis CI API. A key file is either a single PEM
+encoded public key, used for every repository, or a bundle mapping
+repositories to pinned keys in JSON or YAML:
+
+    mandeep/Travis-Encrypt:
+      key: |
+        -----BEGIN PUBLIC KEY-----
+        ...
+      fingerprint: SHA256:...
+    mandeep/other: |
+      -----BEGIN PUBLIC KEY-----
+      ...
+
+A fingerprint, as computed by travis.encrypt.public_key_fingerprint, is
+optional and verified when the bundle is loaded, so that a tampered or
+outdated key is rejected before anything is encrypted with it.
+"""
+import io
+import json
+
+from travis.config import string_types
+from travis.encrypt import InvalidCredentialsError, public_key_fingerprint
+
+
+class KeyFileError(Exception):
+    """Raised when a key file cannot be parsed or a pinned key does not verify."""
+
+
+class KeyBundle(object):
+    """Public keys of repositories loaded from a key file.
+
+    Parameters
+    ----------
+    keys: dict
+        PEM encoded public keys by 'username/repository'
+    default: str
+        the PEM encoded public key of every repository missing from keys
+    """
+
+    def __init__(self, keys=None, default=None):
+        self.keys = dict(keys or {})
+        self.default = default
+
+    def get(self, user_repo):
+        """Return the public key of the repository.
+
+        Raises
+        ------
+        InvalidCredentialsError
+            raised when the bundle holds no key for the repository
+        """
+        key = self.keys.get(user_repo, self.default)
+        if key is None:
+            raise InvalidCredentialsError(
+                "The key file holds no public key for {}".format(user_repo)
+            )
+        return key
+
+    __call__ = get
+
+
+def normalize_fingerprint(fingerprint):
+    """Return the fingerprint in the 'SHA256:<lowercase hex>' format."""
+    digest = fingerprint.strip()
+    if digest.upper().startswith("SHA256:"):
+        digest = digest[len("SHA256:") :]
+    return "SHA256:" + digest.replace(":", "").lower()
+
+
+def verify_key(user_repo, key, fingerprint=None):
+    """Check that the key parses and matches its pinned fingerprint.
+
+    Raises
+    ------
+    KeyFileError
+        raised when the key is invalid or its fingerprint differs
+    """
+    try:
+        actual = public_key_fingerprint(key)
+    except (TypeError, ValueError) as error:
+        raise KeyFileError("Invalid public key for {}: {}".format(user_repo, error))
+
+    if fingerprint is not None and actual != normalize_fingerprint(fingerprint):
+        raise KeyFileError(
+            "The public key of {} has the fingerprint {} instead of the pinned {}".format(
+                user_repo, actual, fingerprint
+            )
+        )
+
+
+def parse_bundle(text):
+    """Parse the JSON or YAML text of a bundle into a KeyBundle."""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        import yaml
+
+        from travis.orderer import ordered_load
+
+        try:
+            data = ordered_load(text)
+        except yaml.YAMLError as error:
+            raise KeyFileError("Invalid key bundle: {}".format(error))
+
+    if not isinstance(data, dict):
+        raise KeyFileError("A key bundle must map 'username/repository' to keys")
+
+    keys = {}
+    for user_repo, entry in data.items():
+        if isinstance(entry, string_types):
+            key, fingerprint = entry, None
+        elif isinstance(entry, dict) and isinstance(entry.get("key"), string_types):
+            key, fingerprint = entry["key"], entry.get("fingerprint")
+        else:
+            raise KeyFileError("Missing public key for {}".format(user_repo))
+
+        verify_key(user_repo, key, fingerprint)
+        keys[user_repo] = key
+
+    return KeyBundle(keys)
+
+
+def load_key_file(path):
+    """Load a PEM encoded public key or a key bundle from the file at path.
+
+    Returns
+    -------
+    bundle: KeyBundle
+        the pinned keys; a PEM file yields a bundle whose key is the default
+        of every repository
+
+    Raises
+    ------
+    KeyFileError
+        raised when the file cannot be parsed or a pinned key does not verify
+    """
+    with io.open(path, encoding="utf-8") as key_file:
+        text = key_file.read()
+
+    if text.lstrip().startswith("-----BEGIN"):
+        verify_key(path, text)
+        return KeyBundle(default=text)
+    return parse_bundle(text)
@@ -0,0 +1,199 @@
+"""Encrypt passwords and environment variables for use with Travis CI.
+
+The manifest module reads YAML (or JSON) manifests describing many
+repositories and the API settings of each of them:
+
+    defaults:
+      private: true
+      token_env: TRAVIS_TOKEN
+    repositories:
+      - mandeep/Travis-Encrypt
+      - repo: mandeep/open-source
+        private: false
+        token: null
+
+A manifest may also be a plain list of repositories. private selects the
+travis-ci.com endpoint. token_env names an environment variable holding the
+token, so that tokens never have to be written to the manifest itself.
+
+Rotation manifests list targets instead, each naming the .travis.yml files
+of a repository and the env.global variables to encrypt into them:
+
+    env_file: secrets.env
+    defaults:
+      token_env: TRAVIS_TOKEN
+    targets:
+      - repo: mandeep/Travis-Encrypt
+        files: [.travis.yml]
+        variables: [API_KEY, TOKEN]
+
+The plaintext of every variable is read from env_file, falling back to the
+environment. Relative paths are relative to the directory of the manifest.
+"""
+from collections import namedtuple
+import io
+import os
+
+from travis.config import string_types
+
+RepositorySpec = namedtuple("RepositorySpec", ["user_repo", "private", "token"])
+
+RotationTarget = namedtuple("RotationTarget", ["spec", "paths", "variables"])
+
+SETTINGS = ("private", "token", "token_env")
+
+
+class ManifestError(Exception):
+    """Raised when a manifest cannot be read or is not well formed."""
+
+
+def read_manifest(path):
+    """Return the parsed contents of the YAML or JSON manifest at path."""
+    import yaml
+
+    from travis.orderer import ordered_load
+
+    try:
+        with io.open(path, encoding="utf-8") as manifest_file:
+            return ordered_load(manifest_file)
+    except (IOError, OSError, yaml.YAMLError) as error:
+        raise ManifestError("Could not read the manifest {}: {}".format(path, error))
+
+
+def resolve_settings(settings, defaults, fields=("repo",)):
+    """Merge the entry's settings over the defaults and resolve token_env.
+
+    Keys of the entry that are neither settings nor one of fields are
+    rejected, which catches misspelled settings.
+    """
+    unknown = set(settings) - set(SETTINGS) - set(fields)
+    if unknown:
+        raise ManifestError("Unknown settings: {}".format(", ".join(sorted(unknown))))
+
+    merged = dict(defaults)
+    if "token" in settings or "token_env" in settings:
+        merged.pop("token", None)
+        merged.pop("token_env", None)
+    merged.update((name, settings[name]) for name in SETTINGS if name in settings)
+
+    token = merged.get("token")
+    if merged.get("token_env"):
+        token = os.environ.get(merged["token_env"])
+        if not token:
+            raise ManifestError(
+                "The environment variable {} holds no token".format(merged["token_env"])
+            )
+    return bool(merged.get("private")), token
+
+
+def repository_specs(data, private=False, token=None):
+    """Return the RepositorySpec of every repository listed by the manifest data.
+
+    Parameters
+    ----------
+    data: list or dict
+        the parsed manifest
+    private: bool
+        the default of repositories whose manifest entry does not say
+    token: str
+        the default token of repositories whose manifest entry does not say
+
+    Returns
+    -------
+    specs: list
+        a RepositorySpec(user_repo, private, token) for every distinct
+        repository in manifest order
+    """
+    if isinstance(data, dict):
+        defaults = manifest_defaults(data, private, token)
+        entries = data.get("repositories")
+    else:
+        defaults = {"private": private, "token": token}
+        entries = data
+
+    if not isinstance(entries, list):
+        raise ManifestError("The manifest must list its repositories")
+
+    specs = []
+    seen = set()
+    for entry in entries:
+        if isinstance(entry, string_types):
+            entry = {"repo": entry}
+        spec = repository_spec(entry, defaults)
+        if spec.user_repo not in seen:
+            seen.add(spec.user_repo)
+            specs.append(spec)
+
+    return specs
+
+
+def manifest_defaults(data, private=False, token=None):
+    """Return the defaults of the manifest resolved over the given defaults."""
+    defaults = data.get("defaults") or {}
+    if not isinstance(defaults, dict):
+        raise ManifestError("defaults must be a mapping")
+    private, token = resolve_settings(
+        defaults, {"private": private, "token": token}, fields=()
+    )
+    return {"private": private, "token": token}
+
+
+def repository_spec(entry, defaults, fields=("repo",)):
+    """Return the RepositorySpec of a manifest entry naming a repository."""
+    if not isinstance(entry, dict) or not isinstance(entry.get("repo"), string_types):
+        raise ManifestError("Invalid repository entry: {!r}".format(entry))
+
+    user_repo = entry["repo"]
+    if user_repo.count("/") != 1 or not all(user_repo.split("/")):
+        raise ManifestError(
+            "'{}' is not in the format of 'username/repository'".format(user_repo)
+        )
+
+    private, token = resolve_settings(entry, defaults, fields)
+    return RepositorySpec(user_repo, private, token)
+
+
+def rotation_targets(data, base=".", private=False, token=None):
+    """Return the RotationTarget of every target of a rotation manifest.
+
+    Parameters
+    ----------
+    data: dict
+        the parsed rotation manifest
+    base: str
+        the directory relative file paths are resolved against
+    private: bool
+        the default of targets whose repository settings do not say
+    token: str
+        the default token of targets whose repository settings do not say
+
+    Returns
+    -------
+    targets: list
+        a RotationTarget(spec, paths, variables) for every target, where spec
+        is a RepositorySpec and paths and variables are lists of strings
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("targets"), list):
+        raise ManifestError("A rotation manifest must list its targets")
+
+    defaults = manifest_defaults(data, private, token)
+    targets = []
+    for entry in data["targets"]:
+        spec = repository_spec(entry, defaults, ("repo", "file", "files", "variables"))
+
+        paths = entry.get("files", entry.get("file"))
+        if isinstance(paths, string_types):
+            paths = [paths]
+        variables = entry.get("variables")
+        if isinstance(variables, string_types):
+            variables = [variables]
+        for name, values in (("files", paths), ("variables", variables)):
+            if not values or not all(isinstance(v, string_types) for v in values):
+                raise ManifestError(
+                    "The target of {} must list its {}".format(spec.user_repo, name)
+                )
+
+        paths = [os.path.join(base, os.path.expanduser(path)) for path in paths]
+        targets.append(RotationTarget(spec, paths, list(variables)))
+
+    return targets
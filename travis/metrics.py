@@ -0,0 +1,232 @@
+"""Encrypt passwords and environment variables for use with Travis CI.
+
+The metrics module counts what a run did, so that bulk runs such as
+rotations can be graphed: public key retrievals, HTTP responses by status,
+pages of owner repositories listed, hits and misses of the public key
+caches, encryptions and the files and bytes written. Latency histograms are built from the spans of
+travis.timing. Collection is off by default and costs a single attribute
+lookup per counter; the --metrics-file option of the CLI turns it on and
+writes the metrics as JSON or in the Prometheus text format.
+
+Encryptions performed by worker processes are counted by the parent once
+their results are returned.
+
+Available functions:
+increment -- add to a counter
+observe -- add a duration to the latency histogram of a phase
+enable_metrics -- turn collection on or off
+reset_metrics -- zero every counter and histogram
+metrics_snapshot -- return the counters and histograms as a dictionary
+format_prometheus -- render a snapshot in the Prometheus text format
+write_metrics -- write the metrics to a JSON or Prometheus textfile
+"""
+from collections import OrderedDict
+import bisect
+import json
+import threading
+
+from travis.timing import add_span_listener, remove_span_listener
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+COUNTERS = OrderedDict(
+    [
+        ("key_fetches", "Public keys requested from retrieve_public_key"),
+        ("key_cache_hits", "Public keys served fresh from the on-disk cache"),
+        ("key_cache_misses", "Public keys missing from or stale in the on-disk cache"),
+        ("key_cache_revalidations", "Stale cached public keys confirmed by a 304"),
+        ("http_responses", "Travis API responses by HTTP status"),
+        ("owner_pages", "Pages of owner repositories listed"),
+        ("parsed_key_cache_hits", "Public keys reused from the parsed key cache"),
+        ("parsed_key_cache_misses", "Public keys parsed from PEM"),
+        ("encryptions", "Values encrypted"),
+        ("encryption_errors", "Values that could not be encrypted"),
+        ("files_written", "Files replaced with new contents"),
+        ("files_unchanged", "Files left untouched because nothing changed"),
+        ("bytes_written", "Bytes of UTF-8 text written to files"),
+    ]
+)
+
+PREFIX = "travis_encrypt_"
+
+
+class _Registry(object):
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.counters = OrderedDict()
+        self.histograms = OrderedDict()
+
+
+_registry = _Registry()
+
+
+def increment(name, amount=1, **labels):
+    """Add amount to the counter name, kept apart for every set of labels.
+
+    Example:
+    increment("http_responses", status="200")
+    """
+    if not _registry.enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _registry.lock:
+        _registry.counters[key] = _registry.counters.get(key, 0) + amount
+
+
+def observe(phase, seconds):
+    """Add a duration in seconds to the latency histogram of the phase."""
+    if not _registry.enabled:
+        return
+    with _registry.lock:
+        histogram = _registry.histograms.get(phase)
+        if histogram is None:
+            histogram = _registry.histograms[phase] = {
+                "buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+                "count": 0,
+                "sum": 0.0,
+            }
+        histogram["buckets"][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        histogram["count"] += 1
+        histogram["sum"] += seconds
+
+
+def enable_metrics(enabled=True):
+    """Turn the collection of counters and latency histograms on or off."""
+    if enabled and not _registry.enabled:
+        add_span_listener(observe)
+    elif not enabled and _registry.enabled:
+        remove_span_listener(observe)
+    _registry.enabled = enabled
+
+
+def reset_metrics():
+    """Zero every counter and histogram."""
+    with _registry.lock:
+        _registry.counters.clear()
+        _registry.histograms.clear()
+
+
+def metrics_snapshot():
+    """Return the counters and latency histograms collected so far.
+
+    Returns
+    -------
+    snapshot: collections.OrderedDict
+        'counters' maps every counter name to its total, or to a list of
+        {'labels': ..., 'value': ...} entries for labelled counters such as
+        http_responses. 'histograms' maps every phase to its count, sum in
+        seconds and cumulative bucket counts keyed by upper bound.
+    """
+    with _registry.lock:
+        counters = list(_registry.counters.items())
+        histograms = [
+            (phase, list(histogram["buckets"]), histogram["count"], histogram["sum"])
+            for phase, histogram in _registry.histograms.items()
+        ]
+
+    counter_values = OrderedDict()
+    for name in COUNTERS:
+        entries = sorted(
+            (labels, value) for (other, labels), value in counters if other == name
+        )
+        if not entries:
+            counter_values[name] = 0
+        elif entries[0][0]:
+            counter_values[name] = [
+                OrderedDict([("labels", OrderedDict(labels)), ("value", value)])
+                for labels, value in entries
+            ]
+        else:
+            counter_values[name] = entries[0][1]
+
+    histogram_values = OrderedDict()
+    for phase, buckets, count, total in histograms:
+        cumulative = OrderedDict()
+        seen = 0
+        for bound, bucket in zip(LATENCY_BUCKETS + ("+Inf",), buckets):
+            seen += bucket
+            cumulative[str(bound)] = seen
+        histogram_values[phase] = OrderedDict(
+            [("count", count), ("sum", total), ("buckets", cumulative)]
+        )
+
+    return OrderedDict([("counters", counter_values), ("histograms", histogram_values)])
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{{{}}}".format(
+        ",".join(
+            '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+            for name, value in labels.items()
+        )
+    )
+
+
+def format_prometheus(snapshot=None):
+    """Render a snapshot in the Prometheus text exposition format."""
+    snapshot = metrics_snapshot() if snapshot is None else snapshot
+    lines = []
+    for name, value in snapshot["counters"].items():
+        metric = "{}{}_total".format(PREFIX, name)
+        lines.append("# HELP {} {}".format(metric, COUNTERS[name]))
+        lines.append("# TYPE {} counter".format(metric))
+        entries = value if isinstance(value, list) else [{"value": value}]
+        for entry in entries:
+            lines.append(
+                "{}{} {}".format(metric, _labels(entry.get("labels")), entry["value"])
+            )
+
+    if snapshot["histograms"]:
+        metric = "{}phase_duration_seconds".format(PREFIX)
+        lines.append("# HELP {} Time spent in each phase".format(metric))
+        lines.append("# TYPE {} histogram".format(metric))
+        for phase, histogram in snapshot["histograms"].items():
+            for bound, count in histogram["buckets"].items():
+                labels = OrderedDict([("phase", phase), ("le", bound)])
+                lines.append("{}_bucket{} {}".format(metric, _labels(labels), count))
+            labels = _labels({"phase": phase})
+            lines.append("{}_sum{} {!r}".format(metric, labels, histogram["sum"]))
+            lines.append("{}_count{} {}".format(metric, labels, histogram["count"]))
+
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path):
+    """Write the metrics to path, as JSON when it ends in .json.
+
+    Any other path is written in the Prometheus text format, for example for
+    the textfile collector of the node exporter. The file is replaced
+    atomically so that a collector never reads it half written; writing it
+    is not itself counted.
+    """
+    from travis.config import write_file
+
+    snapshot = metrics_snapshot()
+    if path.lower().endswith(".json"):
+        text = json.dumps(snapshot, indent=2) + "\n"
+    else:
+        text = format_prometheus(snapshot)
+
+    enabled = _registry.enabled
+    _registry.enabled = False
+    try:
+        write_file(path, text)
+    finally:
+        _registry.enabled = enabled
@@ -3,16 +3,29 @@
 The orderer module contains functions necessary to load and dump
 yaml configurations as OrderedDicts as a way to preserve ordering.
 
+The ordered loader and dumper classes are built once at import. They are
+based on the libyaml C implementation when PyYAML was built with it and
+fall back to the pure Python implementation otherwise.
+
 Source: https://stackoverflow.com/questions/5121931/
 """
 from collections import OrderedDict
 
 import yaml
 
+from travis.timing import span
+
+try:
+    from yaml import CSafeDumper as SafeDumper, CSafeLoader as SafeLoader
+
+    LIBYAML = True
+except ImportError:
+    from yaml import SafeDumper, SafeLoader
+
+    LIBYAML = False
 
-def ordered_load(stream, Loader=yaml.SafeLoader, object_pairs_hook=OrderedDict):
-    """Load a yaml configuration into an OrderedDict."""
 
+def _ordered_loader(Loader, object_pairs_hook):
     class OrderedLoader(Loader):
         pass
 
@@ -23,13 +36,10 @@ def ordered_load(stream, Loader=yaml.SafeLoader, object_pairs_hook=OrderedDict):
     OrderedLoader.add_constructor(
         yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG, construct_mapping
     )
+    return OrderedLoader
 
-    return yaml.load(stream, OrderedLoader)
-
-
-def ordered_dump(data, stream=None, Dumper=yaml.SafeDumper, **kwds):
-    """Dump a yaml configuration as an OrderedDict."""
 
+def _ordered_dumper(Dumper):
     class OrderedDumper(Dumper):
         pass
 
@@ -39,5 +49,35 @@ def ordered_dump(data, stream=None, Dumper=yaml.SafeDumper, **kwds):
         )
 
     OrderedDumper.add_representer(OrderedDict, dict_representer)
+    return OrderedDumper
+
+
+OrderedLoader = _ordered_loader(SafeLoader, OrderedDict)
+OrderedDumper = _ordered_dumper(SafeDumper)
+
+_loaders = {(SafeLoader, OrderedDict): OrderedLoader}
+_dumpers = {SafeDumper: OrderedDumper}
+
+
+def ordered_load(stream, Loader=SafeLoader, object_pairs_hook=OrderedDict):
+    """Load a yaml configuration into an OrderedDict."""
+    try:
+        OrderedLoader = _loaders[Loader, object_pairs_hook]
+    except KeyError:
+        OrderedLoader = _loaders.setdefault(
+            (Loader, object_pairs_hook), _ordered_loader(Loader, object_pairs_hook)
+        )
+
+    with span("yaml.load"):
+        return yaml.load(stream, OrderedLoader)
+
+
+def ordered_dump(data, stream=None, Dumper=SafeDumper, **kwds):
+    """Dump a yaml configuration as an OrderedDict."""
+    try:
+        OrderedDumper = _dumpers[Dumper]
+    except KeyError:
+        OrderedDumper = _dumpers.setdefault(Dumper, _ordered_dumper(Dumper))
 
-    return yaml.dump(data, stream, OrderedDumper, **kwds)
+    with span("yaml.dump"):
+        return yaml.dump(data, stream, OrderedDumper, **kwds)
@@ -0,0 +1,184 @@
+"""Encrypt passwords and environment variables for use with Travis CI.
+
+The patcher module rewrites scalar values of a .travis.yml file in place.
+Instead of loading the whole configuration and dumping it again, the
+file's YAML event stream is walked until the targeted scalars are found
+and only their character ranges are replaced. The rest of the file,
+including comments, anchors and formatting, is left untouched, and the
+walk stops as soon as every target has been located.
+
+Paths are tuples of mapping keys and sequence indexes, for example
+('deploy', 'password', 'secure') or ('env', 'global', 2, 'secure'). An
+index of None matches every item of a sequence.
+"""
+import json
+import re
+
+import yaml
+
+from travis.orderer import SafeLoader
+
+BOM = u"\ufeff"
+PLAIN_SAFE = re.compile(r"^[A-Za-z0-9+/=][A-Za-z0-9+/=._-]*$")
+
+
+class NodeNotFoundError(KeyError):
+    """Error raised when a path does not lead to a scalar that can be patched."""
+
+
+def locate_scalars(text, paths, Loader=SafeLoader):
+    """Locate the scalars at the given paths in a YAML document.
+
+    Parameters
+    ----------
+    text: str
+        the YAML document
+    paths: iterable
+        tuples of mapping keys and sequence indexes, None matches any index
+
+    Returns
+    -------
+    locations: dict
+        every path mapped to a list of (start, end, style) tuples giving the
+        character range of each matching scalar and its quoting style; a
+        path that matches nothing maps to an empty list
+    """
+    # libyaml does not count a byte order mark in its marks, so the document
+    # is parsed without it and the ranges shifted past it
+    offset = 0
+    if text.startswith(BOM):
+        text, offset = text[len(BOM) :], len(BOM)
+
+    patterns = [tuple(path) for path in paths]
+    locations = dict((pattern, []) for pattern in patterns)
+    remaining = set(pattern for pattern in patterns if None not in pattern)
+
+    # each frame is [kind, path, key or index, expecting a key]
+    stack = []
+    for event in yaml.parse(text, Loader):
+        if isinstance(event, yaml.DocumentEndEvent):
+            break
+
+        if isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+            stack.pop()
+            _advance(stack)
+            continue
+
+        if not isinstance(event, yaml.NodeEvent):
+            continue
+
+        if stack and stack[-1][0] == "mapping" and stack[-1][3]:
+            frame = stack[-1]
+            frame[2] = event.value if isinstance(event, yaml.ScalarEvent) else None
+            frame[3] = False
+            if isinstance(event, yaml.CollectionStartEvent):
+                # complex keys are skipped along with their contents
+                stack.append(_frame(event, None))
+            continue
+
+        path = _child_path(stack)
+
+        if isinstance(event, yaml.ScalarEvent):
+            if path is not None:
+                for pattern in patterns:
+                    if _matches(pattern, path):
+                        locations[pattern].append(
+                            (
+                                event.start_mark.index + offset,
+                                event.end_mark.index + offset,
+                                event.style,
+                            )
+                        )
+                        remaining.discard(pattern)
+            _advance(stack)
+            if not remaining and all(None not in pattern for pattern in patterns):
+                break
+        elif isinstance(event, yaml.CollectionStartEvent):
+            stack.append(_frame(event, path))
+        else:
+            _advance(stack)
+
+    return locations
+
+
+def patch_scalars(text, replacements, Loader=SafeLoader):
+    """Replace the scalars at the given paths with new string values.
+
+    Parameters
+    ----------
+    text: str
+        the YAML document
+    replacements: dict
+        paths (see locate_scalars) mapped to their new string values
+
+    Returns
+    -------
+    text: str
+        the YAML document with only the targeted scalars rewritten
+
+    Raises
+    ------
+    NodeNotFoundError
+        raised when a path matches no scalar, a block scalar, an empty
+        scalar or a scalar with an anchor or a tag, in which case the
+        document has to be rewritten as a whole
+    """
+    locations = locate_scalars(text, replacements, Loader)
+
+    missing = [path for path, spans in locations.items() if not spans]
+    if missing:
+        raise NodeNotFoundError(missing)
+
+    edits = []
+    for path, spans in locations.items():
+        for start, end, style in spans:
+            # an empty scalar has no room for the value, and the range of an
+            # anchored or tagged scalar starts with its &anchor or !tag, which
+            # aliases elsewhere in the document may still refer to
+            if style in ("|", ">") or start == end or text[start] in "&!":
+                raise NodeNotFoundError([path])
+            edits.append((start, end, render_scalar(replacements[path], style)))
+
+    for start, end, rendered in sorted(edits, reverse=True):
+        text = text[:start] + rendered + text[end:]
+    return text
+
+
+def render_scalar(value, style=None):
+    """Render a string as a YAML scalar, keeping the original quoting style if possible."""
+    if style == "'" and "'" not in value and "\n" not in value:
+        return "'{}'".format(value)
+    if not style and PLAIN_SAFE.match(value) and yaml.safe_load(value) == value:
+        return value
+    return json.dumps(value)
+
+
+def _frame(event, path):
+    kind = "mapping" if isinstance(event, yaml.MappingStartEvent) else "sequence"
+    return [kind, path, 0 if kind == "sequence" else None, kind == "mapping"]
+
+
+def _child_path(stack):
+    if not stack:
+        return ()
+    kind, path, position, _ = stack[-1]
+    if path is None or (kind == "mapping" and position is None):
+        return None
+    return path + (position,)
+
+
+def _advance(stack):
+    if not stack:
+        return
+    frame = stack[-1]
+    if frame[0] == "mapping":
+        frame[3] = True
+    else:
+        frame[2] += 1
+
+
+def _matches(pattern, path):
+    return len(pattern) == len(path) and all(
+        expected is None and isinstance(actual, int) or expected == actual
+        for expected, actual in zip(pattern, path)
+    )
@@ -0,0 +1,205 @@
+"""Encrypt passwords and environment variables for use with Travis CI.
+
+The rotate module plans and applies rotation manifests, see
+travis.manifest.rotation_targets. Planning deduplicates the public keys to
+retrieve and groups the variables by .travis.yml file. Applying the plan
+retrieves every key once, encrypts every value in one pool of worker
+processes and writes each file once.
+
+Available functions:
+plan_rotation -- group rotation targets by file and repository
+read_values -- read the plaintext of variables from a .env file and the environment
+apply_rotation -- encrypt the variables of a plan into their files
+"""
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+from travis.config import ConfigFile
+from travis.encrypt import (
+    encrypt_batches,
+    endpoint_url,
+    InvalidCredentialsError,
+    RateLimitedError,
+    retrieve_public_key,
+)
+from travis.manifest import ManifestError
+from travis.session import DEFAULT_POOL_SIZE
+
+RotationPlan = namedtuple("RotationPlan", ["specs", "files"])
+
+RotationResult = namedtuple(
+    "RotationResult", ["path", "user_repo", "encrypted", "written", "errors"]
+)
+
+
+def plan_rotation(targets):
+    """Group the rotation targets by file and repository.
+
+    Parameters
+    ----------
+    targets: iterable
+        travis.manifest.RotationTarget tuples
+
+    Returns
+    -------
+    plan: RotationPlan
+        specs maps every distinct repository to its RepositorySpec and files
+        maps every file to a (user_repo, variables) pair, both in manifest order
+
+    Raises
+    ------
+    ManifestError
+        raised when a repository is listed with different settings or a file
+        is targeted by two repositories
+    """
+    specs = OrderedDict()
+    files = OrderedDict()
+    for spec, paths, variables in targets:
+        if specs.setdefault(spec.user_repo, spec) != spec:
+            raise ManifestError(
+                "{} is listed with different settings".format(spec.user_repo)
+            )
+
+        for path in paths:
+            user_repo, names = files.setdefault(path, (spec.user_repo, []))
+            if user_repo != spec.user_repo:
+                raise ManifestError(
+                    "{} is targeted by both {} and {}".format(
+                        path, user_repo, spec.user_repo
+                    )
+                )
+            names.extend(name for name in variables if name not in names)
+
+    return RotationPlan(specs, files)
+
+
+def read_values(names, env_file=None):
+    """Return the plaintext of the named variables that are defined.
+
+    Values are read from the .env file when one is given and from the
+    environment otherwise.
+    """
+    variables = {}
+    if env_file is not None:
+        from dotenv import dotenv_values
+
+        variables = dotenv_values(env_file)
+
+    values = {}
+    for name in names:
+        value = variables.get(name)
+        if value is None:
+            value = os.environ.get(name)
+        if value is not None:
+            values[name] = value
+    return values
+
+
+def apply_rotation(
+    plan, values, cache=None, refresh=False, concurrency=DEFAULT_POOL_SIZE, jobs=1
+):
+    """Encrypt the variables of the plan and write them into their files.
+
+    Parameters
+    ----------
+    plan: RotationPlan
+        the plan returned by plan_rotation
+    values: dict
+        the plaintext of every variable, see read_values
+    cache: travis.cache.KeyCache
+        the public key cache consulted before the Travis API
+    refresh: bool
+        revalidate cached public keys with the API even if they are fresh
+    concurrency: int
+        the number of public keys retrieved at the same time
+    jobs: int
+        the number of worker processes encrypting values; 0 uses every core
+
+    Returns
+    -------
+    results: list
+        a RotationResult(path, user_repo, encrypted, written, errors) for every
+        file of the plan, where encrypted lists the variables updated, written
+        is False when the file already held them and errors lists
+        (variable, message) pairs of what could not be done
+    """
+    import yaml
+    from requests.exceptions import RequestException
+
+    def retrieve(spec):
+        try:
+            key = retrieve_public_key(
+                spec.user_repo,
+                endpoint_url(spec.user_repo, spec.private, spec.token),
+                token=spec.token,
+                cache=cache,
+                refresh=refresh,
+            )
+        except (InvalidCredentialsError, RateLimitedError, RequestException) as error:
+            return spec.user_repo, None, error
+        return spec.user_repo, key, None
+
+    keys = {}
+    errors = {}
+    if plan.specs:
+        workers = max(1, min(concurrency, len(plan.specs)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for user_repo, key, error in executor.map(retrieve, plan.specs.values()):
+                keys[user_repo] = key
+                errors[user_repo] = error
+
+    pending = []
+    for path, (user_repo, names) in plan.files.items():
+        if errors[user_repo] is None:
+            items = [(name, values[name]) for name in names if name in values]
+            pending.append((path, keys[user_repo], items))
+    encrypted_batches = encrypt_batches(
+        [(key, items) for _, key, items in pending], jobs
+    )
+    encrypted_files = dict(
+        (path, batch) for (path, _, _), batch in zip(pending, encrypted_batches)
+    )
+
+    results = []
+    for path, (user_repo, names) in plan.files.items():
+        if errors[user_repo] is not None:
+            message = "public key unavailable: {}".format(errors[user_repo])
+            results.append(
+                RotationResult(path, user_repo, [], False, [(None, message)])
+            )
+            continue
+
+        file_errors = [
+            (name, "no value in the environment or env_file")
+            for name in names
+            if name not in values
+        ]
+        config_file = ConfigFile(path)
+        encrypted = []
+        for name, secure, error in encrypted_files[path]:
+            if error is None:
+                config_file.set_env_variable(name, secure)
+                encrypted.append(name)
+            else:
+                file_errors.append((name, str(error)))
+
+        written = False
+        if encrypted:
+            try:
+                written = config_file.flush()
+            except (
+                IOError,
+                OSError,
+                yaml.YAMLError,
+                AttributeError,
+                KeyError,
+                TypeError,
+            ) as error:
+                # a file that cannot be read, parsed or updated does not stop
+                # the rotation of the other files
+                file_errors.append((None, str(error)))
+                encrypted = []
+        results.append(RotationResult(path, user_repo, encrypted, written, file_errors))
+
+    return results
@@ -0,0 +1,208 @@
+"""Encrypt passwords and environment variables for use with Travis CI.
+
+The scheduler module contains the request scheduler that every call to the
+Travis CI API goes through. It spaces requests out with a token bucket,
+caps how many requests are in flight and backs off when the API reports
+that the rate limit has been reached, so that bulk runs go as fast as the
+API allows without tripping its limits.
+"""
+import threading
+import time
+
+DEFAULT_RATE = 10.0
+DEFAULT_BURST = 10
+DEFAULT_CONCURRENCY = 10
+DEFAULT_ATTEMPTS = 4
+DEFAULT_MAX_WAIT = 60.0
+
+monotonic = getattr(time, "monotonic", time.time)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+class RateLimitedError(Exception):
+    """Error raised when the Travis API keeps rejecting requests as rate limited."""
+
+    def __init__(self, message, retry_after=None):
+        super(RateLimitedError, self).__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket(object):
+    """Allow rate acquisitions per second with bursts of up to capacity.
+
+    Parameters
+    ----------
+    rate: float
+        the number of tokens added to the bucket per second
+    capacity: int
+        the maximum number of tokens the bucket holds
+    """
+
+    def __init__(self, rate, capacity, clock=monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token from the bucket, sleeping until one is available."""
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            self.sleep(delay)
+
+
+class RequestScheduler(object):
+    """Schedule HTTP requests to the Travis API.
+
+    Requests are admitted by a token bucket and a semaphore capping the
+    number in flight. A 429 response, or a response announcing that no
+    requests remain through X-RateLimit-Remaining, pauses every request
+    sent through the scheduler until the time given by the Retry-After or
+    X-RateLimit-Reset headers. Requests rejected with 429 are retried, and
+    RateLimitedError is raised once the attempts are exhausted or the API
+    asks to wait longer than max_wait seconds. A longer pause announced by
+    a successful response makes the requests sent during it raise
+    RateLimitedError instead of waiting.
+
+    Parameters
+    ----------
+    rate: float
+        the number of requests per second, None for no limit
+    burst: int
+        the number of requests that may be sent at once after being idle
+    concurrency: int
+        the maximum number of requests in flight
+    attempts: int
+        the number of times a rate limited request is sent
+    max_wait: float
+        the longest pause in seconds the scheduler accepts from the API
+    """
+
+    def __init__(
+        self,
+        rate=DEFAULT_RATE,
+        burst=DEFAULT_BURST,
+        concurrency=DEFAULT_CONCURRENCY,
+        attempts=DEFAULT_ATTEMPTS,
+        max_wait=DEFAULT_MAX_WAIT,
+        clock=monotonic,
+        sleep=time.sleep,
+    ):
+        self.bucket = TokenBucket(rate, burst, clock, sleep) if rate else None
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self.attempts = max(1, attempts)
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+        self.resume_at = 0.0
+        self.lock = threading.Lock()
+
+    def get(self, session, url, **kwargs):
+        """Send a GET request with the session once the scheduler admits it."""
+        for attempt in range(1, self.attempts + 1):
+            self._wait_until_resumed(url)
+            if self.bucket is not None:
+                self.bucket.acquire()
+
+            with self.semaphore:
+                response = session.get(url, **kwargs)
+
+            delay = rate_limit_delay(response)
+            if response.status_code != 429:
+                if delay is not None:
+                    self._pause(delay)
+                return response
+
+            if delay is None:
+                delay = 2 ** (attempt - 1)
+            if attempt == self.attempts or delay > self.max_wait:
+                raise RateLimitedError(
+                    "The Travis API rate limit was exceeded while requesting {}. "
+                    "Please retry in {:.0f} seconds.".format(url, delay),
+                    retry_after=delay,
+                )
+            self._pause(delay)
+
+    def _pause(self, delay):
+        with self.lock:
+            self.resume_at = max(self.resume_at, self.clock() + delay)
+
+    def _wait_until_resumed(self, url):
+        while True:
+            with self.lock:
+                delay = self.resume_at - self.clock()
+            if delay <= 0:
+                return
+            if delay > self.max_wait:
+                raise RateLimitedError(
+                    "The Travis API rate limit was exhausted before requesting {}. "
+                    "Please retry in {:.0f} seconds.".format(url, delay),
+                    retry_after=delay,
+                )
+            self.sleep(delay)
+
+
+def rate_limit_delay(response):
+    """Return the seconds the API asks clients to wait before the next request.
+
+    The Retry-After header may hold a number of seconds or an HTTP date.
+    Without it, X-RateLimit-Reset (a Unix timestamp) is used once
+    X-RateLimit-Remaining drops to zero. None is returned when the response
+    does not ask for a pause.
+    """
+    headers = response.headers
+    retry_after = headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            from email.utils import mktime_tz, parsedate_tz
+
+            date = parsedate_tz(retry_after)
+            if date is not None:
+                return max(0.0, mktime_tz(date) - time.time())
+
+    if headers.get("X-RateLimit-Remaining") == "0" and headers.get("X-RateLimit-Reset"):
+        try:
+            return max(0.0, float(headers["X-RateLimit-Reset"]) - time.time())
+        except ValueError:
+            pass
+
+    return None
+
+
+def get_scheduler():
+    """Return the shared scheduler, creating it with the default settings if needed."""
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+        return _scheduler
+
+
+def configure_scheduler(**settings):
+    """Replace the shared scheduler with one created from the given settings.
+
+    The keyword arguments are those accepted by RequestScheduler.
+    """
+    global _scheduler
+
+    scheduler = RequestScheduler(**settings)
+    with _scheduler_lock:
+        _scheduler = scheduler
+    return scheduler
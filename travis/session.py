@@ -0,0 +1,115 @@
+"""Encrypt passwords and environment variables for use with Travis CI.
+
+The session module contains the HTTP session shared by every request made
+to the Travis CI API. Reusing one session keeps connections alive between
+requests, while its timeouts and retry policy bound how long a slow or
+failing API can stall a run.
+
+The session is created on first use, so commands that never reach the API
+never import requests.
+"""
+import threading
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 30.0
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (500, 502, 503, 504)
+
+_session = None
+_settings = {}
+_session_lock = threading.Lock()
+
+
+def create_session(
+    pool_size=DEFAULT_POOL_SIZE,
+    connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+    read_timeout=DEFAULT_READ_TIMEOUT,
+    retries=DEFAULT_RETRIES,
+    backoff_factor=DEFAULT_BACKOFF_FACTOR,
+):
+    """Create an HTTP session configured for the Travis API.
+
+    Connection errors and 5xx responses are retried with exponential
+    backoff (backoff_factor * 2 ** (retry - 1) seconds), and a Retry-After
+    header sent with a 503 response takes precedence over the computed delay.
+    Rate limited (429) responses are handled by travis.scheduler.
+
+    Parameters
+    ----------
+    pool_size: int
+        the number of connections kept alive per host
+    connect_timeout: float
+        seconds to wait for a connection to be established
+    read_timeout: float
+        seconds to wait between bytes received from the API
+    retries: int
+        the number of times a failed request is retried
+    backoff_factor: float
+        the base delay in seconds between retries
+
+    Returns
+    -------
+    session: travis.transport.TravisSession
+        the configured session
+    """
+    from requests.adapters import HTTPAdapter
+
+    from travis.transport import TravisRetry, TravisSession
+
+    retry_settings = dict(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    try:
+        retry = TravisRetry(
+            allowed_methods=frozenset(["GET", "HEAD"]), **retry_settings
+        )
+    except TypeError:
+        # urllib3 releases before 1.26 call allowed_methods method_whitelist
+        retry = TravisRetry(
+            method_whitelist=frozenset(["GET", "HEAD"]), **retry_settings
+        )
+
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+
+    session = TravisSession(timeout=(connect_timeout, read_timeout))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session():
+    """Return the shared session, creating it from the configured settings if needed."""
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            _session = create_session(**_settings)
+        return _session
+
+
+def configure_session(**settings):
+    """Change the settings of the shared session.
+
+    The keyword arguments are those accepted by create_session. The current
+    session is closed and a new one is created on the next get_session call.
+    """
+    global _session
+
+    with _session_lock:
+        _settings.clear()
+        _settings.update(settings)
+        previous, _session = _session, None
+
+    if previous is not None:
+        previous.close()
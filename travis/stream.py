@@ -0,0 +1,204 @@
+"""Encrypt passwords and environment variables for use with Travis CI.
+
+The stream module encrypts a stream of newline delimited JSON records of
+the form {"repo": "username/repository", "name": ..., "value": ...}. Records
+are read lazily and a bounded number of them is in flight at any time, so
+memory use does not grow with the length of the stream. Each result is
+yielded as soon as it is ready, with the 1-based number of its input line:
+
+    {"line": 1, "repo": "username/repository", "name": ..., "secure": ...}
+
+or, when the record could not be encrypted:
+
+    {"line": 1, "repo": "username/repository", "name": ..., "error": ...}
+
+where repo and name are echoed as far as the record could be parsed.
+Plaintext values are never included in the results.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import json
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from travis.config import string_types
+from travis.encrypt import encrypt_key, InvalidCredentialsError, RateLimitedError
+from travis.scheduler import monotonic
+
+
+class KeyLookup(object):
+    """Memoize the public keys of repositories in a bounded LRU mapping.
+
+    Concurrent lookups of the same repository wait for a single retrieval.
+    Failed retrievals are not memoized so that they are retried later.
+
+    Parameters
+    ----------
+    retrieve: callable
+        called with 'username/repository' and returning its public key
+    maxsize: int
+        the number of keys kept in memory
+    ttl: float
+        the number of seconds a key is kept in memory, None keeps it until
+        it is evicted; long-running processes use it to notice key rotations
+    clock: callable
+        returns the current time in seconds, replaced in tests
+    """
+
+    def __init__(self, retrieve, maxsize=1024, ttl=None, clock=monotonic):
+        self.retrieve = retrieve
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.keys = OrderedDict()
+        self.lock = threading.Lock()
+        self.repository_locks = {}
+
+    def _memoized(self, user_repo):
+        """Return the memoized key of the repository or None, under self.lock."""
+        if user_repo not in self.keys:
+            return None
+        key, retrieved_at = self.keys.pop(user_repo)
+        if self.ttl is not None and self.clock() - retrieved_at >= self.ttl:
+            return None
+        self.keys[user_repo] = (key, retrieved_at)
+        return key
+
+    def __call__(self, user_repo):
+        with self.lock:
+            key = self._memoized(user_repo)
+            if key is not None:
+                return key
+            repository_lock = self.repository_locks.setdefault(
+                user_repo, threading.Lock()
+            )
+
+        with repository_lock:
+            with self.lock:
+                key = self._memoized(user_repo)
+                if key is not None:
+                    return key
+
+            key = self.retrieve(user_repo)
+            self.add(user_repo, key)
+            return key
+
+    def add(self, user_repo, key):
+        """Memoize a key of the repository retrieved by other means."""
+        with self.lock:
+            self.keys.pop(user_repo, None)
+            self.keys[user_repo] = (key, self.clock())
+            while len(self.keys) > self.maxsize:
+                self.keys.popitem(last=False)
+            self.repository_locks.pop(user_repo, None)
+
+
+def encrypt_record(line, get_key, number=None):
+    """Encrypt a single NDJSON record and return the result record.
+
+    The result starts with the line number when one is given, followed by
+    the repo and name of the record, even an invalid one, when present.
+    """
+    result = OrderedDict()
+    if number is not None:
+        result["line"] = number
+
+    try:
+        record = json.loads(line)
+        if isinstance(record, dict):
+            for field in ("repo", "name"):
+                if field in record:
+                    result[field] = record[field]
+        user_repo, _, value = record["repo"], record["name"], record["value"]
+    except (ValueError, TypeError, KeyError) as error:
+        result["error"] = "Invalid record: {}".format(error)
+        return result
+
+    from requests.exceptions import RequestException
+
+    try:
+        if not isinstance(value, string_types) or user_repo.count("/") != 1:
+            raise ValueError("repo must be 'username/repository' and value a string")
+        encrypted = encrypt_key(get_key(user_repo), value.encode())
+    except (
+        InvalidCredentialsError,
+        RateLimitedError,
+        RequestException,
+        AttributeError,
+        TypeError,
+        ValueError,
+    ) as error:
+        result["error"] = str(error)
+    else:
+        result["secure"] = encrypted
+    return result
+
+
+def encrypt_stream(lines, get_key, concurrency=1):
+    """Encrypt NDJSON records and yield the result records as they complete.
+
+    Parameters
+    ----------
+    lines: iterable
+        NDJSON lines; blank lines are skipped
+    get_key: callable
+        called with 'username/repository' and returning its public key,
+        typically a KeyLookup
+    concurrency: int
+        the number of records processed at the same time; with more than one,
+        results are yielded in completion order rather than input order
+
+    Yields
+    ------
+    result: collections.OrderedDict
+        the result record of every input record, see encrypt_record; line
+        numbers count blank lines too
+    """
+    records = ((number, line) for number, line in enumerate(lines, 1) if line.strip())
+
+    if concurrency <= 1:
+        for number, line in records:
+            yield encrypt_record(line, get_key, number)
+        return
+
+    # the lines are read on a separate thread, so that a result is written as
+    # soon as it is ready even while the next line has not arrived yet, as
+    # with a caller waiting for each answer before sending another request
+    slots = threading.Semaphore(concurrency * 2)
+    finished = queue.Queue()
+    stopped = threading.Event()
+    read_errors = []
+    done = object()
+
+    def read():
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        try:
+            for number, line in records:
+                slots.acquire()
+                if stopped.is_set():
+                    break
+                future = executor.submit(encrypt_record, line, get_key, number)
+                future.add_done_callback(finished.put)
+        except Exception as error:
+            read_errors.append(error)
+        finally:
+            executor.shutdown(wait=True)
+            finished.put(done)
+
+    reader = threading.Thread(target=read)
+    reader.daemon = True
+    reader.start()
+    try:
+        for future in iter(finished.get, done):
+            slots.release()
+            yield future.result()
+    finally:
+        stopped.set()
+        slots.release()
+
+    if read_errors:
+        raise read_errors[0]
@@ -0,0 +1,183 @@
+"""Encrypt passwords and environment variables for use with Travis CI.
+
+The timing module records how long each phase of a run takes, such as
+retrieving a key, parsing it, encrypting or loading and dumping YAML.
+Recording is off by default, in which case a span costs a single attribute
+lookup; the --timings flag of the CLI turns it on and prints a summary.
+
+Listeners added with add_span_listener receive the duration of every span,
+which is how travis.metrics builds its latency histograms.
+
+Spans recorded in worker processes, such as those of encrypt_many with
+more than one job, stay in those processes; the caller's span around the
+whole batch is recorded instead.
+
+Available functions:
+span -- time a block of code as one occurrence of a phase
+enable_timings -- turn recording on or off
+add_span_listener -- call a function with the duration of every span
+remove_span_listener -- stop calling a function added by add_span_listener
+reset_timings -- forget every recorded duration
+timing_summary -- count, total and percentiles of every phase
+format_timings -- render timing_summary as a table
+"""
+from collections import namedtuple, OrderedDict
+import random
+import threading
+
+from travis.scheduler import monotonic
+
+SAMPLE_SIZE = 10000
+
+PhaseTiming = namedtuple("PhaseTiming", ["phase", "count", "total", "p50", "p95"])
+
+
+class _Phase(object):
+    """The count, total and a bounded reservoir sample of a phase's durations."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.sample = []
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if len(self.sample) < SAMPLE_SIZE:
+            self.sample.append(seconds)
+        else:
+            index = random.randrange(self.count)
+            if index < SAMPLE_SIZE:
+                self.sample[index] = seconds
+
+
+class _Registry(object):
+    def __init__(self):
+        self.enabled = False
+        self.listeners = ()
+        self.phases = OrderedDict()
+        self.lock = threading.Lock()
+
+    def record(self, phase, seconds):
+        with self.lock:
+            try:
+                entry = self.phases[phase]
+            except KeyError:
+                entry = self.phases[phase] = _Phase()
+            entry.add(seconds)
+
+
+_registry = _Registry()
+
+
+class _Span(object):
+    """Record the time spent in a with block under the phase name."""
+
+    __slots__ = ("phase", "start")
+
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = monotonic() - self.start
+        if _registry.enabled:
+            _registry.record(self.phase, seconds)
+        for listener in _registry.listeners:
+            listener(self.phase, seconds)
+
+
+class _NoSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_no_span = _NoSpan()
+
+
+def span(phase):
+    """Return a context manager timing its block as one occurrence of phase.
+
+    Example:
+    with span("yaml.load"):
+        config = ordered_load(text)
+    """
+    if not _registry.enabled and not _registry.listeners:
+        return _no_span
+    return _Span(phase)
+
+
+def enable_timings(enabled=True):
+    """Turn the recording of spans on or off."""
+    _registry.enabled = enabled
+
+
+def add_span_listener(listener):
+    """Call listener(phase, seconds) when any span ends, even with timing off."""
+    with _registry.lock:
+        _registry.listeners += (listener,)
+
+
+def remove_span_listener(listener):
+    """Stop calling a listener added with add_span_listener."""
+    with _registry.lock:
+        _registry.listeners = tuple(
+            other for other in _registry.listeners if other is not listener
+        )
+
+
+def reset_timings():
+    """Forget every recorded duration."""
+    with _registry.lock:
+        _registry.phases.clear()
+
+
+def _percentile(ordered, percent):
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+def timing_summary():
+    """Return a PhaseTiming(phase, count, total, p50, p95) for every phase.
+
+    Phases are listed in the order they were first recorded. Durations are
+    in seconds; percentiles are computed from a sample of at most
+    SAMPLE_SIZE durations per phase.
+    """
+    with _registry.lock:
+        phases = [
+            (phase, entry.count, entry.total, sorted(entry.sample))
+            for phase, entry in _registry.phases.items()
+        ]
+    return [
+        PhaseTiming(
+            phase, count, total, _percentile(sample, 50), _percentile(sample, 95)
+        )
+        for phase, count, total, sample in phases
+    ]
+
+
+def format_timings(summary=None):
+    """Render the timing summary as a table with durations in milliseconds."""
+    summary = timing_summary() if summary is None else summary
+    width = max([len("phase")] + [len(timing.phase) for timing in summary])
+    lines = [
+        "{}  {:>8}  {:>10}  {:>9}  {:>9}".format(
+            "phase".ljust(width), "count", "total ms", "p50 ms", "p95 ms"
+        )
+    ]
+    for phase, count, total, p50, p95 in summary:
+        lines.append(
+            "{}  {:>8}  {:>10.2f}  {:>9.3f}  {:>9.3f}".format(
+                phase.ljust(width), count, total * 1000, p50 * 1000, p95 * 1000
+            )
+        )
+    return "\n".join(lines)
@@ -0,0 +1,31 @@
+"""Encrypt passwords and environment variables for use with Travis CI.
+
+The transport module contains the requests and urllib3 classes behind the
+session created by travis.session. It is only imported once a session is
+created, since importing requests dominates the startup time of the CLI.
+"""
+import requests
+from urllib3.util.retry import Retry
+
+
+class TravisRetry(Retry):
+    """Retry policy that leaves rate limited responses to the request scheduler.
+
+    urllib3 honors Retry-After on 429 responses by sleeping in the thread that
+    made the request. The scheduler in travis.scheduler pauses every request
+    instead, so 429 is removed from the statuses retried here.
+    """
+
+    RETRY_AFTER_STATUS_CODES = frozenset([503])
+
+
+class TravisSession(requests.Session):
+    """A requests session that applies a default timeout to every request."""
+
+    def __init__(self, timeout):
+        super(TravisSession, self).__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super(TravisSession, self).request(method, url, **kwargs)